@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import importlib
+from mio.util.Helper import str2int, get_bool
+from plugins.QuickCache.WarmUp import WarmUp as CacheWarmUp
+
+
+class WarmUp(object):
+    """
+    按QuickCache预热登记表重算缓存
+    FLASK_APP=mio.shell flask cli exe -cls=cli.CacheWarmUp.WarmUp.run -arg="concurrency=4||rate=50"
+    FLASK_APP=mio.shell flask cli exe -cls=cli.CacheWarmUp.WarmUp.run -arg="dry_run=1||sample=20||only=Article:"
+    modules参数可以额外指定登记所在的模块，多个用逗号分隔，默认使用QUICK_CACHE_WARMUP_MODULES
+    """
+    def run(self, app, kwargs):
+        modules: str = kwargs.get("modules", "")
+        for module in list(app.config.get("QUICK_CACHE_WARMUP_MODULES", [])) + modules.split(","):
+            if len(module.strip()) > 0:
+                importlib.import_module(module.strip())
+        rate: str = kwargs.get("rate", "0")
+        CacheWarmUp(
+            app, concurrency=str2int(kwargs.get("concurrency", "4"), 4),
+            rate=float(rate) if rate.replace(".", "", 1).isdigit() else 0,
+            dry_run=get_bool(kwargs.get("dry_run", "0")), sample=str2int(kwargs.get("sample", "10"), 10),
+            progress_interval=float(str2int(kwargs.get("interval", "5"), 5))
+        ).run(only=kwargs.get("only") or None)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import time
+import inspect
+from typing import List, Dict, Any
+from mio.util.Logs import LogHandler, get_logger
+from mio.util.Helper import str2int, random_str
+from plugins.QuickCache.Codec import encode, decode
+
+
+class Bench(object):
+    """
+    QuickCache相关的基准测试
+    FLASK_APP=mio.shell flask cli exe -cls=cli.QuickCacheBench.Bench.codec -arg="rounds=1000"
+    FLASK_APP=mio.shell flask cli exe -cls=cli.QuickCacheBench.Bench.logger -arg="rounds=1000"
+    FLASK_APP=mio.shell flask cli exe -cls=cli.QuickCacheBench.Bench.backend -arg="rounds=10000||size=512"
+    FLASK_APP=mio.shell flask cli exe -cls=cli.QuickCacheBench.Bench.pool -arg="rounds=1000||threads=32"
+    """
+    def __get_logger__(self, name: str) -> LogHandler:
+        name = f"{self.__class__.__name__}.{name}"
+        return LogHandler(name)
+
+    @staticmethod
+    def __samples__() -> Dict[str, Any]:
+        rows: List[dict] = [{
+            "id": i, "name": random_str(12), "score": i * 1.5, "tags": ["a", "b", "c"], "enable": i % 2 == 0
+        } for i in range(500)]
+        page: str = "<html><body>" + "".join([f"<div class=\"row\">{row['name']}</div>" for row in rows]) + \
+                    "</body></html>"
+        return {"small_dict": rows[0], "large_dict": {"rows": rows}, "page": page}
+
+    def codec(self, app, kwargs):
+        id(app)
+        console_log: LogHandler = self.__get_logger__(inspect.stack()[0].function)
+        rounds: int = str2int(kwargs.get("rounds", "1000"), 1000)
+        specs: List[str] = [
+            "pickle", "orjson", "msgpack", "pickle+zstd", "pickle+lz4", "orjson+zstd", "msgpack+lz4"
+        ]
+        for name, sample in self.__samples__().items():
+            for spec in specs:
+                try:
+                    data: bytes = encode(sample, spec, threshold=0)
+                except ImportError as e:
+                    console_log.warning(f"{name} {spec}: skipped, {e}")
+                    continue
+                start: float = time.perf_counter()
+                for _ in range(rounds):
+                    encode(sample, spec, threshold=0)
+                encode_us: float = (time.perf_counter() - start) / rounds * 1000000
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    decode(data)
+                decode_us: float = (time.perf_counter() - start) / rounds * 1000000
+                console_log.info(
+                    f"{name:<10} {spec:<12} bytes: {len(data):>8} encode: {encode_us:>9.2f}us "
+                    f"decode: {decode_us:>9.2f}us")
+
+    def logger(self, app, kwargs):
+        """
+        对比旧的 inspect.stack() + LogHandler() 与缓存后的get_logger，每次调用的开销
+        """
+        id(app)
+        from mio.util.KeyBot.aes_cbc import AesCBC
+        rounds: int = str2int(kwargs.get("rounds", "1000"), 1000)
+
+        def old_logger():
+            return LogHandler(f"Bench.{inspect.stack()[0].function}")
+
+        def new_logger():
+            return get_logger("Bench.new_logger")
+
+        aes = AesCBC()
+        msg: bytes = random_str(64).encode("UTF-8")
+        results: Dict[str, float] = {}
+        for name, func in [
+            ("inspect.stack()+LogHandler", old_logger),
+            ("get_logger", new_logger),
+            ("AesCBC.encrypt", lambda: aes.encrypt(msg)),
+        ]:
+            start: float = time.perf_counter()
+            for _ in range(rounds):
+                func()
+            results[name] = (time.perf_counter() - start) / rounds * 1000000
+        # 旧的logger在setup里会重置daiquiri，测完再取输出用的logger
+        console_log: LogHandler = self.__get_logger__(inspect.stack()[0].function)
+        for name, cost in results.items():
+            console_log.info(f"{name:<28} {cost:>10.2f}us/call")
+
+    def backend(self, app, kwargs):
+        """
+        对比共享内存后端与redis(REDIS_URL，生产环境为unix socket)的读写延迟和吞吐
+        """
+        import os
+        import tempfile
+        from mio.sys import redis_db
+        from plugins.QuickCache.Backend import ShmBackend
+        console_log: LogHandler = self.__get_logger__(inspect.stack()[0].function)
+        rounds: int = str2int(kwargs.get("rounds", "10000"), 10000)
+        size: int = str2int(kwargs.get("size", "512"), 512)
+        prefix: str = f"{app.config['REDIS_KEY_PREFIX']}:Bench"
+        value: bytes = random_str(size).encode("UTF-8")
+        keys: List[str] = [f"{prefix}:{i}" for i in range(1000)]
+        shm_path: str = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+                                     f"{prefix.replace(':', '.')}.{os.getpid()}")
+        shm = ShmBackend(shm_path, buckets=1024, ways=4, slot_size=max(1024, size * 2))
+        targets = [
+            ("shm", lambda k: shm.set(k, value, 60), shm.get),
+            ("redis", lambda k: redis_db.setex(k, 60, value), redis_db.get),
+        ]
+        try:
+            for name, setter, getter in targets:
+                for op, func in [("set", setter), ("get", getter)]:
+                    start: float = time.perf_counter()
+                    for i in range(rounds):
+                        func(keys[i % len(keys)])
+                    elapsed: float = time.perf_counter() - start
+                    console_log.info(
+                        f"{name:<6} {op:<4} {elapsed / rounds * 1000000:>9.2f}us/op {rounds / elapsed:>12.0f}ops/s")
+        finally:
+            redis_db.delete(*keys)
+            os.remove(shm_path)
+
+    def pool(self, app, kwargs):
+        """
+        多线程压测redis_db，输出连接池的使用情况(已建立、占用、等待时间)，用于调整REDIS_MAX_CONNECTIONS
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from mio.sys import redis_db
+        from mio.sys.RedisPool import get_pool_stats
+        console_log: LogHandler = self.__get_logger__(inspect.stack()[0].function)
+        rounds: int = str2int(kwargs.get("rounds", "1000"), 1000)
+        threads: int = str2int(kwargs.get("threads", "32"), 32)
+        key: str = f"{app.config['REDIS_KEY_PREFIX']}:Bench:pool"
+
+        def worker(_):
+            for _ in range(rounds):
+                redis_db.get(key)
+
+        start: float = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(worker, range(threads)))
+        elapsed: float = time.perf_counter() - start
+        console_log.info(f"{threads} threads: {threads * rounds / elapsed:>12.0f}ops/s")
+        for name, stats in get_pool_stats().items():
+            console_log.info(f"{name}: {stats}")
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import inspect
+from typing import List, Optional
+from mio.util.Logs import LogHandler
+
+
+class Shard(object):
+    """
+    QuickCache分片的key分布和再平衡报告
+    FLASK_APP=mio.shell flask cli exe -cls=cli.QuickCacheShard.Shard.report
+    FLASK_APP=mio.shell flask cli exe -cls=cli.QuickCacheShard.Shard.report -arg="new_urls=redis://a:6379/0,redis://b:6379/0"
+    """
+    def __get_logger__(self, name: str) -> LogHandler:
+        name = f"{self.__class__.__name__}.{name}"
+        return LogHandler(name)
+
+    def report(self, app, kwargs):
+        from plugins.QuickCache import QuickCache
+        console_log: LogHandler = self.__get_logger__(inspect.stack()[0].function)
+        new_urls: Optional[List[str]] = [
+            url.strip() for url in kwargs.get("new_urls", "").split(",") if len(url.strip()) > 0
+        ] or None
+        cache = QuickCache(app, use_near_cache=False)
+        result: dict = cache.shard_report(kwargs.get("match") or None, new_urls)
+        console_log.info(f"total keys: {result['total']}")
+        for shard in result["shards"]:
+            console_log.info(
+                f"{shard['url']}: {shard['keys']} keys ({shard['ratio'] * 100:.2f}%), "
+                f"misplaced: {shard['misplaced']}, moving: {shard['moving']}")
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+import inspect
+from typing import List
+from mio.util.Logs import LogHandler
+from mio.util.Helper import str2int
+from mio.util.ImportTime import import_time_report
+
+
+class Startup(object):
+    """
+    冷启动导入耗时报告(python -X importtime)，web、cli、celery进程分别导入的模块不同
+    FLASK_APP=mio.shell flask cli exe -cls=cli.StartupReport.Startup.report
+    FLASK_APP=mio.shell flask cli exe -cls=cli.StartupReport.Startup.report -arg="modules=mio.sys,mio.cli||top=30"
+    """
+    def __get_logger__(self, name: str) -> LogHandler:
+        name = f"{self.__class__.__name__}.{name}"
+        return LogHandler(name)
+
+    def report(self, app, kwargs):
+        console_log: LogHandler = self.__get_logger__(inspect.stack()[0].function)
+        modules: List[str] = [
+            module.strip() for module in kwargs.get("modules", "mio.sys,mio.cli,mio.shell").split(",")
+            if len(module.strip()) > 0
+        ]
+        top: int = str2int(kwargs.get("top", "20"), default=20)
+        root_path: str = os.path.abspath(os.path.dirname(__file__) + "/../")
+        for module in modules:
+            result: dict = import_time_report(module, top=top, cwd=root_path)
+            if result["returncode"] != 0:
+                console_log.error(f"{module}: import failed with exit code {result['returncode']}")
+            console_log.info(f"{module}: {result['modules']} modules, {result['total_ms']:.1f}ms")
+            for package, self_ms in result["packages"].items():
+                console_log.info(f"  package {package}: {self_ms:.1f}ms")
+            for row in result["top_cumulative"]:
+                console_log.info(
+                    f"  {row['name']}: cumulative {row['cumulative_ms']:.1f}ms, self {row['self_ms']:.1f}ms")
@@ -37,6 +37,81 @@ class Config:
     REDIS_ENABLE = os.environ.get("MIO_REDIS_ENABLE", False)
     # Redis前导
     REDIS_KEY_PREFIX = "PYMIO"
+    # Redis连接池(每个worker进程一个)，最大连接数为0时按 线程数+4 计算，线程数为0时取 min(32, cpu + 4)
+    # 所有worker合计的连接数约为 MIO_LIMIT_CPU * 最大连接数，注意不要超过redis的maxclients
+    REDIS_MAX_CONNECTIONS = int(os.environ.get("MIO_REDIS_MAX_CONNECTIONS", 0))
+    REDIS_POOL_THREADS = int(os.environ.get("MIO_REDIS_POOL_THREADS", 0))
+    # 连接用完时等待空闲连接的秒数，超时抛出ConnectionError
+    REDIS_POOL_TIMEOUT = float(os.environ.get("MIO_REDIS_POOL_TIMEOUT", 5))
+    REDIS_SOCKET_TIMEOUT = os.environ.get("MIO_REDIS_SOCKET_TIMEOUT", None)
+    REDIS_SOCKET_CONNECT_TIMEOUT = os.environ.get("MIO_REDIS_SOCKET_CONNECT_TIMEOUT", None)
+    REDIS_SOCKET_KEEPALIVE = os.environ.get("MIO_REDIS_SOCKET_KEEPALIVE", True)
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get("MIO_REDIS_HEALTH_CHECK_INTERVAL", 30))
+    REDIS_RETRY_ON_TIMEOUT = os.environ.get("MIO_REDIS_RETRY_ON_TIMEOUT", True)
+    REDIS_RETRIES = int(os.environ.get("MIO_REDIS_RETRIES", 3))
+    # Redis熔断：窗口(秒)内调用数达到MIN_CALLS后，错误率或慢调用(超过SLOW_MS毫秒)比例超过阈值即打开
+    # 打开后OPEN_SECONDS秒内QuickCache直接按未命中返回，之后放行HALF_OPEN_CALLS个探测调用
+    REDIS_BREAKER_ENABLE = os.environ.get("MIO_REDIS_BREAKER_ENABLE", False)
+    REDIS_BREAKER_WINDOW = float(os.environ.get("MIO_REDIS_BREAKER_WINDOW", 10))
+    REDIS_BREAKER_MIN_CALLS = int(os.environ.get("MIO_REDIS_BREAKER_MIN_CALLS", 20))
+    REDIS_BREAKER_ERROR_RATE = float(os.environ.get("MIO_REDIS_BREAKER_ERROR_RATE", 0.5))
+    REDIS_BREAKER_SLOW_MS = float(os.environ.get("MIO_REDIS_BREAKER_SLOW_MS", 200))
+    REDIS_BREAKER_SLOW_RATE = float(os.environ.get("MIO_REDIS_BREAKER_SLOW_RATE", 0.8))
+    REDIS_BREAKER_OPEN_SECONDS = float(os.environ.get("MIO_REDIS_BREAKER_OPEN_SECONDS", 5))
+    REDIS_BREAKER_HALF_OPEN_CALLS = int(os.environ.get("MIO_REDIS_BREAKER_HALF_OPEN_CALLS", 3))
+    # QuickCache进程内L1缓存，失效通知模式：pubsub或tracking(需要redis 6+)
+    QUICK_CACHE_NEAR_ENABLE = os.environ.get("MIO_QUICK_CACHE_NEAR_ENABLE", False)
+    QUICK_CACHE_NEAR_MODE = os.environ.get("MIO_QUICK_CACHE_NEAR_MODE", "pubsub")
+    QUICK_CACHE_NEAR_MAX_SIZE = int(os.environ.get("MIO_QUICK_CACHE_NEAR_MAX_SIZE", 1024))
+    QUICK_CACHE_NEAR_TTL = int(os.environ.get("MIO_QUICK_CACHE_NEAR_TTL", 60))
+    # Redis熔断打开时，cache读写改用进程内缓存(容量和有效期同L1)，开启了L1时直接使用L1
+    QUICK_CACHE_BREAKER_FALLBACK = os.environ.get("MIO_QUICK_CACHE_BREAKER_FALLBACK", False)
+    # 请求内合并写入：QuickCache的写入和删除先缓冲，请求结束(teardown_request)时一次pipeline写入
+    QUICK_CACHE_REQUEST_COALESCE = os.environ.get("MIO_QUICK_CACHE_REQUEST_COALESCE", False)
+    # rate_limit默认按客户端地址限流，只有部署在可信的反向代理后面时才开启，否则转发头可以被客户端伪造
+    QUICK_CACHE_RATE_LIMIT_TRUST_PROXY = os.environ.get("MIO_QUICK_CACHE_RATE_LIMIT_TRUST_PROXY", False)
+    # QuickCache编码，格式为 序列化[+压缩]：pickle、orjson、msgpack，zstd、lz4，超过阈值才压缩
+    QUICK_CACHE_CODEC = os.environ.get("MIO_QUICK_CACHE_CODEC", "pickle")
+    QUICK_CACHE_COMPRESS_THRESHOLD = int(os.environ.get("MIO_QUICK_CACHE_COMPRESS_THRESHOLD", 1024))
+    # 按key前缀(去掉REDIS_KEY_PREFIX)指定编码，如 {"Page:": "pickle+zstd"}
+    QUICK_CACHE_CODEC_RULES = {}
+    # AsyncQuickCache每个事件循环的最大连接数
+    QUICK_CACHE_ASYNC_MAX_CONNECTIONS = int(os.environ.get("MIO_QUICK_CACHE_ASYNC_MAX_CONNECTIONS", 64))
+    # QuickCache缓存数据按一致性哈希分布到多个redis(逗号分隔或列表)，少于两个时使用REDIS_URL
+    # key中{}内的部分参与哈希(同Redis Cluster的hash tag)，发布订阅和StreamQueue仍然使用REDIS_URL
+    QUICK_CACHE_REDIS_URLS = os.environ.get("MIO_QUICK_CACHE_REDIS_URLS", "")
+    # QuickCache键值存储后端：redis或shm(本机多worker共享内存，容量=桶数*每桶槽数*槽大小，超过槽大小的值写入redis)
+    QUICK_CACHE_BACKEND = os.environ.get("MIO_QUICK_CACHE_BACKEND", "redis")
+    QUICK_CACHE_SHM_PATH = os.environ.get("MIO_QUICK_CACHE_SHM_PATH", None)
+    QUICK_CACHE_SHM_BUCKETS = int(os.environ.get("MIO_QUICK_CACHE_SHM_BUCKETS", 4096))
+    QUICK_CACHE_SHM_WAYS = int(os.environ.get("MIO_QUICK_CACHE_SHM_WAYS", 8))
+    QUICK_CACHE_SHM_SLOT_SIZE = int(os.environ.get("MIO_QUICK_CACHE_SHM_SLOT_SIZE", 4096))
+    # QuickCache预热：登记(@warmable)所在的模块，启动时是否在后台预热，预热的并发数和每秒个数(0为不限速)
+    QUICK_CACHE_WARMUP_MODULES = []
+    QUICK_CACHE_WARMUP_ON_START = os.environ.get("MIO_QUICK_CACHE_WARMUP_ON_START", False)
+    QUICK_CACHE_WARMUP_CONCURRENCY = int(os.environ.get("MIO_QUICK_CACHE_WARMUP_CONCURRENCY", 4))
+    QUICK_CACHE_WARMUP_RATE = float(os.environ.get("MIO_QUICK_CACHE_WARMUP_RATE", 0))
+    # 预加载/supervisor模式下worker的回收：请求数、常驻内存(MB)上限(0为不限制)，上限的随机抖动比例，
+    # 排空的最长时间(秒)，没有心跳多久(秒)视为卡死(0为不检查)
+    WORKER_MAX_REQUESTS = int(os.environ.get("MIO_WORKER_MAX_REQUESTS", 0))
+    WORKER_MAX_RSS_MB = float(os.environ.get("MIO_WORKER_MAX_RSS_MB", 0))
+    WORKER_RECYCLE_JITTER = float(os.environ.get("MIO_WORKER_RECYCLE_JITTER", 0.1))
+    WORKER_GRACEFUL_TIMEOUT = float(os.environ.get("MIO_WORKER_GRACEFUL_TIMEOUT", 30))
+    WORKER_WATCHDOG_TIMEOUT = float(os.environ.get("MIO_WORKER_WATCHDOG_TIMEOUT", 60))
+    # ASGI到WSGI的桥：每个worker执行Flask的线程数(0为min(32, cpu + 4))，最多排队的请求数(0为不限制)，
+    # 最长排队时间(秒，0为不限制)，超过时返回503和Retry-After(秒)
+    WSGI_THREADS = int(os.environ.get("MIO_WSGI_THREADS", 0))
+    WSGI_QUEUE_SIZE = int(os.environ.get("MIO_WSGI_QUEUE_SIZE", 0))
+    WSGI_QUEUE_TIMEOUT = float(os.environ.get("MIO_WSGI_QUEUE_TIMEOUT", 0))
+    WSGI_RETRY_AFTER = int(os.environ.get("MIO_WSGI_RETRY_AFTER", 1))
+    # 按路径前缀限制并发，如 {"/export": 4}
+    WSGI_ROUTE_LIMITS = {}
+    # 请求体最大字节数(0时使用环境变量MAX_BODY_SIZE，都没有则不限制)，超过时返回413；
+    # 预先读取的请求体超过WSGI_SPOOL_THRESHOLD字节后写入临时文件
+    WSGI_MAX_BODY_SIZE = int(os.environ.get("MIO_WSGI_MAX_BODY_SIZE", 0))
+    WSGI_SPOOL_THRESHOLD = int(os.environ.get("MIO_WSGI_SPOOL_THRESHOLD", 1024 * 1024))
+    # 这些路径前缀下的请求体不预先读取，由视图边收边处理(见mio.util.Upload)，如 ["/upload"]
+    WSGI_STREAM_PREFIXES = []
     # 是否使用CACHE
     CACHED_ENABLE = os.environ.get("MIO_CACHED_ENABLE", False)
     # 是否使用CORS
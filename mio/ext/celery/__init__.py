@@ -1,7 +1,6 @@
 # -*- coding: UTF-8 -*-
 import sys
 import click
-from celery.__main__ import main
 from flask.cli import AppGroup
 from typing import List
 
@@ -61,4 +60,5 @@ def run(clazz=None, worker=None, control=None):
                     _cmd_ = "--" + _cmd_
             cmd_lines.append(_cmd_)
     sys.argv = cmd_lines
+    from celery.__main__ import main
     sys.exit(main())
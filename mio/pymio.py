@@ -4,13 +4,14 @@ import os
 import sys
 import asyncio
 from flask import Flask
+from threading import Thread
 from typing import Optional, Union
 
 root_path: str = os.path.abspath(os.path.dirname(__file__) + "/../")
 sys.path.insert(0, root_path)
 from mio.sys import create_app, init_timezone, init_uvloop, get_cpu_limit, \
     get_logger_level, get_buffer_size, os_name
-from mio.util.Helper import write_txt_file, is_number, str2int
+from mio.util.Helper import write_txt_file, is_number, str2int, get_bool
 from mio.util.Logs import LogHandler
 from config import MIO_HOST, MIO_PORT
 
@@ -21,6 +22,10 @@ pid_file_path: Optional[str] = os.environ.get("MIO_PID_FILE") or None
 domain_socket: Optional[str] = os.environ.get("MIO_DOMAIN_SOCKET") or None
 MIO_UVLOOP: Union[str, bool] = str(os.environ.get("MIO_UVLOOP", "0"))
 MIO_UVLOOP = True if MIO_UVLOOP == "1" else False
+# 预加载模式：master中create_app一次，gc.freeze后fork出worker
+MIO_PRELOAD: bool = get_bool(os.environ.get("MIO_PRELOAD", False))
+# 内置的supervisor：预加载并负责worker回收、看门狗和SIGHUP平滑重载，单个worker时也生效
+MIO_SUPERVISOR: bool = get_bool(os.environ.get("MIO_SUPERVISOR", False))
 init_timezone()
 if MIO_UVLOOP:
     init_uvloop()
@@ -57,6 +62,12 @@ for arg in sys.argv:
             continue
         MIO_LIMIT_CPU = 1 if not is_number(temp[1]) else str2int(temp[1])
         continue
+    if temp[0].lower() == "preload":
+        MIO_PRELOAD = True if len(temp) < 2 else get_bool(temp[1])
+        continue
+    if temp[0].lower() == "supervisor":
+        MIO_SUPERVISOR = True if len(temp) < 2 else get_bool(temp[1])
+        continue
     if temp[0].lower() == "ds":
         domain_socket = temp[1]
         continue
@@ -70,16 +81,23 @@ app, console_log = create_app(
     MIO_CONFIG, root_path, MIO_APP_CONFIG, log_level=log_level, logger_type=log_type)
 
 if __name__ == "__main__":
+    warmup_thread: Optional[Thread] = None
+    if get_bool(app.config.get("QUICK_CACHE_WARMUP_ON_START", False)):
+        from plugins.QuickCache.WarmUp import start_warmup
+        warmup_thread = start_warmup(app)
     try:
         try:
             from hypercorn.asyncio import serve
             from hypercorn.config import Config
             from quart import Quart
-            from mio.sys.MountMiddleware import MountMiddleware
+            from mio.sys.MountMiddleware import MountMiddleware, mount_asgi_blueprints
 
             # 初始化Quart应用
             quart_app = Quart(__name__)
-            quart_app.asgi_app = MountMiddleware(quart_app.asgi_app, app)
+            asgi_prefixes = mount_asgi_blueprints(quart_app, app)
+            if len(asgi_prefixes) > 0:
+                console_log.info(f"Native ASGI prefixes: {', '.join(asgi_prefixes)}")
+            quart_app.asgi_app = MountMiddleware(quart_app.asgi_app, app, asgi_prefixes=asgi_prefixes)
             # 配置Hypercorn参数
             config = Config()
             config.bind = [f"unix:{domain_socket}"] if domain_socket else [f"{MIO_HOST}:{MIO_PORT}"]
@@ -92,7 +110,23 @@ if __name__ == "__main__":
             config.access_log_format = (
                 '%(h)s(%(X-Forwarded-For)s) %(r)s %(s)s %(b)s "%(f)s" "%(a)s"'  # 注意变量名规范
             )
-            asyncio.run(serve(quart_app, config))
+            if (MIO_SUPERVISOR or (MIO_PRELOAD and config.workers > 1)) and hasattr(os, "fork"):
+                from mio.sys.Prefork import PreforkMaster, create_listen_sockets, hypercorn_worker
+                if warmup_thread is not None:
+                    # 不能带着正在读写redis/mongodb的线程fork，冻结的也应当是预热之后的堆
+                    console_log.info("Waiting for cache warm-up to finish before forking workers...")
+                    warmup_thread.join()
+                config.graceful_timeout = float(app.config.get("WORKER_GRACEFUL_TIMEOUT", 30))
+                sockets, listen_fds = create_listen_sockets(config)
+                PreforkMaster(
+                    app, config.workers, hypercorn_worker(quart_app, config, sockets), listen_fds=listen_fds,
+                    max_requests=int(app.config.get("WORKER_MAX_REQUESTS", 0)),
+                    max_rss_mb=float(app.config.get("WORKER_MAX_RSS_MB", 0)),
+                    jitter=float(app.config.get("WORKER_RECYCLE_JITTER", 0.1)),
+                    graceful_timeout=config.graceful_timeout,
+                    watchdog_timeout=float(app.config.get("WORKER_WATCHDOG_TIMEOUT", 60))).run()
+            else:
+                asyncio.run(serve(quart_app, config))
         except Exception as e:
             console_log.warning(f"无法启动Quart服务（{str(e)}），正在回退到纯Flask模式")
             # 使用更安全的Flask内置服务器配置
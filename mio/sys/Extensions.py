@@ -0,0 +1,161 @@
+# -*- coding: UTF-8 -*-
+import sys
+import time
+import logging
+from flask import Flask
+from typing import Callable, Dict, Any, Optional, List
+from mio.util.Helper import in_dict, is_enable
+from mio.util.Logs import LogHandler
+
+
+class Extension(object):
+    """
+    create_app中按开关初始化的扩展，只有开启时才导入对应的包
+    """
+    name: str
+    enabled: Callable[[Flask, dict], bool]
+    init: Callable[..., Any]
+
+    def __init__(self, name: str, enabled: Callable[[Flask, dict], bool], init: Callable[..., Any]):
+        """
+        :param name: 扩展名称，init的返回值会赋给mio.sys中的同名变量(如果有)
+        :param enabled: (app, base_config) -> 是否启用，base_config为config.toml中的[config]
+        :param init: (app, console=, log_level=) -> 扩展实例
+        """
+        self.name = name
+        self.enabled = enabled
+        self.init = init
+
+
+__extensions__: Dict[str, Extension] = {}
+
+
+def register_extension(name: str, enabled: Callable[[Flask, dict], bool]) -> Callable:
+    """
+    登记扩展，按登记顺序初始化，同名的后登记覆盖先登记的
+
+        @register_extension("sentry", lambda app, base_config: is_enable(app.config, "SENTRY_ENABLE"))
+        def init_sentry(app, **kwargs): ...
+    """
+    def decorator(init: Callable[..., Any]) -> Callable[..., Any]:
+        __extensions__[name] = Extension(name, enabled, init)
+        return init
+    return decorator
+
+
+def get_extensions() -> List[Extension]:
+    return list(__extensions__.values())
+
+
+def init_extensions(
+        app: Flask, base_config: dict, console: LogHandler, log_level: int = logging.DEBUG
+) -> Dict[str, Any]:
+    """
+    :return: 已启用扩展的名称和实例
+    """
+    instances: Dict[str, Any] = {}
+    for ext in get_extensions():
+        if not ext.enabled(app, base_config):
+            continue
+        start: float = time.perf_counter()
+        instances[ext.name] = ext.init(app, console=console, log_level=log_level)
+        console.debug(f"Extension {ext.name} loaded in {(time.perf_counter() - start) * 1000:.1f}ms")
+    return instances
+
+
+@register_extension("babel", lambda app, base_config: True)
+def init_babel(app: Flask, **kwargs):
+    from flask_babel import Babel
+    return Babel(app)
+
+
+@register_extension(
+    "csrf", lambda app, base_config: in_dict(base_config, "csrf") and is_enable(base_config["csrf"], "enable"))
+def init_csrf(app: Flask, **kwargs):
+    from flask_wtf.csrf import CSRFProtect
+    csrf = CSRFProtect()
+    csrf.init_app(app)
+    return csrf
+
+
+@register_extension("mail", lambda app, base_config: is_enable(app.config, "MIO_MAIL"))
+def init_mail(app: Flask, **kwargs):
+    from flask_mail import Mail
+    mail = Mail()
+    mail.init_app(app)
+    return mail
+
+
+@register_extension("db", lambda app, base_config: is_enable(app.config, "MONGODB_ENABLE"))
+def init_mongodb(app: Flask, **kwargs):
+    from mio.sys.flask_mongoengine import MongoEngine
+    db = MongoEngine()
+    db.init_app(app)
+    # ! 至少输出警告级别
+    logging.getLogger('pymongo').setLevel(logging.WARN)
+    return db
+
+
+@register_extension("rdb", lambda app, base_config: is_enable(app.config, "RDBMS_ENABLE"))
+def init_rdbms(app: Flask, **kwargs):
+    from flask_sqlalchemy import SQLAlchemy
+    rdb = SQLAlchemy()
+    rdb.init_app(app)
+    return rdb
+
+
+@register_extension("celery_app", lambda app, base_config: is_enable(app.config, "CELERY_ENABLE"))
+def init_celery(app: Flask, log_level: int = logging.DEBUG, **kwargs):
+    from celery import Celery
+    celery_app_config: dict = {
+        "broker": app.config["CELERY_BROKER_URL"],
+        "backend": app.config["CELERY_BACKEND_URL"],
+    }
+    if "CELERY_RESULT_BACKEND" in app.config:
+        celery_app_config.update({"result_backend": app.config["CELERY_RESULT_BACKEND"]})
+    if "CELERY_RESULT_PERSISTENT" in app.config:
+        celery_app_config.update({"result_persistent": app.config["CELERY_RESULT_PERSISTENT"]})
+    if "CELERY_RESULT_EXCHANGE" in app.config:
+        celery_app_config.update({"result_exchange": app.config["CELERY_RESULT_EXCHANGE"]})
+    if "CELERY_RESULT_EXCHANGE_TYPE" in app.config:
+        celery_app_config.update({"result_exchange_type": app.config["CELERY_RESULT_EXCHANGE_TYPE"]})
+    if "CELERY_BROKER_USE_SSL" in app.config:
+        celery_app_config.update({"broker_use_ssl": app.config["CELERY_BROKER_USE_SSL"]})
+    celery_app = Celery(
+        app.import_name,
+        **celery_app_config
+    )
+    logging.getLogger('amqp').setLevel(log_level)
+    logging.getLogger('celery').setLevel(log_level)
+    return celery_app
+
+
+@register_extension("redis_db", lambda app, base_config: is_enable(app.config, "REDIS_ENABLE"))
+def init_redis(app: Flask, console: Optional[LogHandler] = None, **kwargs):
+    from flask_redis import FlaskRedis
+    from mio.sys.RedisPool import PooledRedis, get_pool_kwargs
+    from mio.sys import get_cpu_limit
+    pool_kwargs: dict = get_pool_kwargs(app.config)
+    redis_db = FlaskRedis.from_custom_provider(PooledRedis, **pool_kwargs)
+    redis_db.init_app(app)
+    if console is not None:
+        console.info(
+            f"Redis pool: {pool_kwargs['max_connections']} connections per worker, "
+            f"{pool_kwargs['max_connections'] * get_cpu_limit()} for {get_cpu_limit()} worker(s)")
+    return redis_db
+
+
+@register_extension("cors", lambda app, base_config: is_enable(app.config, "CORS_ENABLE"))
+def init_cors(app: Flask, console: Optional[LogHandler] = None, **kwargs):
+    from flask_cors import CORS
+    if not in_dict(app.config, "CORS_URI"):
+        if console is not None:
+            console.error(u"CORS_URI not define.")
+        sys.exit(0)
+    return CORS(app, resources=app.config["CORS_URI"])
+
+
+@register_extension("cache", lambda app, base_config: is_enable(app.config, "CACHED_ENABLE"))
+def init_cache(app: Flask, **kwargs):
+    from flask_caching import Cache
+    return Cache(app)
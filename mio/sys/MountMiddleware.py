@@ -1,17 +1,58 @@
 # -*- coding: UTF-8 -*-
 from flask import Flask
-from asgiref.wsgi import WsgiToAsgi
 from hypercorn.typing import ASGIFramework
+from typing import List, Optional, Tuple, Any
+from mio.util.Logs import LogHandler, get_logger
+from mio.sys.WsgiBridge import WsgiBridge, get_bridge_kwargs
+
+
+def mount_asgi_blueprints(quart_app: Any, flask_app: Flask) -> List[str]:
+    """
+    把config.toml中标记了asgi = true的Quart蓝图注册到Quart应用，Flask的配置同步给Quart
+
+    :return: 这些蓝图的url_prefix，长的在前
+    """
+    console_log: LogHandler = get_logger("MountMiddleware.mount_asgi_blueprints")
+    for key, value in flask_app.config.items():
+        quart_app.config.setdefault(key, value)
+    quart_app.config["SECRET_KEY"] = flask_app.config.get("SECRET_KEY")
+    prefixes: List[str] = []
+    entries: List[Tuple[Any, Optional[str]]] = flask_app.extensions.get("mio_asgi_blueprints", [])
+    for bp, url_prefix in entries:
+        url_prefix = (url_prefix or "").rstrip("/")
+        if len(url_prefix) <= 0:
+            # 没有前缀时无法和WSGI的路由区分
+            console_log.error(f"ASGI blueprint {bp.name} requires a url_prefix, skipped.")
+            continue
+        quart_app.register_blueprint(bp, url_prefix=url_prefix)
+        prefixes.append(url_prefix)
+    return sorted(prefixes, key=len, reverse=True)
 
 
 class MountMiddleware:
-    def __init__(self, quart_app: ASGIFramework, wsgi_app: Flask):
+    """
+    asgi_prefixes下的http请求直接交给Quart(运行在hypercorn的事件循环上)，其余的经WsgiBridge交给Flask
+    Quart处理请求时推入Flask的应用上下文，flask.current_app、QuickCache等照常可用
+    """
+    def __init__(self, quart_app: ASGIFramework, wsgi_app: Flask, asgi_prefixes: Optional[List[str]] = None):
         self._started = False
         self.quart_app = quart_app
-        self.wsgi_app = WsgiToAsgi(wsgi_app)
+        self.flask_app = wsgi_app
+        self.wsgi_app = WsgiBridge(wsgi_app, **get_bridge_kwargs(wsgi_app.config))
+        self.asgi_prefixes = asgi_prefixes or []
+
+    def is_asgi_path(self, path: str) -> bool:
+        for prefix in self.asgi_prefixes:
+            if path == prefix or path.startswith(f"{prefix}/"):
+                return True
+        return False
 
     async def __call__(self, scope, receive, send):
         if scope["type"] == "http":
+            if self.is_asgi_path(scope.get("path", "")):
+                with self.flask_app.app_context():
+                    await self.quart_app(scope, receive, send)
+                return
             await self.wsgi_app(scope, receive, send)
         elif scope["type"] == "lifespan":
             await self.quart_app(scope, receive, send)
@@ -0,0 +1,433 @@
+# -*- coding: UTF-8 -*-
+import gc
+import os
+import sys
+import mmap
+import time
+import random
+import signal
+import socket
+import struct
+from flask import Flask
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from mio.util.Logs import LogHandler, get_logger
+
+__post_fork_hooks__: List[Callable[[Flask], None]] = []
+# 重新exec时传给新master的监听socket和需要排空的旧worker
+LISTEN_FDS_ENV: str = "MIO_LISTEN_FDS"
+DRAIN_PIDS_ENV: str = "MIO_DRAIN_PIDS"
+HEARTBEAT_INTERVAL: float = 1.0
+
+
+def register_post_fork(hook: Callable[[Flask], None]) -> Callable[[Flask], None]:
+    """
+    登记worker fork之后执行的函数，用于重建不能跨进程共享的连接，可作为装饰器使用
+    redis连接池和熔断器已经通过os.register_at_fork重置，不需要在这里处理
+    """
+    __post_fork_hooks__.append(hook)
+    return hook
+
+
+def run_post_fork_hooks(app: Flask):
+    console_log: LogHandler = get_logger("Prefork.run_post_fork_hooks")
+    for hook in __post_fork_hooks__:
+        try:
+            hook(app)
+        except Exception as e:
+            console_log.error(f"{getattr(hook, '__name__', hook)}: {e}")
+
+
+@register_post_fork
+def reconnect_mongodb(app: Flask):
+    """
+    MongoClient带有后台线程和连接池，不能在fork之后继续使用，按原配置重新连接
+    继承的client只从mongoengine中移除，不调用close()，master和其他worker可能还在用同一个socket
+    """
+    instances: Dict[Any, dict] = app.extensions.get("mongoengine", {})
+    if len(instances) <= 0:
+        return
+    import mongoengine
+    from mongoengine import connection
+    from mio.sys.flask_mongoengine.connection import create_connections
+    for instance, state in instances.items():
+        for alias in list(state.get("conn", {}).keys()):
+            # 先取走client，disconnect只清理_dbs、连接配置和Document上缓存的collection
+            connection._connections.pop(alias, None)
+            mongoengine.disconnect(alias)
+        state["conn"] = create_connections(instance.config)
+
+
+@register_post_fork
+def reconnect_rdbms(app: Flask):
+    """
+    丢弃从master继承的连接(不关闭，master和其他worker可能还在用同一个socket)，由子进程重新建立
+    """
+    from mio.sys import rdb
+    if rdb is None:
+        return
+    with app.app_context():
+        for engine in rdb.engines.values():
+            engine.dispose(close=False)
+
+
+def freeze_heap():
+    """
+    fork之前把master已有的对象移出GC跟踪，worker里的GC不再遍历(写入)这些对象的头部，
+    对应的内存页保持和master共享(copy-on-write)
+    """
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+
+def get_rss_mb(pid: Optional[int] = None) -> float:
+    """
+    进程的常驻内存(MB)，只支持有/proc的系统，其他系统返回0
+    """
+    try:
+        with open(f"/proc/{pid or os.getpid()}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class WorkerSlots(object):
+    """
+    master和worker共享的匿名内存，每个worker一格：心跳时间(monotonic)、已处理的请求数
+    每格只有对应的worker写入，master只读
+    """
+    SLOT_FORMAT: str = "dQ"
+    SLOT_SIZE: int = struct.calcsize(SLOT_FORMAT)
+
+    def __init__(self, count: int):
+        self.count = count
+        self._mm = mmap.mmap(-1, count * self.SLOT_SIZE)
+
+    def reset(self, idx: int):
+        struct.pack_into(self.SLOT_FORMAT, self._mm, idx * self.SLOT_SIZE, 0.0, 0)
+
+    def read(self, idx: int) -> Tuple[float, int]:
+        return struct.unpack_from(self.SLOT_FORMAT, self._mm, idx * self.SLOT_SIZE)
+
+    def beat(self, idx: int):
+        struct.pack_into("d", self._mm, idx * self.SLOT_SIZE, time.monotonic())
+
+    def add_request(self, idx: int):
+        offset: int = idx * self.SLOT_SIZE + struct.calcsize("d")
+        struct.pack_into("Q", self._mm, offset, struct.unpack_from("Q", self._mm, offset)[0] + 1)
+
+
+# worker进程中自己的那一格
+__worker_slot__: Optional[Tuple[WorkerSlots, int]] = None
+
+
+def worker_beat():
+    if __worker_slot__ is not None:
+        __worker_slot__[0].beat(__worker_slot__[1])
+
+
+def worker_request():
+    if __worker_slot__ is not None:
+        __worker_slot__[0].add_request(__worker_slot__[1])
+
+
+class WorkerInfo(object):
+    pid: int
+    slot: int
+    started: float
+    max_requests: int
+    max_rss_mb: float
+    deadline: Optional[float]
+
+    def __init__(self, pid: int, slot: int, max_requests: int, max_rss_mb: float):
+        self.pid = pid
+        self.slot = slot
+        self.started = time.monotonic()
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        # 开始排空后的强制结束时间，为None表示正在服务
+        self.deadline = None
+
+
+class PreforkMaster(object):
+    """
+    预加载模式的master：create_app只在master中执行一次，之后fork出worker，所有worker共用master创建的监听socket
+    1. 回收：请求数超过max_requests或常驻内存超过max_rss_mb(各自加上随机抖动，避免同时回收)时，
+       先fork替代的worker，再让旧worker排空后退出；排空中的worker还占着槽位时，回收推迟到有空槽再进行
+    2. 看门狗：worker的事件循环超过watchdog_timeout没有心跳时直接SIGKILL并重新fork
+    3. SIGHUP：master带着监听socket原地重新exec(pid不变)，新代码启动的worker就绪后旧worker排空退出
+    4. SIGINT/SIGTERM：通知所有worker排空，超过graceful_timeout后强制结束
+    """
+    app: Flask
+    workers: int
+    target: Callable[[], None]
+    listen_fds: List[int]
+
+    def __init__(
+            self, app: Flask, workers: int, target: Callable[[], None], listen_fds: Optional[List[int]] = None,
+            max_requests: int = 0, max_rss_mb: float = 0, jitter: float = 0.1, graceful_timeout: float = 30,
+            watchdog_timeout: float = 0
+    ):
+        """
+        :param target: worker中执行的函数，返回即退出worker
+        :param listen_fds: 监听socket的文件描述符，重新exec时传给新的master
+        :param max_requests: 每个worker处理多少个请求后回收，0为不限制
+        :param max_rss_mb: worker常驻内存的上限(MB)，0为不限制
+        :param jitter: 上限的随机抖动比例，请求数向上、内存向下抖动
+        :param graceful_timeout: 排空的最长时间(秒)
+        :param watchdog_timeout: 没有心跳多久(秒)视为卡死，0为不检查
+        """
+        self.app = app
+        self.workers = workers if workers > 0 else 1
+        self.target = target
+        self.listen_fds = listen_fds or []
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.jitter = jitter
+        self.graceful_timeout = graceful_timeout
+        self.watchdog_timeout = watchdog_timeout
+        # 回收时新旧worker会短暂并存
+        self.slots = WorkerSlots(self.workers * 2)
+        self.children: Dict[int, WorkerInfo] = {}
+        self.draining: Dict[int, float] = {}
+        self.stopping: bool = False
+        self.reloading: bool = False
+        self._drain_on_ready: List[int] = []
+        self._ready_deadline: float = 0.0
+
+    def __get_logger__(self, name: str) -> LogHandler:
+        return get_logger(f"{self.__class__.__name__}.{name}")
+
+    def __free_slot__(self) -> Optional[int]:
+        used: set = set([info.slot for info in self.children.values()])
+        for idx in range(self.slots.count):
+            if idx not in used:
+                return idx
+        return None
+
+    def spawn(self) -> Optional[int]:
+        """
+        :return: worker的pid，没有空槽(排空中的worker还没退出)时返回None
+        """
+        global __worker_slot__
+        slot: Optional[int] = self.__free_slot__()
+        if slot is None:
+            return None
+        self.slots.reset(slot)
+        max_requests: int = self.max_requests + random.randint(0, int(self.max_requests * self.jitter)) \
+            if self.max_requests > 0 else 0
+        max_rss_mb: float = self.max_rss_mb * (1 - random.uniform(0, self.jitter)) if self.max_rss_mb > 0 else 0
+        pid: int = os.fork()
+        if pid == 0:
+            code: int = 0
+            try:
+                for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+                    signal.signal(sig, signal.SIG_DFL)
+                __worker_slot__ = (self.slots, slot)
+                run_post_fork_hooks(self.app)
+                self.target()
+            except KeyboardInterrupt:
+                pass
+            except Exception as e:
+                get_logger("PreforkMaster.worker").error(e, exc_info=True)
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = WorkerInfo(pid, slot, max_requests, max_rss_mb)
+        return pid
+
+    def retire(self, info: WorkerInfo, reason: str) -> bool:
+        """
+        先补充一个worker，再让旧的排空退出
+
+        :return: 没有空槽时不回收，返回False，下次检查时再试
+        """
+        console_log = self.__get_logger__("retire")
+        if self.spawn() is None:
+            console_log.debug(f"No free slot to replace worker {info.pid}, recycling postponed")
+            return False
+        console_log.info(f"Recycling worker {info.pid}: {reason}")
+        info.deadline = time.monotonic() + self.graceful_timeout
+        self.__kill__(info.pid, signal.SIGTERM)
+        return True
+
+    def __kill__(self, pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def __on_stop__(self, signum: int = signal.SIGTERM, frame: Any = None):
+        self.stopping = True
+
+    def __on_reload__(self, signum: int = signal.SIGHUP, frame: Any = None):
+        self.reloading = True
+
+    def __reap__(self):
+        console_log = self.__get_logger__("reap")
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.draining.pop(pid, None)
+            info: Optional[WorkerInfo] = self.children.pop(pid, None)
+            if info is None or info.deadline is not None or self.stopping:
+                continue
+            console_log.warning(f"Worker {pid} exited with status {status}, respawning")
+            if time.monotonic() - info.started < 1:
+                # 启动即退出时不要空转
+                time.sleep(1)
+            self.spawn()
+
+    def __check__(self):
+        now: float = time.monotonic()
+        # 没有空槽而没能fork的worker在这里补上
+        serving: int = len([info for info in self.children.values() if info.deadline is None])
+        for _ in range(self.workers - serving):
+            if self.spawn() is None:
+                break
+        for info in list(self.children.values()):
+            if info.deadline is not None:
+                if now >= info.deadline:
+                    self.__kill__(info.pid, signal.SIGKILL)
+                continue
+            heartbeat, requests = self.slots.read(info.slot)
+            if self.watchdog_timeout > 0 and now - max(heartbeat, info.started) > self.watchdog_timeout:
+                self.__get_logger__("watchdog").error(
+                    f"Worker {info.pid} has no heartbeat for {now - max(heartbeat, info.started):.0f}s, killed")
+                self.__kill__(info.pid, signal.SIGKILL)
+                continue
+            if 0 < info.max_requests <= requests:
+                self.retire(info, f"{requests} requests")
+                continue
+            if info.max_rss_mb > 0:
+                rss: float = get_rss_mb(info.pid)
+                if rss > info.max_rss_mb:
+                    self.retire(info, f"RSS {rss:.1f}MB > {info.max_rss_mb:.1f}MB")
+        for pid, deadline in list(self.draining.items()):
+            if now >= deadline:
+                self.__kill__(pid, signal.SIGKILL)
+        if len(self._drain_on_ready) > 0:
+            ready: bool = all([self.slots.read(info.slot)[0] > 0 for info in self.children.values()])
+            if ready or now >= self._ready_deadline:
+                for pid in self._drain_on_ready:
+                    self.__kill__(pid, signal.SIGTERM)
+                    self.draining[pid] = now + self.graceful_timeout
+                self._drain_on_ready = []
+
+    def __adopt_old_workers__(self):
+        """
+        重新exec之前的worker仍然是本进程的子进程，新worker就绪后让它们排空
+        """
+        pids: str = os.environ.pop(DRAIN_PIDS_ENV, "")
+        self._drain_on_ready = [int(pid) for pid in pids.split(",") if pid.isdigit()]
+        self._ready_deadline = time.monotonic() + self.graceful_timeout
+
+    def __reexec__(self):
+        console_log = self.__get_logger__("reload")
+        for fd in self.listen_fds:
+            os.set_inheritable(fd, True)
+        os.environ[LISTEN_FDS_ENV] = ",".join([str(fd) for fd in self.listen_fds])
+        os.environ[DRAIN_PIDS_ENV] = ",".join([str(pid) for pid in list(self.children) + list(self.draining)])
+        console_log.info(f"Reloading master {os.getpid()}, {len(self.children)} worker(s) will be drained")
+        argv: List[str] = list(getattr(sys, "orig_argv", [sys.executable] + sys.argv))
+        os.execv(sys.executable, [sys.executable] + argv[1:])
+
+    def run(self):
+        console_log = self.__get_logger__("run")
+        freeze_heap()
+        signal.signal(signal.SIGINT, self.__on_stop__)
+        signal.signal(signal.SIGTERM, self.__on_stop__)
+        signal.signal(signal.SIGHUP, self.__on_reload__)
+        self.__adopt_old_workers__()
+        for _ in range(self.workers):
+            self.spawn()
+        console_log.info(
+            f"Preloaded master {os.getpid()} forked {self.workers} worker(s), RSS: {get_rss_mb():.1f}MB")
+        while not self.stopping:
+            if self.reloading:
+                self.__reexec__()
+            self.__reap__()
+            self.__check__()
+            time.sleep(HEARTBEAT_INTERVAL)
+        deadline: float = time.monotonic() + self.graceful_timeout
+        for pid in list(self.children) + list(self.draining):
+            self.__kill__(pid, signal.SIGTERM)
+        while (len(self.children) > 0 or len(self.draining) > 0) and time.monotonic() < deadline:
+            self.__reap__()
+            time.sleep(0.1)
+        for pid in list(self.children) + list(self.draining):
+            self.__kill__(pid, signal.SIGKILL)
+        console_log.info("All workers exited.")
+
+
+def create_listen_sockets(config: Any) -> Tuple[Any, List[int]]:
+    """
+    master创建(或重新exec后接管)监听socket，tcp设置SO_REUSEPORT，部署时新旧实例可以同时绑定同一个端口
+
+    :return: hypercorn的Sockets，以及需要在重新exec时保留的文件描述符
+    """
+    from hypercorn.config import Sockets
+    fds: str = os.environ.pop(LISTEN_FDS_ENV, "")
+    if len(fds) > 0:
+        inherited: List[socket.socket] = [socket.socket(fileno=int(fd)) for fd in fds.split(",")]
+        return Sockets([], inherited, []), [sock.fileno() for sock in inherited]
+    if getattr(config, "ssl_enabled", False) or not hasattr(socket, "SO_REUSEPORT") or \
+            any([not bind.count(":") or bind.startswith(("unix:", "fd://")) for bind in config.bind]):
+        sockets = config.create_sockets()
+        insecure: List[socket.socket] = list(sockets.insecure_sockets)
+    else:
+        insecure = []
+        for bind in config.bind:
+            host, port = bind.rsplit(":", 1)
+            host = host.strip("[]")
+            sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((host, int(port)))
+            sock.setblocking(False)
+            insecure.append(sock)
+        sockets = Sockets([], insecure, [])
+    for sock in insecure:
+        # master也监听，reload期间没有worker时连接在队列里等待，不会被拒绝
+        sock.listen(config.backlog)
+    return sockets, [sock.fileno() for sock in insecure]
+
+
+def hypercorn_worker(asgi_app: Any, config: Any, sockets: Any) -> Callable[[], None]:
+    """
+    在worker中使用master已经创建好的监听socket运行hypercorn，与hypercorn自身的多进程模式相同
+    事件循环中定时写心跳，每个http请求计数，供master回收和看门狗使用
+    """
+    def target():
+        import asyncio
+        from hypercorn.asyncio.run import worker_serve
+
+        async def counted_app(scope, receive, send):
+            if scope["type"] == "http":
+                worker_request()
+            await asgi_app(scope, receive, send)
+
+        async def heartbeat():
+            while True:
+                worker_beat()
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+        async def main():
+            app: Any = counted_app
+            try:
+                from hypercorn.utils import wrap_app
+                app = wrap_app(counted_app, config.wsgi_max_body_size, None)
+            except ImportError:
+                # 旧版本hypercorn直接接收ASGI应用
+                pass
+            beat = asyncio.ensure_future(heartbeat())
+            try:
+                await worker_serve(app, config, sockets=sockets)
+            finally:
+                beat.cancel()
+        asyncio.run(main())
+    return target
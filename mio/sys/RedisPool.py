@@ -0,0 +1,183 @@
+# -*- coding: UTF-8 -*-
+import os
+import time
+import weakref
+import threading
+from redis import StrictRedis, BlockingConnectionPool
+from redis.client import Pipeline
+from redis.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from typing import Dict, Any, Optional
+from mio.util.Helper import get_bool, is_number
+from mio.util.CircuitBreaker import CircuitBreaker, get_breaker
+
+# 订阅线程(L1失效、PubSubDispatcher)会长期占用连接，在线程数之外预留
+POOL_HEADROOM: int = 4
+__pools__: "weakref.WeakSet[MeteredConnectionPool]" = weakref.WeakSet()
+
+
+class MeteredConnectionPool(BlockingConnectionPool):
+    """
+    带使用统计的阻塞连接池，连接用完时等待timeout秒而不是无限制地新建连接
+    统计只在当前进程内有效，fork之后随reset清零
+    """
+    in_use: int
+    acquired: int
+    timeouts: int
+    wait_ms_total: float
+    wait_ms_max: float
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        __pools__.add(self)
+
+    def reset(self):
+        # BlockingConnectionPool在__init__和检测到fork时都会调用reset
+        super().reset()
+        self._stats_lock = threading.Lock()
+        self.in_use = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def get_connection(self, *args, **kwargs):
+        start: float = time.perf_counter()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        elapsed_ms: float = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_ms_total += elapsed_ms
+            if elapsed_ms > self.wait_ms_max:
+                self.wait_ms_max = elapsed_ms
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        with self._stats_lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            created: int = len(self._connections)
+            return {
+                "pid": self.pid,
+                "max_connections": self.max_connections,
+                "created": created,
+                "in_use": self.in_use,
+                "idle": max(0, created - self.in_use),
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": self.wait_ms_total / self.acquired if self.acquired > 0 else 0.0,
+                "wait_ms_max": self.wait_ms_max,
+            }
+
+
+class GuardedPipeline(Pipeline):
+    breaker: Optional[CircuitBreaker] = None
+
+    def execute(self, raise_on_error: bool = True):
+        if self.breaker is None:
+            return super().execute(raise_on_error)
+        return self.breaker.call(super().execute, raise_on_error)
+
+
+class PooledRedis(StrictRedis):
+    """
+    给FlaskRedis.from_custom_provider使用，from_url时换成MeteredConnectionPool
+    配置了熔断器时，每个命令和每次pipeline执行都经过熔断器，打开时直接抛出CircuitOpenError
+    订阅连接(pubsub)不经过熔断器，由各自的监听线程重连
+    """
+    breaker: Optional[CircuitBreaker] = None
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        breaker: Optional[CircuitBreaker] = kwargs.pop("breaker", None)
+        client = cls(connection_pool=MeteredConnectionPool.from_url(url, **kwargs))
+        client.breaker = breaker
+        return client
+
+    def execute_command(self, *args, **options):
+        if self.breaker is None:
+            return super().execute_command(*args, **options)
+        return self.breaker.call(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        pipe = GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.breaker = self.breaker
+        return pipe
+
+
+def get_pool_size(config: dict) -> int:
+    """
+    每个worker进程的连接池大小，REDIS_MAX_CONNECTIONS为0时按线程数自动计算
+    线程数默认与WsgiBridge的线程池一致：WSGI_THREADS，未设置时为min(32, cpu + 4)
+    """
+    max_connections: Any = config.get("REDIS_MAX_CONNECTIONS", 0)
+    if is_number(max_connections) and int(max_connections) > 0:
+        return int(max_connections)
+    threads: Any = config.get("REDIS_POOL_THREADS", 0) or config.get("WSGI_THREADS", 0)
+    threads = int(threads) if is_number(threads) and int(threads) > 0 else min(32, (os.cpu_count() or 1) + 4)
+    return threads + POOL_HEADROOM
+
+
+def get_pool_kwargs(config: dict) -> Dict[str, Any]:
+    """
+    从配置生成redis客户端参数，传给FlaskRedis
+    """
+    kwargs: Dict[str, Any] = {
+        "max_connections": get_pool_size(config),
+        "timeout": float(config.get("REDIS_POOL_TIMEOUT", 5)),
+        "health_check_interval": int(config.get("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+        "retry_on_timeout": get_bool(config.get("REDIS_RETRY_ON_TIMEOUT", True)),
+    }
+    if not str(config.get("REDIS_URL", "")).startswith("unix://"):
+        # unix socket连接不接受keepalive参数
+        kwargs["socket_keepalive"] = get_bool(config.get("REDIS_SOCKET_KEEPALIVE", True))
+    for name in ["REDIS_SOCKET_TIMEOUT", "REDIS_SOCKET_CONNECT_TIMEOUT"]:
+        value: Any = config.get(name)
+        if is_number(value):
+            kwargs[name[len("REDIS_"):].lower()] = float(value)
+    retries: Any = config.get("REDIS_RETRIES", 3)
+    if is_number(retries) and int(retries) > 0:
+        kwargs["retry"] = Retry(ExponentialBackoff(cap=1, base=0.01), int(retries))
+    if get_bool(config.get("REDIS_BREAKER_ENABLE", False)):
+        # 只有连接和超时错误计入错误率，WRONGTYPE、NOSCRIPT这类响应错误不算
+        kwargs["breaker"] = get_redis_breaker(config)
+    return kwargs
+
+
+def get_redis_breaker(config: dict, name: str = "redis") -> CircuitBreaker:
+    """
+    阈值统一使用REDIS_BREAKER_*配置，name区分不同的redis实例(如各个缓存分片)
+    """
+    return get_breaker(name, config, config_prefix="REDIS", error_types=(ConnectionError, TimeoutError))
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    当前进程内所有MeteredConnectionPool的使用情况，用来按实际数据调整REDIS_MAX_CONNECTIONS
+    """
+    return {f"{pool.__class__.__name__}@{id(pool):x}": pool.stats() for pool in list(__pools__)}
+
+
+def __reset_pools_after_fork__():
+    # 子进程不能复用父进程的socket，只关闭子进程这一份fd(pid不同时redis-py不会shutdown)，父进程的连接不受影响
+    for pool in list(__pools__):
+        for connection in list(pool._connections):
+            try:
+                connection.disconnect()
+            except Exception as e:
+                str(e)
+        pool.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=__reset_pools_after_fork__)
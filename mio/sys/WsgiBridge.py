@@ -0,0 +1,496 @@
+# -*- coding: UTF-8 -*-
+import io
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Any, Iterator
+from werkzeug.exceptions import RequestEntityTooLarge, ClientDisconnected
+from mio.util.Helper import is_number
+from mio.util.Logs import LogHandler, get_logger
+from mio.util.Metrics import MIO_METRICS_ENABLE, get_method_metrics
+
+# 请求体转存到临时文件后，每次写入磁盘的最小字节数
+SPOOL_WRITE_SIZE: int = 256 * 1024
+
+
+def spool_to_file(memory: io.BytesIO) -> Any:
+    """
+    把内存中已经收到的请求体转存到临时文件，在线程中执行
+    """
+    body = tempfile.TemporaryFile()
+    try:
+        with memory.getbuffer() as view:
+            body.write(view)
+    except BaseException:
+        body.close()
+        raise
+    finally:
+        memory.close()
+    return body
+
+
+class BodyReader(object):
+    """
+    流式请求体，作为wsgi.input在worker线程中按需从ASGI的receive读取，内存中只保留还没被读走的部分
+    超过max_body_size时抛出RequestEntityTooLarge(413)，客户端断开时抛出ClientDisconnected
+    """
+
+    def __init__(self, receive: Callable, loop: asyncio.AbstractEventLoop, max_body_size: int = 0):
+        self._receive = receive
+        self._loop = loop
+        self._max_body_size = max_body_size
+        self._buffer = bytearray()
+        self._done: bool = False
+        self.received: int = 0
+
+    def __pull__(self) -> Optional[bytes]:
+        """
+        :return: 新收到的一段，已经读完时返回None
+        """
+        if self._done:
+            return None
+        message: dict = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message["type"] == "http.disconnect":
+            self._done = True
+            raise ClientDisconnected()
+        chunk: bytes = message.get("body", b"")
+        self.received += len(chunk)
+        if not message.get("more_body", False):
+            self._done = True
+        if 0 < self._max_body_size < self.received:
+            self._done = True
+            raise RequestEntityTooLarge()
+        return chunk
+
+    def read(self, size: int = -1) -> bytes:
+        while size is None or size < 0 or len(self._buffer) < size:
+            chunk: Optional[bytes] = self.__pull__()
+            if chunk is None:
+                break
+            self._buffer += chunk
+        size = len(self._buffer) if size is None or size < 0 else min(size, len(self._buffer))
+        data: bytes = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        while True:
+            idx: int = self._buffer.find(b"\n")
+            if idx >= 0:
+                end: int = idx + 1
+                break
+            if size is not None and 0 <= size <= len(self._buffer):
+                end = size
+                break
+            chunk: Optional[bytes] = self.__pull__()
+            if chunk is None:
+                end = len(self._buffer)
+                break
+            self._buffer += chunk
+        if size is not None and 0 <= size < end:
+            end = size
+        data: bytes = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    def readlines(self, hint: int = -1) -> List[bytes]:
+        lines: List[bytes] = []
+        total: int = 0
+        while True:
+            line: bytes = self.readline()
+            if not line:
+                break
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            line: bytes = self.readline()
+            if not line:
+                return
+            yield line
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """
+        按收到的分段逐个返回，不合并、不拆分
+        """
+        if len(self._buffer) > 0:
+            data: bytes = bytes(self._buffer)
+            self._buffer.clear()
+            yield data
+        while True:
+            chunk: Optional[bytes] = self.__pull__()
+            if chunk is None:
+                return
+            if chunk:
+                yield chunk
+
+    def close(self):
+        self._buffer.clear()
+
+
+class WsgiBridge(object):
+    """
+    ASGI到WSGI的桥，代替asgiref.wsgi.WsgiToAsgi：
+    1. WSGI应用跑在固定大小的线程池里(WsgiToAsgi默认thread_sensitive，所有请求挤在同一个线程)
+    2. 等待线程的请求超过queue_size时直接返回503，等待超过queue_timeout秒的也返回503，都带Retry-After
+    3. route_limits按路径前缀限制并发，慢接口排队不会占满整个线程池
+    4. 请求体：Content-Length超过max_body_size时不读直接返回413；
+       默认读完后再交给Flask，超过spool_threshold的部分写入临时文件；
+       stream_prefixes下的请求不预先读取，由视图通过wsgi.input(BodyReader)边收边处理
+    """
+    threads: int
+    queue_size: int
+    queue_timeout: float
+    retry_after: int
+    route_limits: List[Tuple[str, int]]
+
+    def __init__(
+            self, wsgi_app: Callable, threads: int = 0, queue_size: int = 0, queue_timeout: float = 0,
+            route_limits: Optional[Dict[str, int]] = None, retry_after: int = 1, max_body_size: int = 0,
+            spool_threshold: int = 1024 * 1024, stream_prefixes: Optional[List[str]] = None
+    ):
+        """
+        :param threads: 每个worker执行WSGI应用的线程数，0为min(32, cpu + 4)
+        :param queue_size: 最多等待线程的请求数，0为不限制
+        :param queue_timeout: 最长等待时间(秒)，0为不限制
+        :param route_limits: {路径前缀: 最大并发}，按最长前缀匹配
+        :param retry_after: 503响应的Retry-After(秒)
+        :param max_body_size: 请求体的最大字节数，0为不限制
+        :param spool_threshold: 预先读取的请求体超过该字节数后写入临时文件
+        :param stream_prefixes: 这些路径前缀下的请求体不预先读取
+        """
+        self.wsgi_app = wsgi_app
+        self.threads = threads if threads > 0 else min(32, (os.cpu_count() or 1) + 4)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.route_limits = sorted((route_limits or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_body_size = max_body_size
+        self.spool_threshold = spool_threshold
+        self.stream_prefixes = list(stream_prefixes or [])
+        self.waiting: int = 0
+        self.route_waiting: int = 0
+        self.running: int = 0
+        self.shed: int = 0
+        self.served: int = 0
+        self._pid: int = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._route_slots: Dict[str, asyncio.Semaphore] = {}
+        self._wait_metrics = get_method_metrics("WsgiBridge.queue_wait") if MIO_METRICS_ENABLE else None
+        __bridges__.append(self)
+
+    def __get_logger__(self, name: str) -> LogHandler:
+        return get_logger(f"{self.__class__.__name__}.{name}")
+
+    def __prepare__(self):
+        # 预加载模式下在master中创建，线程池和信号量要在worker中重新建立
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="WsgiBridge")
+        self._slots = asyncio.Semaphore(self.threads)
+        self._route_slots = {prefix: asyncio.Semaphore(limit) for prefix, limit in self.route_limits}
+        self.waiting = self.route_waiting = self.running = self.shed = self.served = 0
+
+    def __route_slot__(self, path: str) -> Optional[asyncio.Semaphore]:
+        for prefix, _ in self.route_limits:
+            if match_prefix(path, prefix):
+                return self._route_slots[prefix]
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threads": self.threads, "running": self.running, "waiting": self.waiting,
+            "route_waiting": self.route_waiting, "served": self.served, "shed": self.shed,
+        }
+
+    async def __admit__(self, path: str) -> Optional[List[asyncio.Semaphore]]:
+        """
+        先拿路由的并发名额，再拿线程池的名额，只有等待线程池的请求计入queue_size
+
+        :return: 拿到的信号量，超时返回None
+        """
+        acquired: List[asyncio.Semaphore] = []
+        start: float = time.monotonic()
+        try:
+            for slot in [self.__route_slot__(path), self._slots]:
+                if slot is None:
+                    continue
+                timeout: Optional[float] = None
+                if self.queue_timeout > 0:
+                    timeout = self.queue_timeout - (time.monotonic() - start)
+                    if timeout <= 0:
+                        raise asyncio.TimeoutError()
+                if slot is self._slots:
+                    if 0 < self.queue_size <= self.waiting:
+                        raise asyncio.TimeoutError()
+                    self.waiting += 1
+                    try:
+                        await asyncio.wait_for(slot.acquire(), timeout)
+                    finally:
+                        self.waiting -= 1
+                else:
+                    self.route_waiting += 1
+                    try:
+                        await asyncio.wait_for(slot.acquire(), timeout)
+                    finally:
+                        self.route_waiting -= 1
+                acquired.append(slot)
+            return acquired
+        except asyncio.TimeoutError:
+            for slot in acquired:
+                slot.release()
+            return None
+        finally:
+            if self._wait_metrics is not None:
+                self._wait_metrics.observe((time.monotonic() - start) * 1000, len(acquired) <= 0)
+
+    @staticmethod
+    async def __respond__(send, status: int, body: bytes, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+        await send({
+            "type": "http.response.start", "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")] + (headers or []),
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __reject__(self, send):
+        self.shed += 1
+        await self.__respond__(
+            send, 503, b"Service Unavailable", [(b"retry-after", str(self.retry_after).encode("ascii"))])
+
+    async def __read_body__(self, receive) -> Any:
+        """
+        读取整个请求体，超过spool_threshold后转存到临时文件
+        转存之后的磁盘写入攒够SPOOL_WRITE_SIZE再放到线程中执行，不阻塞事件循环(心跳)
+        """
+        loop = asyncio.get_running_loop()
+        body: Any = io.BytesIO()
+        pending: bytearray = bytearray()
+        spooled: bool = False
+        received: int = 0
+        try:
+            while True:
+                message: dict = await receive()
+                if message["type"] == "http.disconnect":
+                    raise ConnectionAbortedError("Client disconnected")
+                chunk: bytes = message.get("body", b"")
+                received += len(chunk)
+                if 0 < self.max_body_size < received:
+                    raise RequestEntityTooLarge()
+                if spooled:
+                    pending += chunk
+                    if len(pending) >= SPOOL_WRITE_SIZE:
+                        await loop.run_in_executor(None, body.write, bytes(pending))
+                        pending.clear()
+                else:
+                    body.write(chunk)
+                    if received > self.spool_threshold:
+                        body = await loop.run_in_executor(None, spool_to_file, body)
+                        spooled = True
+                if not message.get("more_body", False):
+                    break
+            if len(pending) > 0:
+                await loop.run_in_executor(None, body.write, bytes(pending))
+        except BaseException:
+            body.close()
+            raise
+        body.seek(0)
+        return body
+
+    def __is_stream__(self, path: str) -> bool:
+        for prefix in self.stream_prefixes:
+            if match_prefix(path, prefix):
+                return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        self.__prepare__()
+        path: str = scope.get("path", "")
+        if 0 < self.queue_size <= self.waiting:
+            # 队列已满，不读请求体直接拒绝；有路由限制的请求拿到路由名额后同样要排这个队
+            await self.__reject__(send)
+            return
+        if 0 < self.max_body_size < get_content_length(scope):
+            await self.__respond__(send, 413, b"Request Entity Too Large")
+            return
+        body: Any = None
+        if not self.__is_stream__(path):
+            try:
+                body = await self.__read_body__(receive)
+            except ConnectionAbortedError:
+                return
+            except RequestEntityTooLarge:
+                await self.__respond__(send, 413, b"Request Entity Too Large")
+                return
+        try:
+            acquired: Optional[List[asyncio.Semaphore]] = await self.__admit__(path)
+            if acquired is None:
+                await self.__reject__(send)
+                return
+            self.running += 1
+            try:
+                loop = asyncio.get_running_loop()
+                if body is None:
+                    body = BodyReader(receive, loop, self.max_body_size)
+                await loop.run_in_executor(
+                    self._executor, self.__run_wsgi__, build_environ(scope, body), send, loop)
+                self.served += 1
+            finally:
+                self.running -= 1
+                for slot in acquired:
+                    slot.release()
+        finally:
+            if body is not None:
+                body.close()
+
+    def __run_wsgi__(self, environ: dict, send, loop: asyncio.AbstractEventLoop):
+        """
+        在线程池中执行，响应通过事件循环发送
+        """
+        state: Dict[str, Any] = {"status": None, "headers": None, "started": False}
+
+        def call(message: dict):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start():
+            if not state["started"]:
+                state["started"] = True
+                call({"type": "http.response.start", "status": state["status"], "headers": state["headers"]})
+
+        def write(data: bytes):
+            # PEP 3333中旧式应用使用的write()
+            if data:
+                start()
+                call({"type": "http.response.body", "body": data, "more_body": True})
+
+        def start_response(
+                status: str, response_headers: List[Tuple[str, str]], exc_info: Any = None
+        ) -> Callable[[bytes], None]:
+            if exc_info is not None and state["started"]:
+                raise exc_info[1].with_traceback(exc_info[2])
+            state["status"] = int(status.split(" ", 1)[0])
+            state["headers"] = [
+                (name.lower().encode("ascii"), value.encode("latin1")) for name, value in response_headers
+            ]
+            return write
+
+        result: Any = None
+        try:
+            result = self.wsgi_app(environ, start_response)
+            for chunk in result:
+                if not chunk:
+                    continue
+                start()
+                call({"type": "http.response.body", "body": chunk, "more_body": True})
+            start()
+            call({"type": "http.response.body", "body": b""})
+        except Exception as e:
+            if state["started"]:
+                raise
+            self.__get_logger__("run_wsgi").error(e, exc_info=True)
+            call({"type": "http.response.start", "status": 500, "headers": []})
+            call({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+
+__bridges__: List[WsgiBridge] = []
+
+
+def match_prefix(path: str, prefix: str) -> bool:
+    """
+    按路径段匹配前缀，/export匹配/export和/export/1，不匹配/exports
+    """
+    prefix = prefix.rstrip("/")
+    return path == prefix or path.startswith(f"{prefix}/")
+
+
+def build_environ(scope: dict, body: Any) -> dict:
+    """
+    按PEP 3333由ASGI的scope生成WSGI的environ
+    """
+    root_path: str = scope.get("root_path", "")
+    path: str = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ: dict = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf8").decode("latin1"),
+        "PATH_INFO": path.encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        # 没有Content-Length(chunked)时也可以一直读到结束
+        "wsgi.input_terminated": True,
+    }
+    server: Optional[tuple] = scope.get("server") or ("localhost", 80)
+    environ["SERVER_NAME"] = server[0]
+    environ["SERVER_PORT"] = str(server[1]) if server[1] is not None else "0"
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+        environ["REMOTE_PORT"] = str(scope["client"][1])
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1")
+        if name == "content-length":
+            corrected_name: str = "CONTENT_LENGTH"
+        elif name == "content-type":
+            corrected_name = "CONTENT_TYPE"
+        else:
+            corrected_name = f"HTTP_{name.upper().replace('-', '_')}"
+        value = value.decode("latin1")
+        if corrected_name in environ:
+            value = f"{environ[corrected_name]},{value}"
+        environ[corrected_name] = value
+    return environ
+
+
+def get_content_length(scope: dict) -> int:
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            return int(value) if value.isdigit() else 0
+    return 0
+
+
+def get_bridge_kwargs(config: dict) -> Dict[str, Any]:
+    """
+    请求体上限优先使用WSGI_MAX_BODY_SIZE，其次是环境变量MAX_BODY_SIZE；
+    设置了MAX_BUFFER_SIZE且更小时，以它作为转存临时文件的阈值
+    """
+    from mio.sys import get_buffer_size
+    max_buffer_size, max_body_size = get_buffer_size()
+    spool_threshold: int = int(config.get("WSGI_SPOOL_THRESHOLD", 1024 * 1024))
+    if max_buffer_size is not None and 0 < max_buffer_size < spool_threshold:
+        spool_threshold = max_buffer_size
+    threads: Any = config.get("WSGI_THREADS", 0)
+    return {
+        "threads": int(threads) if is_number(threads) else 0,
+        "queue_size": int(config.get("WSGI_QUEUE_SIZE", 0)),
+        "queue_timeout": float(config.get("WSGI_QUEUE_TIMEOUT", 0)),
+        "route_limits": config.get("WSGI_ROUTE_LIMITS") or {},
+        "retry_after": int(config.get("WSGI_RETRY_AFTER", 1)),
+        "max_body_size": int(config.get("WSGI_MAX_BODY_SIZE", 0)) or max_body_size or 0,
+        "spool_threshold": spool_threshold,
+        "stream_prefixes": config.get("WSGI_STREAM_PREFIXES") or [],
+    }
+
+
+def get_bridge_stats() -> List[Dict[str, Any]]:
+    """
+    当前进程中各个桥的线程数、执行中、排队中(等待线程池/等待路由名额)、已处理和拒绝的请求数
+    """
+    return [bridge.stats() for bridge in __bridges__]
@@ -2,46 +2,56 @@
 import os
 import re
 import sys
-import rtoml as tomllib
 import time
 import codecs
 import logging
 import asyncio
 import importlib
 from pathlib import Path
-from celery import Celery
 from flask import Flask, blueprints
-from flask_cors import CORS
-from flask_babel import Babel
-from flask_bcrypt import Bcrypt
-from flask_caching import Cache
-from flask_redis import FlaskRedis
-from flask_wtf.csrf import CSRFProtect
-from flask_sqlalchemy import SQLAlchemy
-from typing import Tuple, Optional, List, Union
-from mio.util.Helper import in_dict, is_enable, is_number, get_canonical_os_name, get_args_from_dict
+from typing import Tuple, Optional, List, Union, Any, TYPE_CHECKING
+from mio.util.Helper import in_dict, is_number, get_canonical_os_name, get_args_from_dict
 from mio.util.Logs import LogHandler, LoggerType, nameToLevel
 from mio.sys.json import MioJsonProvider
-from mio.sys.flask_mongoengine import MongoEngine
+from mio.sys.Extensions import init_extensions
+
+if TYPE_CHECKING:
+    from celery import Celery
+    from flask_babel import Babel
+    from flask_caching import Cache
+    from flask_redis import FlaskRedis
+    from flask_wtf.csrf import CSRFProtect
+    from flask_sqlalchemy import SQLAlchemy
+    from mio.sys.flask_mongoengine import MongoEngine
 
 MIO_SYSTEM_VERSION = "2.0.2"
+# 扩展在create_app中按开关导入和初始化，见mio.sys.Extensions
 mail = None
-crypt: Bcrypt = Bcrypt()
-db: Optional[MongoEngine] = None
-rdb: Optional[SQLAlchemy] = None
-redis_db: Optional[FlaskRedis] = None
-csrf: Optional[CSRFProtect] = None
-cache: Optional[Cache] = None
-babel: Optional[Babel] = None
-celery_app: Optional[Celery] = None
-os_name: str = get_canonical_os_name()
+db: Optional["MongoEngine"] = None
+rdb: Optional["SQLAlchemy"] = None
+redis_db: Optional["FlaskRedis"] = None
+csrf: Optional["CSRFProtect"] = None
+cache: Optional["Cache"] = None
+babel: Optional["Babel"] = None
+celery_app: Optional["Celery"] = None
+
+
+def __getattr__(name: str) -> Any:
+    # crypt和os_name在第一次使用时才创建，import mio.sys不再导入bcrypt、探测平台
+    if name == "crypt":
+        from flask_bcrypt import Bcrypt
+        crypt: "Bcrypt" = Bcrypt()
+        globals()["crypt"] = crypt
+        return crypt
+    if name == "os_name":
+        return get_canonical_os_name()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def create_app(
         config_name: str, root_path: Optional[str] = None, config_clz: Optional[str] = None,
         is_cli: bool = False, logger_type: LoggerType = LoggerType, log_level: int = logging.DEBUG
 ) -> Tuple[Flask, LogHandler]:
-    global cache, babel, csrf, redis_db, db, rdb, mail, celery_app
     console = LogHandler("PyMio", logger_type=logger_type, log_level=log_level)
     console.info(f"Initializing the system......profile: {config_name}")
     console.info(f"Pymio Version: {MIO_SYSTEM_VERSION}")
@@ -66,6 +76,7 @@ def create_app(
     static_folder: Optional[str] = None
     template_folder: Optional[str] = None
     if not is_cli:
+        import rtoml as tomllib
         toml_file: str = os.path.join(config_path, "config.toml")
         if not os.path.isfile(toml_file):
             console.error(u"config.toml not found!")
@@ -102,54 +113,10 @@ def create_app(
     app.config.from_object(config[config_name])
     app.config["ENV"] = config_name
     config[config_name].init_app(app)
-    babel = Babel(app)
-    if in_dict(base_config, "csrf"):
-        if is_enable(base_config["csrf"], "enable"):
-            csrf = CSRFProtect()
-            csrf.init_app(app)
-    if is_enable(app.config, "MIO_MAIL"):
-        from flask_mail import Mail
-        mail = Mail()
-        mail.init_app(app)
-    if is_enable(app.config, "MONGODB_ENABLE"):
-        db = MongoEngine()
-        db.init_app(app)
-        # ! 至少输出警告级别
-        logging.getLogger('pymongo').setLevel(logging.WARN)
-    if is_enable(app.config, "RDBMS_ENABLE"):
-        rdb = SQLAlchemy()
-        rdb.init_app(app)
-    if is_enable(app.config, "CELERY_ENABLE"):
-        celery_app_config: dict = {
-            "broker": app.config["CELERY_BROKER_URL"],
-            "backend": app.config["CELERY_BACKEND_URL"],
-        }
-        if "CELERY_RESULT_BACKEND" in app.config:
-            celery_app_config.update({"result_backend": app.config["CELERY_RESULT_BACKEND"]})
-        if "CELERY_RESULT_PERSISTENT" in app.config:
-            celery_app_config.update({"result_persistent": app.config["CELERY_RESULT_PERSISTENT"]})
-        if "CELERY_RESULT_EXCHANGE" in app.config:
-            celery_app_config.update({"result_exchange": app.config["CELERY_RESULT_EXCHANGE"]})
-        if "CELERY_RESULT_EXCHANGE_TYPE" in app.config:
-            celery_app_config.update({"result_exchange_type": app.config["CELERY_RESULT_EXCHANGE_TYPE"]})
-        if "CELERY_BROKER_USE_SSL" in app.config:
-            celery_app_config.update({"broker_use_ssl": app.config["CELERY_BROKER_USE_SSL"]})
-        celery_app = Celery(
-            app.import_name,
-            **celery_app_config
-        )
-        logging.getLogger('amqp').setLevel(log_level)
-        logging.getLogger('celery').setLevel(log_level)
-    if is_enable(app.config, "REDIS_ENABLE"):
-        redis_db = FlaskRedis()
-        redis_db.init_app(app)
-    if is_enable(app.config, "CORS_ENABLE"):
-        if not in_dict(app.config, "CORS_URI"):
-            console.error(u"CORS_URI not define.")
-            sys.exit(0)
-        CORS(app, resources=app.config["CORS_URI"])
-    if is_enable(app.config, "CACHED_ENABLE"):
-        cache = Cache(app)
+    # 扩展实例按名称写回上面的模块变量
+    for name, instance in init_extensions(app, base_config, console, log_level).items():
+        if name in globals():
+            globals()[name] = instance
     if is_cli:
         # 如果是cli模式，这里就出去就行了
         return app, console
@@ -158,6 +125,10 @@ def create_app(
         key: str = list(blueprint.keys())[0]
         clazz = __import__(blueprint[key]["class"], globals(), fromlist=[key])
         bp: blueprints.Blueprint = getattr(clazz, key)
+        if blueprint[key].get("asgi", False) is True:
+            # Quart蓝图，由MountMiddleware注册到Quart应用，按url_prefix直接在事件循环上处理
+            app.extensions.setdefault("mio_asgi_blueprints", []).append((bp, blueprint[key].get("url_prefix")))
+            continue
         if in_dict(blueprint[key], "url_prefix"):
             app.register_blueprint(bp, url_prefix=blueprint[key]["url_prefix"])
         else:
@@ -192,6 +163,7 @@ def init_timezone():
 
 def init_uvloop():
     try:
+        os_name: str = get_canonical_os_name()
         if os_name == "unknown":
             return
         if os_name == "windows":
@@ -230,7 +202,7 @@ def get_buffer_size() -> Tuple[Optional[int], Optional[int]]:
 
 
 def get_cpu_limit() -> int:
-    if os_name in ["windows", "unknown"]:
+    if get_canonical_os_name() in ["windows", "unknown"]:
         # for windows os, just 1. test in win11
         return 1
     cpu_limit: int = 1 if not is_number(os.environ.get("MIO_LIMIT_CPU")) \
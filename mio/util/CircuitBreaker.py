@@ -0,0 +1,215 @@
+# -*- coding: UTF-8 -*-
+import os
+import time
+import threading
+from typing import Dict, Tuple, Optional, Type, Any, Callable
+
+STATE_CLOSED: str = "closed"
+STATE_OPEN: str = "open"
+STATE_HALF_OPEN: str = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    熔断打开时直接抛出，不再访问后端
+    """
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    按错误率和慢调用比例熔断
+    1. closed：统计窗口内调用数达到min_calls后，错误率或慢调用比例超过阈值则打开
+    2. open：open_seconds内所有调用直接抛出CircuitOpenError
+    3. half_open：放行最多half_open_calls个探测调用，全部成功则关闭，任何一个失败或过慢则重新打开
+    """
+    name: str
+    window: float
+    min_calls: int
+    error_rate: float
+    slow_ms: float
+    slow_rate: float
+    open_seconds: float
+    half_open_calls: int
+    error_types: Tuple[Type[BaseException], ...]
+
+    def __init__(
+            self, name: str, window: float = 10, min_calls: int = 20, error_rate: float = 0.5,
+            slow_ms: float = 200, slow_rate: float = 0.8, open_seconds: float = 5, half_open_calls: int = 3,
+            error_types: Tuple[Type[BaseException], ...] = (Exception,)
+    ):
+        """
+        :param window: 统计窗口(秒)
+        :param slow_ms: 超过该耗时(毫秒)的调用记为慢调用，0为不统计
+        :param error_types: 计入错误率的异常类型，其他异常(如业务错误)视为成功
+        """
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.error_types = error_types
+        self.opened_count = 0
+        self.rejected = 0
+        self.__reset__()
+
+    def __reset__(self):
+        self._lock = threading.Lock()
+        self._state: str = STATE_CLOSED
+        self._window_start: float = time.monotonic()
+        self._calls: int = 0
+        self._errors: int = 0
+        self._slow: int = 0
+        self._opened_at: float = 0.0
+        self._probes: int = 0
+        self._probe_successes: int = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        now: float = time.monotonic()
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self._state = STATE_HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                return False
+            self._probes += 1
+            return True
+
+    def record(self, elapsed_ms: float, is_error: bool = False):
+        now: float = time.monotonic()
+        is_slow: bool = 0 < self.slow_ms <= elapsed_ms
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                if is_error or is_slow:
+                    self.__open__(now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._state = STATE_CLOSED
+                    self.__new_window__(now)
+                return
+            if self._state == STATE_OPEN:
+                return
+            if now - self._window_start >= self.window:
+                self.__new_window__(now)
+            self._calls += 1
+            self._errors += 1 if is_error else 0
+            self._slow += 1 if is_slow else 0
+            if self._calls < self.min_calls:
+                return
+            if self._errors / self._calls >= self.error_rate or \
+                    (self.slow_ms > 0 and self._slow / self._calls >= self.slow_rate):
+                self.__open__(now)
+
+    def __new_window__(self, now: float):
+        self._window_start = now
+        self._calls = 0
+        self._errors = 0
+        self._slow = 0
+
+    def __open__(self, now: float):
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self.opened_count += 1
+        self.__new_window__(now)
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        start: float = time.perf_counter()
+        try:
+            result: Any = func(*args, **kwargs)
+        except self.error_types:
+            self.record((time.perf_counter() - start) * 1000, is_error=True)
+            raise
+        except Exception:
+            self.record((time.perf_counter() - start) * 1000)
+            raise
+        self.record((time.perf_counter() - start) * 1000)
+        return result
+
+    async def call_async(self, func: Callable, *args, **kwargs) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        start: float = time.perf_counter()
+        try:
+            result: Any = await func(*args, **kwargs)
+        except self.error_types:
+            self.record((time.perf_counter() - start) * 1000, is_error=True)
+            raise
+        except Exception:
+            self.record((time.perf_counter() - start) * 1000)
+            raise
+        self.record((time.perf_counter() - start) * 1000)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "calls": self._calls,
+                "errors": self._errors,
+                "slow": self._slow,
+                "opened_count": self.opened_count,
+                "rejected": self.rejected,
+            }
+
+
+__breakers__: Dict[str, CircuitBreaker] = {}
+__breakers_lock__ = threading.Lock()
+
+
+def get_breaker(
+        name: str, config: Optional[dict] = None, config_prefix: Optional[str] = None, **kwargs
+) -> CircuitBreaker:
+    """
+    进程内按名称共享的熔断器，首次创建时从config读取 {config_prefix}_BREAKER_* 配置
+
+    :param name: 后端名称，如 redis
+    :param config_prefix: 配置前缀，默认为name.upper()
+    """
+    breaker: Optional[CircuitBreaker] = __breakers__.get(name)
+    if breaker is not None:
+        return breaker
+    with __breakers_lock__:
+        breaker = __breakers__.get(name)
+        if breaker is None:
+            prefix: str = f"{config_prefix or name.upper()}_BREAKER_"
+            config = {} if config is None else config
+            for option, cast in [
+                ("window", float), ("min_calls", int), ("error_rate", float), ("slow_ms", float),
+                ("slow_rate", float), ("open_seconds", float), ("half_open_calls", int)
+            ]:
+                if f"{prefix}{option.upper()}" in config:
+                    kwargs.setdefault(option, cast(config[f"{prefix}{option.upper()}"]))
+            breaker = CircuitBreaker(name, **kwargs)
+            __breakers__[name] = breaker
+    return breaker
+
+
+def get_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.stats() for name, breaker in list(__breakers__.items())}
+
+
+def __reset_breakers_after_fork__():
+    # fork时其他线程可能正持有锁，子进程从关闭状态重新统计
+    for breaker in list(__breakers__.values()):
+        breaker.__reset__()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=__reset_breakers_after_fork__)
@@ -3,6 +3,7 @@ import sys
 import platform
 import ipaddress
 import subprocess
+from functools import lru_cache
 from flask import request
 from typing import Any, Optional, List
 
@@ -68,6 +69,7 @@ def check_ie() -> bool:
     return check_ua(["MSIE", "like gecko"])
 
 
+@lru_cache(maxsize=None)
 def get_canonical_os_name() -> str:
     if sys.platform in ("win32", "cygwin"):
         return "windows"
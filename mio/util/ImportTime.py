@@ -0,0 +1,61 @@
+# -*- coding: UTF-8 -*-
+import os
+import sys
+import subprocess
+from typing import List, Dict, Any, Optional
+
+
+def parse_import_time(output: str) -> List[Dict[str, Any]]:
+    """
+    解析 python -X importtime 输出到stderr的内容
+
+    :return: 每个模块的 name、self_ms、cumulative_ms、depth(缩进层级)
+    """
+    rows: List[Dict[str, Any]] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts: List[str] = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name: str = parts[2].rstrip()
+        stripped: str = name.lstrip()
+        rows.append({
+            "name": stripped,
+            "self_ms": int(parts[0]) / 1000,
+            "cumulative_ms": int(parts[1]) / 1000,
+            "depth": (len(name) - len(stripped) - 1) // 2,
+        })
+    return rows
+
+
+def import_time_report(
+        module: str, top: int = 20, code: Optional[str] = None, cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    在新的解释器中以 -X importtime 导入模块，统计冷启动时间花在哪里
+
+    :param module: 要导入的模块，如 mio.sys、mio.cli
+    :param top: 按自身耗时和累计耗时各取前几个
+    :param code: 代替 import {module} 执行的代码
+    :return: total_ms(顶层模块累计耗时之和)、top_self、top_cumulative、packages(按顶层包汇总的自身耗时)
+    """
+    run_env: Dict[str, str] = dict(os.environ if env is None else env)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code or f"import {module}"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=cwd, env=run_env)
+    rows: List[Dict[str, Any]] = parse_import_time(result.stderr.decode("utf-8", errors="replace"))
+    packages: Dict[str, float] = {}
+    for row in rows:
+        package: str = row["name"].split(".")[0]
+        packages[package] = packages.get(package, 0.0) + row["self_ms"]
+    return {
+        "module": module,
+        "returncode": result.returncode,
+        "modules": len(rows),
+        "total_ms": round(sum([row["cumulative_ms"] for row in rows if row["depth"] == 0]), 3),
+        "top_self": sorted(rows, key=lambda row: row["self_ms"], reverse=True)[:top],
+        "top_cumulative": sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top],
+        "packages": dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]),
+    }
@@ -1,12 +1,13 @@
 # -*- coding: UTF-8 -*-
-import inspect
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from typing import Optional
 from mio.util.Helper import random_char
+from mio.util.Metrics import instrument
 from .base import BaseModel
 
 
+@instrument
 class AesCBC(BaseModel):
     def __init__(
             self, key: Optional[str] = None, iv: Optional[str] = None, aad: Optional[str] = None,
@@ -28,7 +29,7 @@ class AesCBC(BaseModel):
         self.set_iv(default_iv, iv=iv, is_hex=is_hex)
 
     def encrypt(self, msg: bytes) -> Optional[bytes]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("encrypt")
         try:
             data = pad(msg, 16)
             cipher = AES.new(self._key, AES.MODE_CBC, self._iv)
@@ -39,7 +40,7 @@ class AesCBC(BaseModel):
             return None
 
     def decrypt(self, enc: bytes) -> Optional[bytes]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("decrypt")
         try:
             cipher = AES.new(self._key, AES.MODE_CBC, self._iv)
             plain: bytes = unpad(cipher.decrypt(enc), 16)
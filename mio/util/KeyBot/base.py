@@ -1,10 +1,11 @@
 # -*- coding: UTF-8 -*-
-import inspect
 from typing import Optional
-from mio.util.Logs import LogHandler
+from mio.util.Logs import LogHandler, get_logger
+from mio.util.Metrics import instrument
 from mio.util.Helper import base64_encode, base64_decode
 
 
+@instrument
 class BaseModel:
     VERSION: str = "0.3"
     _class_name: str
@@ -13,8 +14,7 @@ class BaseModel:
     _aad: Optional[bytes] = None
 
     def __get_logger__(self, name: str) -> LogHandler:
-        name = f"{self._class_name}.{name}"
-        return LogHandler(name)
+        return get_logger(f"{self._class_name}.{name}")
 
     def __init__(self, _class_name: str):
         self._class_name = _class_name
@@ -27,7 +27,7 @@ class BaseModel:
         :param key: 传入的密钥字符串，如果不传或为空，则使用默认值
         :param is_hex: 是否为hex字符串
         """
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("set_key")
         if key and len(key) > 0:
             try:
                 if is_hex:
@@ -47,7 +47,7 @@ class BaseModel:
         :param iv: 传入的IV字符串，如果不传或为空，则使用默认值
         :param is_hex: 是否为hex字符串
         """
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("set_iv")
         if iv and len(iv) > 0:
             try:
                 if is_hex:
@@ -86,7 +86,7 @@ class BaseModel:
         return cipher.hex()
 
     def hex_decrypt(self, cipher: str) -> Optional[str]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("hex_decrypt")
         try:
             enc: bytes = bytes.fromhex(cipher)
         except Exception as e:
@@ -1,11 +1,12 @@
 # -*- coding: UTF-8 -*-
-import inspect
 from Crypto.Cipher import ChaCha20 as baseChaCha20
 from Crypto.Random import get_random_bytes
 from typing import Optional
+from mio.util.Metrics import instrument
 from .base import BaseModel
 
 
+@instrument
 class ChaCha20(BaseModel):
     _is_poly1305: bool = True
     _counter: int = 0
@@ -30,7 +31,7 @@ class ChaCha20(BaseModel):
         self.set_iv(default_iv, iv=iv, is_hex=is_hex)
 
     def encrypt(self, msg: bytes) -> Optional[bytes]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("encrypt")
         try:
             cipher_encrypt = baseChaCha20.new(key=self._key, nonce=self._iv)
             cipher: bytes = cipher_encrypt.encrypt(msg)
@@ -40,7 +41,7 @@ class ChaCha20(BaseModel):
             return None
 
     def decrypt(self, cipher: bytes) -> Optional[bytes]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("decrypt")
         try:
             cipher_decrypt = baseChaCha20.new(key=self._key, nonce=self._iv)
             plain: bytes = cipher_decrypt.decrypt(cipher)
@@ -1,12 +1,13 @@
 # -*- coding: UTF-8 -*-
-import inspect
 from Crypto import Random
 from Crypto.Cipher import DES3
 from Crypto.Random import get_random_bytes
 from typing import Optional
+from mio.util.Metrics import instrument
 from .base import BaseModel
 
 
+@instrument
 class Des3(BaseModel):
     def __init__(
             self, key: Optional[str] = None, iv: Optional[str] = None, aad: Optional[str] = None,
@@ -28,7 +29,7 @@ class Des3(BaseModel):
         self.set_iv(default_iv, iv=iv, is_hex=is_hex)
 
     def encrypt(self, msg: bytes) -> Optional[bytes]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("encrypt")
         try:
             cipher_encrypt = DES3.new(self._key, DES3.MODE_OFB, self._iv)
             cipher: bytes = cipher_encrypt.encrypt(msg)
@@ -38,7 +39,7 @@ class Des3(BaseModel):
             return None
 
     def decrypt(self, cipher: bytes) -> Optional[bytes]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("decrypt")
         try:
             cipher_decrypt = DES3.new(self._key, DES3.MODE_OFB, self._iv)
             plain: bytes = cipher_decrypt.decrypt(cipher)
@@ -2,9 +2,10 @@
 import logging
 import os
 import datetime
+import threading
 import daiquiri
 import daiquiri.formatter
-from typing import Optional
+from typing import Optional, Dict
 from enum import Enum, unique
 from mio.util.Helper import get_root_path
 from mio.util.LogConfigs import *
@@ -117,3 +118,22 @@ class LogHandler(object):
 
     def warning(self, msg):
         self.console_log.warning(msg)
+
+
+__loggers__: Dict[str, LogHandler] = {}
+__loggers_lock__ = threading.Lock()
+
+
+def get_logger(logger_name: str) -> LogHandler:
+    """
+    按名称缓存的LogHandler，用于高频调用的方法，避免每次都重新daiquiri.setup
+    """
+    console_log: Optional[LogHandler] = __loggers__.get(logger_name)
+    if console_log is not None:
+        return console_log
+    with __loggers_lock__:
+        console_log = __loggers__.get(logger_name)
+        if console_log is None:
+            console_log = LogHandler(logger_name)
+            __loggers__[logger_name] = console_log
+    return console_log
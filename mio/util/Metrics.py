@@ -0,0 +1,117 @@
+# -*- coding: UTF-8 -*-
+import os
+import time
+import bisect
+import inspect
+import threading
+import functools
+from typing import Dict, List, Tuple, Optional
+
+# 只在导入时读取一次，关闭时instrument直接返回原类，没有任何额外开销
+MIO_METRICS_ENABLE: bool = str(os.environ.get("MIO_METRICS_ENABLE", "0")) == "1"
+# 延迟直方图的上边界(毫秒)，最后一个桶为+Inf
+LATENCY_BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class MethodMetrics(object):
+    calls: int
+    errors: int
+    total_ms: float
+    buckets: List[int]
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float, is_error: bool = False):
+        idx: int = bisect.bisect_left(LATENCY_BUCKETS, elapsed_ms)
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.buckets[idx] += 1
+            if is_error:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels: List[str] = [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_ms": self.total_ms / self.calls if self.calls > 0 else 0.0,
+                "histogram": dict(zip(labels, self.buckets)),
+            }
+
+
+__metrics__: Dict[str, MethodMetrics] = {}
+__metrics_lock__ = threading.Lock()
+
+
+def get_method_metrics(name: str) -> MethodMetrics:
+    metrics: Optional[MethodMetrics] = __metrics__.get(name)
+    if metrics is not None:
+        return metrics
+    with __metrics_lock__:
+        metrics = __metrics__.get(name)
+        if metrics is None:
+            metrics = MethodMetrics()
+            __metrics__[name] = metrics
+    return metrics
+
+
+def get_metrics(prefix: Optional[str] = None) -> Dict[str, dict]:
+    """
+    导出当前进程的方法统计
+
+    :param prefix: 只导出指定前缀的方法，如 QuickCache.
+    """
+    return {
+        name: metrics.snapshot() for name, metrics in list(__metrics__.items())
+        if prefix is None or name.startswith(prefix)
+    }
+
+
+def __wrap__(name: str, func):
+    metrics: MethodMetrics = get_method_metrics(name)
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start: float = time.perf_counter()
+            is_error: bool = False
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                is_error = True
+                raise
+            finally:
+                metrics.observe((time.perf_counter() - start) * 1000, is_error)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start: float = time.perf_counter()
+        is_error: bool = False
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            is_error = True
+            raise
+        finally:
+            metrics.observe((time.perf_counter() - start) * 1000, is_error)
+    return wrapper
+
+
+def instrument(cls):
+    """
+    类装饰器，MIO_METRICS_ENABLE=1时为类上定义的公开方法记录调用次数、异常次数和延迟直方图
+    """
+    if not MIO_METRICS_ENABLE:
+        return cls
+    for attr, func in list(vars(cls).items()):
+        if attr.startswith("_") or not inspect.isfunction(func):
+            continue
+        setattr(cls, attr, __wrap__(f"{cls.__name__}.{attr}", func))
+    return cls
@@ -0,0 +1,67 @@
+# -*- coding: UTF-8 -*-
+import os
+from typing import Iterator, Optional, Any
+
+
+def iter_request_body(chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    逐段读取当前请求的请求体，不会一次性载入内存
+    在WSGI_STREAM_PREFIXES下时按收到的分段返回，否则从预先读取的(可能在临时文件中的)请求体中按chunk_size读取
+
+    :param chunk_size: 每次读取的字节数
+    """
+    from flask import request
+    stream: Any = request.environ.get("wsgi.input")
+    if hasattr(stream, "iter_chunks"):
+        yield from stream.iter_chunks()
+        return
+    stream = request.stream
+    while True:
+        chunk: bytes = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def save_request_body(path: str, chunk_size: int = 64 * 1024) -> int:
+    """
+    把当前请求的请求体写入文件，先写到.part文件，完整接收后再改名
+
+    :param path: 目标文件路径
+    :return: 写入的字节数
+    """
+    temp_path: str = f"{path}.part"
+    size: int = 0
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in iter_request_body(chunk_size):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return size
+
+
+def save_request_body_to_gridfs(
+        filename: str, alias: str = "default", bucket_name: str = "fs", metadata: Optional[dict] = None,
+        chunk_size: int = 64 * 1024
+) -> Any:
+    """
+    把当前请求的请求体直接写入GridFS，中途失败时会清理已写入的分块
+
+    :param filename: GridFS中的文件名
+    :param alias: mongoengine的连接别名
+    :param bucket_name: GridFS的bucket
+    :param metadata: 附加的metadata
+    :return: 文件的_id
+    """
+    from gridfs import GridFSBucket
+    from mongoengine.connection import get_db
+    bucket = GridFSBucket(get_db(alias), bucket_name=bucket_name)
+    with bucket.open_upload_stream(filename, metadata=metadata) as grid_in:
+        for chunk in iter_request_body(chunk_size):
+            grid_in.write(chunk)
+    return grid_in._id
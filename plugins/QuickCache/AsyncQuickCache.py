@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+import uuid
+import pickle
+import asyncio
+from weakref import WeakKeyDictionary
+from flask import Flask
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub, Pipeline
+from typing import Optional, Any, Tuple, List, Dict
+from mio.util.Helper import get_bool
+from mio.util.Metrics import instrument
+from mio.util.CircuitBreaker import CircuitBreaker, CircuitOpenError
+from . import QuickCacheBase, SCAN_BATCH_SIZE
+from .Codec import decode
+from .Scripts import scripts
+from .Shard import PipelineGroup, get_shard_urls
+
+__async_clients__: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Redis]]" = WeakKeyDictionary()
+
+
+class GuardedAsyncPipeline(Pipeline):
+    breaker: Optional[CircuitBreaker] = None
+
+    async def execute(self, raise_on_error: bool = True):
+        if self.breaker is None:
+            return await super().execute(raise_on_error)
+        return await self.breaker.call_async(super().execute, raise_on_error)
+
+
+class GuardedAsyncRedis(Redis):
+    """
+    与同步的redis_db共用名为redis的熔断器，同一个redis故障时两边一起快速失败
+    """
+    breaker: Optional[CircuitBreaker] = None
+
+    async def execute_command(self, *args, **options):
+        if self.breaker is None:
+            return await super().execute_command(*args, **options)
+        return await self.breaker.call_async(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        pipe = GuardedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.breaker = self.breaker
+        return pipe
+
+
+def get_async_redis(config: dict, shard: Optional[int] = None) -> Redis:
+    """
+    redis.asyncio的连接绑定在创建它的事件循环上，所以按事件循环各自持有一个连接池，事件循环回收时连接池一起回收
+
+    :param shard: 缓存分片在QUICK_CACHE_REDIS_URLS中的下标，为空时连接REDIS_URL
+    """
+    loop = asyncio.get_running_loop()
+    url: str = config.get("REDIS_URL", "redis://localhost:6379/0") if shard is None \
+        else get_shard_urls(config)[shard]
+    clients: Dict[str, Redis] = __async_clients__.setdefault(loop, {})
+    client: Optional[Redis] = clients.get(url)
+    if client is None:
+        client = GuardedAsyncRedis.from_url(
+            url, max_connections=int(config.get("QUICK_CACHE_ASYNC_MAX_CONNECTIONS", 64)))
+        if get_bool(config.get("REDIS_BREAKER_ENABLE", False)):
+            from mio.sys.RedisPool import get_redis_breaker
+            client.breaker = get_redis_breaker(config, "redis" if shard is None else f"redis-shard-{shard}")
+        clients[url] = client
+    return client
+
+
+@instrument
+class AsyncQuickCache(QuickCacheBase):
+    """
+    asyncio版本的QuickCache，用于Quart/ASGI中间件等跑在hypercorn事件循环上的代码，方法与QuickCache一致
+    """
+    VERSION = "0.1.0"
+    config: dict
+
+    def __init__(self, current_app: Optional[Flask] = None, use_near_cache: bool = True):
+        if current_app is None:
+            from flask import current_app
+        super().__init__(current_app, use_near_cache=use_near_cache)
+        self.config = current_app.config
+
+    @property
+    def client(self) -> Redis:
+        return get_async_redis(self.config)
+
+    def __client__(self, redis_key: str) -> Redis:
+        if self.shards is None:
+            return self.client
+        return get_async_redis(self.config, self.shards.ring.node_for(redis_key))
+
+    def __clients__(self) -> List[Redis]:
+        if self.shards is None:
+            return [self.client]
+        return [get_async_redis(self.config, idx) for idx in range(len(self.shards.urls))]
+
+    def __group__(self, redis_keys: List[str]) -> List[Tuple[Redis, List[str]]]:
+        if self.shards is None:
+            return [(self.client, redis_keys)]
+        groups: Dict[int, List[str]] = {}
+        for redis_key in redis_keys:
+            groups.setdefault(self.shards.ring.node_for(redis_key), []).append(redis_key)
+        return [(get_async_redis(self.config, idx), group) for idx, group in groups.items()]
+
+    async def __notify_changed__(self, *redis_keys: str):
+        if self.near_cache is None or len(redis_keys) == 0:
+            return
+        self.near_cache.invalidate(*redis_keys)
+        if self.near_cache_channel is not None:
+            await self.client.publish(self.near_cache_channel, "\n".join(redis_keys))
+
+    async def __unlink_keys__(self, keys: List[str], client: Optional[Redis] = None) -> int:
+        count: int = 0
+        for shard, shard_keys in ([(client, keys)] if client is not None else self.__group__(keys)):
+            for i in range(0, len(shard_keys), SCAN_BATCH_SIZE):
+                batch: List[str] = shard_keys[i:i + SCAN_BATCH_SIZE]
+                count += await shard.unlink(*batch)
+                if self.backend is not None:
+                    count += self.backend.delete(*batch)
+                await self.__notify_changed__(*batch)
+        return count
+
+    async def get_keys(self, key: str, is_full_key: bool = False) -> List[str]:
+        console_log = self.__get_logger__("get_keys")
+        try:
+            redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+            keys: List[str] = []
+            for client in self.__clients__():
+                keys += [
+                    str(key, encoding="utf-8") async for key in client.scan_iter(match=redis_key, count=SCAN_BATCH_SIZE)
+                ]
+            if self.backend is not None:
+                keys = list(dict.fromkeys(keys + self.backend.keys(redis_key)))
+            return keys
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return []
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        console_log = self.__get_logger__("invalidate_tags")
+        tags = tuple(tag for tag in tags if tag is not None and len(tag) > 0)
+        if len(tags) <= 0:
+            return 0
+        tag_keys: List[str] = [f"{self.redis_key}:Tag:{tag}" for tag in tags]
+        try:
+            pipes: PipelineGroup = self.__pipelines__()
+            for client, shard_tag_keys in self.__group__(tag_keys):
+                for tag_key in shard_tag_keys:
+                    pipes.get(client).smembers(tag_key)
+            keys: set = set()
+            for members in await pipes.execute_async():
+                keys.update([str(member, encoding="utf-8") for member in members])
+            count: int = await self.__unlink_keys__(list(keys))
+            for client, shard_tag_keys in self.__group__(tag_keys):
+                await client.unlink(*shard_tag_keys)
+            return count
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return 0
+
+    async def namespace_key(self, namespace: str, key: str) -> str:
+        console_log = self.__get_logger__("namespace_key")
+        version: int = 0
+        try:
+            gen_key: str = f"{self.redis_key}:Gen:{namespace}"
+            val: Optional[bytes] = await self.__client__(gen_key).get(gen_key)
+            version = 0 if val is None else int(val)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+        return f"{self.redis_key}:Cache:{namespace}:v{version}:{key}"
+
+    async def bump_namespace(self, namespace: str) -> Optional[int]:
+        console_log = self.__get_logger__("bump_namespace")
+        if namespace is None or len(namespace) <= 0:
+            return None
+        try:
+            gen_key: str = f"{self.redis_key}:Gen:{namespace}"
+            return await self.__client__(gen_key).incr(gen_key)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def lpush(
+            self, key: str, value: Optional[Any] = None, expiry: int = 0, is_full_key: bool = False,
+            codec: Optional[str] = None
+    ) -> bool:
+        return await self.lpush_many(key, [value], expiry=expiry, is_full_key=is_full_key, codec=codec)
+
+    async def lpush_many(
+            self, key: str, values: List[Any], expiry: int = 0, is_full_key: bool = False,
+            codec: Optional[str] = None
+    ) -> bool:
+        console_log = self.__get_logger__("lpush_many")
+        if key is None or len(key) <= 0 or values is None or len(values) <= 0:
+            return False
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        try:
+            pipe = self.__client__(redis_key).pipeline(transaction=False)
+            pipe.lpush(redis_key, *[self.__encode__(redis_key, value, codec) for value in values])
+            if expiry > 0:
+                pipe.expire(name=redis_key, time=expiry)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    async def llen(self, key: str, is_full_key: bool = False) -> int:
+        console_log = self.__get_logger__("llen")
+        if key is None or len(key) <= 0:
+            return 0
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        try:
+            return await self.__client__(redis_key).llen(redis_key)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return 0
+
+    async def inc_num(self, key: str, num: int = 1, is_full_key: bool = False) -> Optional[int]:
+        console_log = self.__get_logger__("inc_num")
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        try:
+            item = await self.__client__(redis_key).incr(redis_key, num)
+            await self.__notify_changed__(redis_key)
+            return item
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def dec_num(self, key: str, num: int = 1, is_full_key: bool = False) -> Optional[int]:
+        console_log = self.__get_logger__("dec_num")
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        try:
+            item = await self.__client__(redis_key).decr(redis_key, num)
+            await self.__notify_changed__(redis_key)
+            return item
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def inc_window(self, key: str, window: int, num: int = 1, is_full_key: bool = False) -> Optional[int]:
+        console_log = self.__get_logger__("inc_window")
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:Counter:{key}" if not is_full_key else key
+        try:
+            script = scripts.get("fixed_window", self.__client__(redis_key))
+            count, _ = await script(keys=[redis_key], args=[window * 1000, num])
+            return count
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def inc_sliding(
+            self, key: str, window: int, num: int = 1, limit: int = 0, is_full_key: bool = False
+    ) -> Optional[Tuple[bool, int]]:
+        console_log = self.__get_logger__("inc_sliding")
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:Counter:{key}" if not is_full_key else key
+        try:
+            count, allowed = await scripts.get("sliding_window", self.__client__(redis_key))(
+                keys=[redis_key], args=[window * 1000, num, limit])
+            return allowed == 1, count
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def take_token(
+            self, key: str, capacity: int, rate: float, num: int = 1, is_full_key: bool = False
+    ) -> Optional[Tuple[bool, int, int]]:
+        console_log = self.__get_logger__("take_token")
+        self.__check_bucket__(capacity, rate)
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:RateLimit:{key}" if not is_full_key else key
+        try:
+            allowed, remaining, retry_after = await scripts.get("token_bucket", self.__client__(redis_key))(
+                keys=[redis_key], args=[capacity, rate, num])
+            return allowed == 1, remaining, retry_after
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def pf_add(self, key: str, *values: Any, expiry: int = 0, is_full_key: bool = False) -> Optional[bool]:
+        console_log = self.__get_logger__("pf_add")
+        if key is None or len(key) <= 0 or len(values) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:HLL:{key}" if not is_full_key else key
+        try:
+            pipe = self.__client__(redis_key).pipeline(transaction=False)
+            pipe.pfadd(redis_key, *values)
+            if expiry > 0:
+                pipe.expire(redis_key, expiry)
+            return (await pipe.execute())[0] == 1
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def __pf_gather__(self, redis_keys: List[str], target: str) -> Tuple[Redis, List[str], List[str]]:
+        client: Redis = self.__client__(target)
+        local_keys: List[str] = []
+        temp_keys: List[str] = []
+        for shard, shard_keys in self.__group__(redis_keys):
+            if shard is client:
+                local_keys += shard_keys
+                continue
+            for redis_key, raw in zip(shard_keys, await shard.mget(shard_keys)):
+                if raw is None:
+                    continue
+                temp_key: str = f"{target}:__pf__:{uuid.uuid4().hex}"
+                await client.set(temp_key, raw, px=60000)
+                local_keys.append(temp_key)
+                temp_keys.append(temp_key)
+        return client, local_keys, temp_keys
+
+    async def pf_count(self, *keys: str, is_full_key: bool = False) -> int:
+        console_log = self.__get_logger__("pf_count")
+        keys = tuple(key for key in keys if key is not None and len(key) > 0)
+        if len(keys) <= 0:
+            return 0
+        redis_keys: List[str] = [f"{self.redis_key}:HLL:{key}" if not is_full_key else key for key in keys]
+        try:
+            client, local_keys, temp_keys = await self.__pf_gather__(redis_keys, redis_keys[0])
+            try:
+                return await client.pfcount(*local_keys) if len(local_keys) > 0 else 0
+            finally:
+                if len(temp_keys) > 0:
+                    await client.unlink(*temp_keys)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return 0
+
+    async def pf_merge(self, dest: str, *sources: str, expiry: int = 0, is_full_key: bool = False) -> bool:
+        console_log = self.__get_logger__("pf_merge")
+        sources = tuple(key for key in sources if key is not None and len(key) > 0)
+        if dest is None or len(dest) <= 0 or len(sources) <= 0:
+            return False
+        dest_key: str = f"{self.redis_key}:HLL:{dest}" if not is_full_key else dest
+        redis_keys: List[str] = [f"{self.redis_key}:HLL:{key}" if not is_full_key else key for key in sources]
+        try:
+            client, local_keys, temp_keys = await self.__pf_gather__(redis_keys, dest_key)
+            pipe = client.pipeline(transaction=False)
+            pipe.pfmerge(dest_key, *local_keys)
+            if expiry > 0:
+                pipe.expire(dest_key, expiry)
+            if len(temp_keys) > 0:
+                pipe.unlink(*temp_keys)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    async def rpop(self, key: str, is_full_key: bool = False) -> Optional[Any]:
+        console_log = self.__get_logger__("rpop")
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        try:
+            return decode(await self.__client__(redis_key).rpop(redis_key))
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    async def cache(
+            self, key: str, value: Optional[Any] = None, expiry: int = 0, is_full_key: bool = False,
+            is_pickle: bool = True, tags: Optional[List[str]] = None, codec: Optional[str] = None
+    ) -> Tuple[bool, Optional[Any]]:
+        console_log = self.__get_logger__("cache")
+        if key is None or len(key) <= 0:
+            return False, None
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        try:
+            if value is None:
+                # 读取
+                val: Optional[bytes] = None
+                is_hit: bool = False
+                if self.backend is not None:
+                    is_hit, val = self.__backend_get__(redis_key)
+                elif self.near_cache is not None:
+                    is_hit, val = self.near_cache.get(redis_key)
+                if not is_hit:
+                    if self.near_cache is None:
+                        val = await self.__client__(redis_key).get(redis_key)
+                    else:
+                        version: int = self.near_cache.version
+                        pipe = self.__client__(redis_key).pipeline(transaction=False)
+                        pipe.get(redis_key)
+                        pipe.pttl(redis_key)
+                        val, pttl = await pipe.execute()
+                        self.__near_set__(redis_key, val, pttl, version)
+                if val:
+                    return True, decode(val) if is_pickle else val.decode("utf-8")
+                return True, None
+            else:
+                # 写入
+                val = value if not is_pickle else self.__encode__(redis_key, value, codec)
+                pipes: PipelineGroup = self.__pipelines__()
+                overflow: List[str] = []
+                if self.backend is not None:
+                    overflow = self.__backend_write__(pipes, {redis_key: val}, expiry)
+                elif expiry > 0:
+                    pipes(redis_key).setex(redis_key, expiry, val)
+                else:
+                    pipes(redis_key).set(redis_key, val)
+                self.__tag_keys__(pipes, tags, expiry, redis_key)
+                if len(pipes) > 0:
+                    await pipes.execute_async()
+                if len(overflow) > 0 and not self.__backend_overflow__(overflow, expiry):
+                    return False, None
+                await self.__notify_changed__(redis_key)
+                return True, value
+        except CircuitOpenError as e:
+            console_log.debug(e)
+            if value is None:
+                return self.__fallback_get__(redis_key, is_pickle)
+            if self.__fallback_set__(redis_key, val, expiry):
+                return True, value
+            return False, None
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False, None
+
+    async def cache_many(
+            self, keys: List[str], is_full_key: bool = False, is_pickle: bool = True
+    ) -> Tuple[bool, Dict[str, Optional[Any]]]:
+        console_log = self.__get_logger__("cache_many")
+        keys = [key for key in keys if key is not None and len(key) > 0] if keys else []
+        if len(keys) <= 0:
+            return False, {}
+        redis_keys: List[str] = [f"{self.redis_key}:Cache:{key}" if not is_full_key else key for key in keys]
+        try:
+            values: Dict[str, Optional[bytes]] = {}
+            missing: List[str] = []
+            for redis_key in redis_keys:
+                is_hit: bool = False
+                if self.backend is not None:
+                    is_hit, values[redis_key] = self.__backend_get__(redis_key)
+                elif self.near_cache is not None:
+                    is_hit, values[redis_key] = self.near_cache.get(redis_key)
+                if not is_hit:
+                    missing.append(redis_key)
+            if len(missing) > 0:
+                version: Optional[int] = None if self.near_cache is None else self.near_cache.version
+                for client, shard_keys in self.__group__(missing):
+                    if self.near_cache is None:
+                        values.update(zip(shard_keys, await client.mget(shard_keys)))
+                        continue
+                    pipe = client.pipeline(transaction=False)
+                    pipe.mget(shard_keys)
+                    for redis_key in shard_keys:
+                        pipe.pttl(redis_key)
+                    shard_values, *pttls = await pipe.execute()
+                    for redis_key, val, pttl in zip(shard_keys, shard_values, pttls):
+                        values[redis_key] = val
+                        self.__near_set__(redis_key, val, pttl, version)
+            result: Dict[str, Optional[Any]] = {}
+            for key, redis_key in zip(keys, redis_keys):
+                val: Optional[bytes] = values.get(redis_key)
+                if not val:
+                    result[key] = None
+                    continue
+                result[key] = decode(val) if is_pickle else val.decode("utf-8")
+            return True, result
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False, {}
+
+    async def set_many(
+            self, mapping: Dict[str, Any], expiry: int = 0, is_full_key: bool = False, is_pickle: bool = True,
+            tags: Optional[List[str]] = None, codec: Optional[str] = None
+    ) -> bool:
+        console_log = self.__get_logger__("set_many")
+        if mapping is None or len(mapping) <= 0:
+            return False
+        items: Dict[str, Any] = {}
+        for key, value in mapping.items():
+            if key is None or len(key) <= 0 or value is None:
+                continue
+            redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+            items[redis_key] = value if not is_pickle else self.__encode__(redis_key, value, codec)
+        if len(items) <= 0:
+            return False
+        try:
+            pipes: PipelineGroup = self.__pipelines__()
+            overflow: List[str] = []
+            if self.backend is not None:
+                overflow = self.__backend_write__(pipes, items, expiry)
+            elif expiry > 0:
+                for redis_key, val in items.items():
+                    pipes(redis_key).setex(redis_key, expiry, val)
+            else:
+                for client, shard_keys in self.__group__(list(items.keys())):
+                    pipes.get(client).mset({redis_key: items[redis_key] for redis_key in shard_keys})
+            self.__tag_keys__(pipes, tags, expiry, *items.keys())
+            if len(pipes) > 0:
+                await pipes.execute_async()
+            if len(overflow) > 0 and not self.__backend_overflow__(overflow, expiry):
+                return False
+            await self.__notify_changed__(*items.keys())
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    async def remove_many(self, keys: List[str], is_full_key: bool = False) -> int:
+        console_log = self.__get_logger__("remove_many")
+        keys = [key for key in keys if key is not None and len(key) > 0] if keys else []
+        if len(keys) <= 0:
+            return 0
+        redis_keys: List[str] = [f"{self.redis_key}:Cache:{key}" if not is_full_key else key for key in keys]
+        try:
+            count: int = 0
+            if self.backend is not None:
+                count, in_redis = self.__backend_delete__(redis_keys)
+                if len(in_redis) > 0:
+                    for client, shard_keys in self.__group__(in_redis):
+                        await client.delete(*shard_keys)
+            else:
+                for client, shard_keys in self.__group__(redis_keys):
+                    count += await client.delete(*shard_keys)
+            await self.__notify_changed__(*redis_keys)
+            return count
+        except Exception as e:
+            console_log.debug(e)
+            return 0
+
+    async def remove_cache(self, key: str, is_full_key: bool = False):
+        await self.remove_many([key], is_full_key=is_full_key)
+
+    async def bulk_remove_cache(self, key: str, is_full_key: bool = False):
+        console_log = self.__get_logger__("bulk_remove_cache")
+        if key is None or len(key) <= 0:
+            return
+        redis_key: str = f"{self.redis_key}:Cache:{key}:*" if not is_full_key else key
+        try:
+            for client in self.__clients__():
+                batch: List[str] = []
+                async for _k in client.scan_iter(match=redis_key, count=SCAN_BATCH_SIZE):
+                    batch.append(str(_k, encoding="utf-8"))
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        await self.__unlink_keys__(batch, client)
+                        batch = []
+                if len(batch) > 0:
+                    await self.__unlink_keys__(batch, client)
+            if self.backend is not None:
+                self.backend.delete_pattern(redis_key)
+        except Exception as e:
+            console_log.debug(e)
+
+    async def pub(self, channel: str, message: Any) -> bool:
+        console_log = self.__get_logger__("pub")
+        try:
+            await self.client.publish(channel, pickle.dumps(message))
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    async def sub(self, channel: str) -> Optional[PubSub]:
+        console_log = self.__get_logger__("sub")
+        try:
+            pubsub = self.client.pubsub()
+            await pubsub.subscribe(channel)
+            return pubsub
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+import os
+import mmap
+import time
+import struct
+import fnmatch
+import hashlib
+import threading
+from typing import Optional, List, Dict
+from mio.util.Logs import LogHandler, get_logger
+
+SHM_MAGIC: bytes = b"MIOSHM01"
+# magic, 桶数, 每桶槽数, 槽大小
+SHM_HEADER = struct.Struct("<8sIII")
+SHM_HEADER_SIZE: int = 64
+# 状态(0空 1占用), key哈希, 过期时间(0为不过期), key长度, value长度
+SLOT_HEADER = struct.Struct("<B7xQdII")
+SLOT_EMPTY: int = 0
+SLOT_USED: int = 1
+# 值超过槽大小时写入redis，本机后端只保存这个标记
+OVERFLOW_MARKER: bytes = b"\x00MIO:QuickCache:overflow\x00"
+
+
+class CacheBackend(object):
+    """
+    QuickCache的键值存储后端，只负责cache/cache_many/set_many/remove这类键值读写
+    队列、计数器、发布订阅仍然使用redis
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, expiry: int = 0) -> bool:
+        raise NotImplementedError
+
+    def delete(self, *keys: str) -> int:
+        raise NotImplementedError
+
+    def keys(self, pattern: str) -> List[str]:
+        """
+        :param pattern: 与redis的SCAN MATCH相同的通配符
+        """
+        raise NotImplementedError
+
+    def delete_pattern(self, pattern: str) -> int:
+        return self.delete(*self.keys(pattern))
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class ShmBackend(CacheBackend):
+    """
+    单机多worker共享的内存哈希表，基于/dev/shm下的mmap文件
+    组相联结构：key按哈希落到固定的桶，桶内ways个槽，桶满时淘汰最早过期的槽
+    跨进程用fcntl字节范围锁，进程内再加线程锁(fcntl锁不区分线程)，锁按桶分段
+    """
+    path: str
+    buckets: int
+    ways: int
+    slot_size: int
+    stripes: int
+
+    def __init__(
+            self, path: str, buckets: int = 4096, ways: int = 8, slot_size: int = 4096, stripes: int = 256
+    ):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self.stripes = stripes
+        size: int = SHM_HEADER_SIZE + buckets * ways * slot_size
+        fd: int = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # 初始化文件时锁住整个文件，避免多个worker同时初始化
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < SHM_HEADER_SIZE:
+                os.ftruncate(fd, size)
+                os.pwrite(fd, SHM_HEADER.pack(SHM_MAGIC, buckets, ways, slot_size), 0)
+            magic, buckets, ways, slot_size = SHM_HEADER.unpack(os.pread(fd, SHM_HEADER.size, 0))
+            if magic != SHM_MAGIC:
+                raise ValueError(f"{path} is not a QuickCache shared memory file")
+            size = SHM_HEADER_SIZE + buckets * ways * slot_size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        # 以文件里记录的布局为准，多个worker的配置不一致时也不会写乱
+        self.buckets = buckets
+        self.ways = ways
+        self.slot_size = slot_size
+        self._fd = fd
+        self._mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(stripes)]
+
+    def __get_logger__(self, name: str) -> LogHandler:
+        return get_logger(f"{self.__class__.__name__}.{name}")
+
+    @staticmethod
+    def __key_hash__(key: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+    def __lock__(self, bucket: int):
+        stripe: int = bucket % self.stripes
+        self._locks[stripe].acquire()
+        self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX, 1, stripe)
+
+    def __unlock__(self, bucket: int):
+        stripe: int = bucket % self.stripes
+        self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN, 1, stripe)
+        self._locks[stripe].release()
+
+    def __slot_offset__(self, bucket: int, way: int) -> int:
+        return SHM_HEADER_SIZE + (bucket * self.ways + way) * self.slot_size
+
+    def __find__(self, bucket: int, key_hash: int, key: bytes, now: float) -> int:
+        """
+        :return: 命中的槽位置，未命中返回-1
+        """
+        for way in range(self.ways):
+            offset: int = self.__slot_offset__(bucket, way)
+            state, slot_hash, expire_at, key_len, val_len = SLOT_HEADER.unpack_from(self._mm, offset)
+            if state != SLOT_USED or slot_hash != key_hash:
+                continue
+            start: int = offset + SLOT_HEADER.size
+            if self._mm[start:start + key_len] != key:
+                continue
+            if 0 < expire_at <= now:
+                # 过期的顺手清掉
+                self._mm[offset] = SLOT_EMPTY
+                return -1
+            return offset
+        return -1
+
+    def get(self, key: str) -> Optional[bytes]:
+        key_bytes: bytes = key.encode("utf-8")
+        key_hash: int = self.__key_hash__(key_bytes)
+        bucket: int = key_hash % self.buckets
+        self.__lock__(bucket)
+        try:
+            offset: int = self.__find__(bucket, key_hash, key_bytes, time.time())
+            if offset < 0:
+                return None
+            _, _, _, key_len, val_len = SLOT_HEADER.unpack_from(self._mm, offset)
+            start: int = offset + SLOT_HEADER.size + key_len
+            return self._mm[start:start + val_len]
+        finally:
+            self.__unlock__(bucket)
+
+    def set(self, key: str, value: bytes, expiry: int = 0) -> bool:
+        console_log = self.__get_logger__("set")
+        key_bytes: bytes = key.encode("utf-8")
+        if SLOT_HEADER.size + len(key_bytes) + len(value) > self.slot_size:
+            console_log.debug(f"{key}: {len(value)} bytes exceeds the slot size {self.slot_size}")
+            # 旧值不能继续留在槽里
+            self.delete(key)
+            return False
+        key_hash: int = self.__key_hash__(key_bytes)
+        bucket: int = key_hash % self.buckets
+        now: float = time.time()
+        self.__lock__(bucket)
+        try:
+            offset: int = self.__find__(bucket, key_hash, key_bytes, now)
+            if offset < 0:
+                # 优先空槽和已过期的槽，否则淘汰最早过期的，不过期的槽最后淘汰
+                victim: Optional[int] = None
+                victim_expire: float = float("inf")
+                for way in range(self.ways):
+                    slot_offset: int = self.__slot_offset__(bucket, way)
+                    state, _, expire_at, _, _ = SLOT_HEADER.unpack_from(self._mm, slot_offset)
+                    if state != SLOT_USED or 0 < expire_at <= now:
+                        victim = slot_offset
+                        break
+                    rank: float = expire_at if expire_at > 0 else float("inf")
+                    if victim is None or rank < victim_expire:
+                        victim, victim_expire = slot_offset, rank
+                offset = victim
+            new_expire_at: float = now + expiry if expiry > 0 else 0
+            start: int = offset + SLOT_HEADER.size
+            self._mm[start:start + len(key_bytes)] = key_bytes
+            self._mm[start + len(key_bytes):start + len(key_bytes) + len(value)] = value
+            # 最后写槽头，状态位生效前数据已经完整
+            SLOT_HEADER.pack_into(self._mm, offset, SLOT_USED, key_hash, new_expire_at, len(key_bytes), len(value))
+            return True
+        finally:
+            self.__unlock__(bucket)
+
+    def delete(self, *keys: str) -> int:
+        count: int = 0
+        now: float = time.time()
+        for key in keys:
+            key_bytes: bytes = key.encode("utf-8")
+            key_hash: int = self.__key_hash__(key_bytes)
+            bucket: int = key_hash % self.buckets
+            self.__lock__(bucket)
+            try:
+                offset: int = self.__find__(bucket, key_hash, key_bytes, now)
+                if offset >= 0:
+                    self._mm[offset] = SLOT_EMPTY
+                    count += 1
+            finally:
+                self.__unlock__(bucket)
+        return count
+
+    def __scan__(self, pattern: str, remove: bool = False) -> List[str]:
+        """
+        逐个桶加锁遍历，返回匹配的key，remove为True时顺便删除
+        """
+        keys: List[str] = []
+        now: float = time.time()
+        for bucket in range(self.buckets):
+            self.__lock__(bucket)
+            try:
+                for way in range(self.ways):
+                    offset: int = self.__slot_offset__(bucket, way)
+                    state, _, expire_at, key_len, _ = SLOT_HEADER.unpack_from(self._mm, offset)
+                    if state != SLOT_USED or 0 < expire_at <= now:
+                        continue
+                    start: int = offset + SLOT_HEADER.size
+                    key: str = self._mm[start:start + key_len].decode("utf-8")
+                    if not fnmatch.fnmatchcase(key, pattern):
+                        continue
+                    if remove:
+                        self._mm[offset] = SLOT_EMPTY
+                    keys.append(key)
+            finally:
+                self.__unlock__(bucket)
+        return keys
+
+    def keys(self, pattern: str) -> List[str]:
+        return self.__scan__(pattern)
+
+    def delete_pattern(self, pattern: str) -> int:
+        return len(self.__scan__(pattern, remove=True))
+
+    def stats(self) -> Dict[str, int]:
+        used: int = 0
+        now: float = time.time()
+        for slot in range(self.buckets * self.ways):
+            state, _, expire_at, _, _ = SLOT_HEADER.unpack_from(self._mm, SHM_HEADER_SIZE + slot * self.slot_size)
+            if state == SLOT_USED and not 0 < expire_at <= now:
+                used += 1
+        return {"slots": self.buckets * self.ways, "used": used, "slot_size": self.slot_size}
+
+
+__backend__: Optional[CacheBackend] = None
+__backend_lock__ = threading.Lock()
+
+
+def get_backend(config: dict) -> Optional[CacheBackend]:
+    """
+    按QUICK_CACHE_BACKEND返回当前进程的存储后端，redis(默认)返回None，由QuickCache直接访问redis
+    """
+    global __backend__
+    name: str = str(config.get("QUICK_CACHE_BACKEND", "redis")).lower()
+    if name == "redis":
+        return None
+    if __backend__ is not None:
+        return __backend__
+    with __backend_lock__:
+        if __backend__ is None:
+            if name != "shm":
+                raise ValueError(f"Unknown QuickCache backend: {name}")
+            __backend__ = ShmBackend(
+                config.get("QUICK_CACHE_SHM_PATH") or f"/dev/shm/{config['REDIS_KEY_PREFIX']}.quickcache",
+                buckets=int(config.get("QUICK_CACHE_SHM_BUCKETS", 4096)),
+                ways=int(config.get("QUICK_CACHE_SHM_WAYS", 8)),
+                slot_size=int(config.get("QUICK_CACHE_SHM_SLOT_SIZE", 4096)))
+    return __backend__
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import hashlib
+import threading
+from flask import Flask
+from typing import Optional, Any, List, Tuple, Iterable
+from mio.util.Metrics import instrument
+from . import QuickCacheBase
+
+# redis字符串最大512MB，即2^32位
+MAX_BITS: int = 2 ** 32
+
+
+def bloom_size(capacity: int, error_rate: float) -> Tuple[int, int]:
+    """
+    按预计元素数和误判率计算位数m和哈希次数k
+    m = -n * ln(p) / ln(2)^2，k = m / n * ln(2)
+    """
+    bits: int = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    bits = min(max(bits, 8), MAX_BITS)
+    hashes: int = max(1, int(round(bits / capacity * math.log(2))))
+    return bits, hashes
+
+
+@instrument
+class BloomFilter(QuickCacheBase):
+    """
+    基于redis位图(BITFIELD，每个元素一条命令读写k个位)的布隆过滤器，用于事件去重等只需要判断“是否出现过”的场景
+    不存在一定准确，存在有error_rate的误判；位图大小约为 capacity * 1.44 * log2(1/error_rate) 位
+
+    位数和哈希次数在第一次创建时写入 {key}:meta，之后以redis中记录的为准，多个worker参数不一致时也不会错位
+    local_sync大于0时在进程内保存一份位图，本地命中直接返回，本地未命中(可能是其他worker新加的)再查redis
+    """
+    VERSION = "0.1.0"
+    bloom_key: str
+    bits: int
+    hashes: int
+    expiry: int
+    local_sync: float
+
+    def __init__(
+            self, name: str, capacity: int = 1000000, error_rate: float = 0.01, expiry: int = 0,
+            local_sync: float = 0, current_app: Optional[Flask] = None
+    ):
+        """
+        :param name: 过滤器名称，实际key为 {REDIS_KEY_PREFIX}:Bloom:{name}
+        :param capacity: 预计的元素个数，超出后误判率上升
+        :param error_rate: 期望的误判率
+        :param expiry: 过期时间(秒)，每次写入时刷新，0为不过期
+        :param local_sync: 进程内位图的刷新间隔(秒)，0为不使用本地位图
+        """
+        if current_app is None:
+            from flask import current_app
+        super().__init__(current_app, use_near_cache=False)
+        self.bloom_key = f"{self.redis_key}:Bloom:{name}"
+        self.expiry = expiry
+        self.local_sync = local_sync
+        self._local: Optional[bytearray] = None
+        self._local_at: float = 0.0
+        self._local_lock = threading.Lock()
+        self.bits, self.hashes = bloom_size(capacity, error_rate)
+        self.__load_meta__()
+
+    def __load_meta__(self):
+        console_log = self.__get_logger__("load_meta")
+        meta_key: str = f"{self.bloom_key}:meta"
+        try:
+            pipe = self.__client__(meta_key).pipeline(transaction=False)
+            pipe.hsetnx(meta_key, "bits", self.bits)
+            pipe.hsetnx(meta_key, "hashes", self.hashes)
+            pipe.hmget(meta_key, ["bits", "hashes"])
+            if self.expiry > 0:
+                pipe.expire(meta_key, self.expiry)
+            bits, hashes = pipe.execute()[2]
+            if bits is not None and hashes is not None:
+                self.bits, self.hashes = int(bits), int(hashes)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+
+    def __positions__(self, item: Any) -> List[int]:
+        # 双重哈希：g_i(x) = h1(x) + i * h2(x)，一次blake2b得到两个64位哈希
+        data: bytes = item if isinstance(item, bytes) else str(item).encode("utf-8")
+        digest: bytes = hashlib.blake2b(data, digest_size=16).digest()
+        h1: int = int.from_bytes(digest[:8], "little")
+        h2: int = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __local_contains__(self, positions: List[int]) -> bool:
+        """
+        redis的位偏移从每个字节的最高位开始
+        """
+        local: Optional[bytearray] = self.__local_bitmap__()
+        if local is None:
+            return False
+        for pos in positions:
+            idx: int = pos >> 3
+            if idx >= len(local) or not local[idx] & (0x80 >> (pos & 7)):
+                return False
+        return True
+
+    def __local_bitmap__(self) -> Optional[bytearray]:
+        if self.local_sync <= 0:
+            return None
+        now: float = time.monotonic()
+        if self._local is not None and now - self._local_at < self.local_sync:
+            return self._local
+        with self._local_lock:
+            if self._local is None or now - self._local_at >= self.local_sync:
+                self.sync()
+        return self._local
+
+    def __local_set__(self, positions: List[int]):
+        local: Optional[bytearray] = self._local
+        if local is None:
+            return
+        for pos in positions:
+            idx: int = pos >> 3
+            if idx < len(local):
+                local[idx] |= 0x80 >> (pos & 7)
+
+    def sync(self) -> bool:
+        """
+        从redis取回整个位图到进程内
+        """
+        console_log = self.__get_logger__("sync")
+        try:
+            bitmap: Optional[bytes] = self.__client__(self.bloom_key).get(self.bloom_key)
+            local: bytearray = bytearray((self.bits + 7) >> 3)
+            if bitmap:
+                local[:len(bitmap)] = bitmap[:len(local)]
+            self._local = local
+            self._local_at = time.monotonic()
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    def add(self, item: Any) -> bool:
+        """
+        :return: 是否是新元素(之前不存在)
+        """
+        result: List[bool] = self.add_many([item])
+        return result[0] if len(result) > 0 else False
+
+    def add_many(self, items: Iterable[Any]) -> List[bool]:
+        """
+        一个pipeline写入所有元素，每个元素一条BITFIELD设置k个位并返回旧值，任意一位原来为0即为新元素
+        """
+        console_log = self.__get_logger__("add_many")
+        items = list(items)
+        if len(items) <= 0:
+            return []
+        try:
+            pipe = self.__client__(self.bloom_key).pipeline(transaction=False)
+            all_positions: List[List[int]] = [self.__positions__(item) for item in items]
+            for positions in all_positions:
+                args: List[Any] = []
+                for pos in positions:
+                    args += ["SET", "u1", pos, 1]
+                pipe.execute_command("BITFIELD", self.bloom_key, *args)
+            if self.expiry > 0:
+                pipe.expire(self.bloom_key, self.expiry)
+            olds: List[List[int]] = pipe.execute()
+            result: List[bool] = []
+            for old, positions in zip(olds, all_positions):
+                result.append(0 in old)
+                self.__local_set__(positions)
+            return result
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return [False] * len(items)
+
+    def contains(self, item: Any) -> bool:
+        result: List[bool] = self.contains_many([item])
+        return result[0] if len(result) > 0 else False
+
+    def contains_many(self, items: Iterable[Any]) -> List[bool]:
+        console_log = self.__get_logger__("contains_many")
+        items = list(items)
+        result: List[bool] = [False] * len(items)
+        remote: List[Tuple[int, List[int]]] = []
+        for i, item in enumerate(items):
+            positions: List[int] = self.__positions__(item)
+            if self.__local_contains__(positions):
+                result[i] = True
+            else:
+                remote.append((i, positions))
+        if len(remote) <= 0:
+            return result
+        try:
+            pipe = self.__client__(self.bloom_key).pipeline(transaction=False)
+            for _, positions in remote:
+                args: List[Any] = []
+                for pos in positions:
+                    args += ["GET", "u1", pos]
+                pipe.execute_command("BITFIELD_RO", self.bloom_key, *args)
+            for (i, _), bits in zip(remote, pipe.execute()):
+                result[i] = 0 not in bits
+        except Exception as e:
+            self.__log_error__(console_log, e)
+        return result
+
+    def clear(self) -> bool:
+        console_log = self.__get_logger__("clear")
+        try:
+            meta_key: str = f"{self.bloom_key}:meta"
+            self.__client__(self.bloom_key).unlink(self.bloom_key)
+            self.__client__(meta_key).unlink(meta_key)
+            self._local = None
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    def info(self) -> dict:
+        return {
+            "key": self.bloom_key, "bits": self.bits, "hashes": self.hashes, "bytes": (self.bits + 7) >> 3,
+            "local": self._local is not None,
+        }
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import threading
+from typing import Optional, Any, List, Dict, Tuple
+
+BUFFER_ATTR: str = "_quick_cache_write_buffer"
+__connected__: bool = False
+__connect_lock__ = threading.Lock()
+
+
+class WriteBuffer(object):
+    """
+    一个请求内QuickCache的写入和删除，按调用顺序保存，请求结束时用一个pipeline写入
+    同一请求内再读这些key时直接从这里返回
+    """
+    owner: Any
+    ops: List[tuple]
+
+    def __init__(self, owner: Any):
+        """
+        :param owner: 负责flush的QuickCache
+        """
+        self.owner = owner
+        self.ops = []
+        self._values: Dict[str, Optional[bytes]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def set(self, redis_key: str, val: bytes, expiry: int = 0, tags: Optional[List[str]] = None):
+        self.ops.append(("set", redis_key, val, expiry, tags))
+        self._values[redis_key] = val
+
+    def delete(self, *redis_keys: str):
+        for redis_key in redis_keys:
+            self.ops.append(("delete", redis_key))
+            self._values[redis_key] = None
+
+    def get(self, redis_key: str) -> Tuple[bool, Optional[bytes]]:
+        """
+        :return: (是否在缓冲中, 值)，删除过的key返回(True, None)
+        """
+        if redis_key not in self._values:
+            return False, None
+        return True, self._values[redis_key]
+
+    def keys(self) -> List[str]:
+        return list(self._values.keys())
+
+
+def __flush_on_teardown__(sender, **extra):
+    from flask import g
+    buffer: Optional[WriteBuffer] = g.get(BUFFER_ATTR)
+    if buffer is not None:
+        buffer.owner.flush()
+
+
+def __connect__():
+    global __connected__
+    if __connected__:
+        return
+    with __connect_lock__:
+        if not __connected__:
+            # 信号可以在运行中连接，不受“首个请求之后不能再注册teardown_request”的限制
+            from flask import request_tearing_down
+            request_tearing_down.connect(__flush_on_teardown__, weak=False)
+            __connected__ = True
+
+
+def get_write_buffer(owner: Any, create: bool = True) -> Optional[WriteBuffer]:
+    """
+    当前请求的写缓冲，不在请求上下文中时返回None
+    """
+    from flask import g, has_request_context
+    if not has_request_context():
+        return None
+    buffer: Optional[WriteBuffer] = g.get(BUFFER_ATTR)
+    if buffer is None and create:
+        __connect__()
+        buffer = WriteBuffer(owner)
+        setattr(g, BUFFER_ATTR, buffer)
+    return buffer
+
+
+def take_write_buffer() -> Optional[WriteBuffer]:
+    from flask import g, has_request_context
+    if not has_request_context():
+        return None
+    return g.pop(BUFFER_ATTR, None)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import pickle
+from typing import Optional, Any, Tuple, Dict, Callable
+
+# 第一个字节为编码头
+# 0x80是pickle协议2+的PROTO操作码，不带头的旧值和默认的pickle值都走这里，保证新旧版本可以共存
+HEADER_PICKLE: int = 0x80
+CODEC_PICKLE: int = 0x01
+CODEC_ORJSON: int = 0x02
+CODEC_MSGPACK: int = 0x03
+COMPRESS_ZSTD: int = 0x10
+COMPRESS_LZ4: int = 0x20
+CODEC_MASK: int = 0x0F
+COMPRESS_MASK: int = 0x30
+
+CODEC_NAMES: Dict[str, int] = {
+    "pickle": CODEC_PICKLE,
+    "orjson": CODEC_ORJSON,
+    "msgpack": CODEC_MSGPACK,
+}
+COMPRESS_NAMES: Dict[str, int] = {
+    "zstd": COMPRESS_ZSTD,
+    "lz4": COMPRESS_LZ4,
+}
+
+
+def __orjson_dumps__(value: Any) -> bytes:
+    import orjson
+    return orjson.dumps(value)
+
+
+def __orjson_loads__(data: bytes) -> Any:
+    import orjson
+    return orjson.loads(data)
+
+
+def __msgpack_dumps__(value: Any) -> bytes:
+    import msgpack
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def __msgpack_loads__(data: bytes) -> Any:
+    import msgpack
+    return msgpack.unpackb(data, raw=False)
+
+
+def __zstd_compress__(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def __zstd_decompress__(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def __lz4_compress__(data: bytes) -> bytes:
+    import lz4.frame
+    return lz4.frame.compress(data)
+
+
+def __lz4_decompress__(data: bytes) -> bytes:
+    import lz4.frame
+    return lz4.frame.decompress(data)
+
+
+SERIALIZERS: Dict[int, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    CODEC_PICKLE: (pickle.dumps, pickle.loads),
+    CODEC_ORJSON: (__orjson_dumps__, __orjson_loads__),
+    CODEC_MSGPACK: (__msgpack_dumps__, __msgpack_loads__),
+}
+COMPRESSORS: Dict[int, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    COMPRESS_ZSTD: (__zstd_compress__, __zstd_decompress__),
+    COMPRESS_LZ4: (__lz4_compress__, __lz4_decompress__),
+}
+
+
+def parse_codec(spec: Optional[str]) -> Tuple[int, int]:
+    """
+    解析编码描述，格式为 序列化[+压缩]，例如：pickle、orjson+zstd、msgpack+lz4
+
+    :return: 序列化标识，压缩标识(0为不压缩)
+    """
+    if spec is None or len(spec) <= 0:
+        return CODEC_PICKLE, 0
+    temp = spec.strip().lower().split("+")
+    codec: Optional[int] = CODEC_NAMES.get(temp[0])
+    if codec is None:
+        raise ValueError(f"Unknown codec: {spec}")
+    compress: int = 0
+    if len(temp) > 1:
+        compress = COMPRESS_NAMES.get(temp[1], -1)
+        if compress < 0:
+            raise ValueError(f"Unknown compression: {spec}")
+    return codec, compress
+
+
+def encode(value: Any, spec: Optional[str] = None, threshold: int = 1024) -> bytes:
+    """
+    编码，只有数据大小超过threshold时才会压缩
+    """
+    codec, compress = parse_codec(spec)
+    data: bytes = SERIALIZERS[codec][0](value)
+    if compress > 0 and len(data) > threshold:
+        return bytes([codec | compress]) + COMPRESSORS[compress][0](data)
+    if codec == CODEC_PICKLE:
+        return data
+    return bytes([codec]) + data
+
+
+def decode(data: bytes) -> Any:
+    header: int = data[0]
+    if header == HEADER_PICKLE:
+        return pickle.loads(data)
+    codec: int = header & CODEC_MASK
+    compress: int = header & COMPRESS_MASK
+    if codec not in SERIALIZERS or (compress > 0 and compress not in COMPRESSORS):
+        raise ValueError(f"Unknown codec header: {header:#x}")
+    payload: bytes = data[1:]
+    if compress > 0:
+        payload = COMPRESSORS[compress][1](payload)
+    return SERIALIZERS[codec][1](payload)
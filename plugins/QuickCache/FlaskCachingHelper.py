@@ -1,7 +1,12 @@
 # -*- coding: UTF-8 -*-
-from typing import List
+import hashlib
+import functools
+import inspect
+from typing import List, Optional, Callable
 from mio.sys import redis_db
 
+SCAN_BATCH_SIZE: int = 500
+
 
 class FlaskCachingHelper(object):
     key_prefix: str
@@ -11,13 +16,111 @@ class FlaskCachingHelper(object):
         self.key_prefix = key_prefix
         self.flask_cache_prefix = flask_cache_prefix
 
+    def __index_key__(self, endpoint: str, view_args: Optional[dict] = None) -> str:
+        index_key: str = f"{self.flask_cache_prefix}{self.key_prefix}__index__:{endpoint}"
+        if view_args:
+            # url_for传入的参数和路由转换后的参数类型可能不同(如 "1" 和 1)，统一按字符串计算
+            args: str = repr(sorted((str(k), str(v)) for k, v in view_args.items()))
+            digest: str = hashlib.md5(args.encode("UTF-8")).hexdigest()
+            index_key = f"{index_key}:{digest}"
+        return index_key
+
+    def __make_cache_key__(self, query_string: bool) -> str:
+        from flask import request
+        cache_key: str = f"{self.key_prefix}{request.path}"
+        if query_string:
+            args: str = repr(sorted(request.args.items(multi=True)))
+            cache_key = f"{cache_key}:{hashlib.md5(args.encode('UTF-8')).hexdigest()}"
+        return cache_key
+
+    def __record__(self, cache_key: str, timeout: Optional[int]):
+        from flask import request, current_app
+        full_key: str = f"{self.flask_cache_prefix}{cache_key}"
+        if timeout is None:
+            # 与flask-caching一致，没有指定时使用CACHE_DEFAULT_TIMEOUT(默认300秒)，0为不过期
+            timeout = int(current_app.config.get("CACHE_DEFAULT_TIMEOUT", 300))
+        pipe = redis_db.pipeline(transaction=False)
+        for index_key in [
+            self.__index_key__(request.endpoint), self.__index_key__(request.endpoint, request.view_args)
+        ]:
+            pipe.sadd(index_key, full_key)
+            if timeout:
+                pipe.expire(index_key, timeout)
+        pipe.execute()
+
+    def cached(self, timeout: Optional[int] = None, query_string: bool = False) -> Callable:
+        """
+        缓存视图的装饰器，写入缓存时把key登记到按endpoint(以及endpoint+参数)划分的集合中
+        失效时用invalidate_endpoint直接取集合删除，不需要扫描keyspace
+        要求CACHE_KEY_PREFIX与flask_cache_prefix一致，且flask-caching与redis_db使用同一个redis
+
+        :param timeout: 缓存时间，为空时使用flask-caching的默认值
+        :param query_string: 是否把查询参数计入缓存key
+        """
+        def decorator(f: Callable) -> Callable:
+            if inspect.iscoroutinefunction(f):
+                @functools.wraps(f)
+                async def async_wrapper(*args, **kwargs):
+                    from mio.sys import cache
+                    cache_key: str = self.__make_cache_key__(query_string)
+                    rv = cache.get(cache_key)
+                    if rv is not None:
+                        return rv
+                    rv = await f(*args, **kwargs)
+                    cache.set(cache_key, rv, timeout=timeout)
+                    self.__record__(cache_key, timeout)
+                    return rv
+                return async_wrapper
+
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                from mio.sys import cache
+                cache_key: str = self.__make_cache_key__(query_string)
+                rv = cache.get(cache_key)
+                if rv is not None:
+                    return rv
+                rv = f(*args, **kwargs)
+                cache.set(cache_key, rv, timeout=timeout)
+                self.__record__(cache_key, timeout)
+                return rv
+            return wrapper
+        return decorator
+
+    def invalidate_endpoint(self, endpoint: str, **view_args) -> int:
+        """
+        删除cached装饰的视图缓存，不传view_args时删除该endpoint下的全部缓存
+
+        :param endpoint: 视图的endpoint，如 main.index
+        :return: 删除的key数量
+        """
+        index_key: str = self.__index_key__(endpoint, view_args)
+        keys: List[bytes] = list(redis_db.smembers(index_key))
+        if len(keys) <= 0:
+            return 0
+        # 缓存key可能和索引不在同一个节点上，不能放进脚本里删除
+        # 只从索引中移除这次取到的key，期间新登记的key留给下一次失效
+        pipe = redis_db.pipeline(transaction=False)
+        for i in range(0, len(keys), SCAN_BATCH_SIZE):
+            batch: List[bytes] = keys[i:i + SCAN_BATCH_SIZE]
+            pipe.unlink(*batch)
+            pipe.srem(index_key, *batch)
+        pipe.execute()
+        return len(keys)
+
     def redis_cached_delete(self, function_name: str, need_url_for: bool = True):
         search_key: str = f"{self.flask_cache_prefix}{self.key_prefix}*"
         if need_url_for:
             from flask import url_for
             function_name = url_for(function_name)
-        keys: List[bytes] = redis_db.keys(search_key)
-        for _key_ in keys:
+        # SCAN增量遍历，匹配到的key按批UNLINK，不再阻塞redis
+        batch: List[bytes] = []
+        for _key_ in redis_db.scan_iter(match=search_key, count=SCAN_BATCH_SIZE):
             url_key: str = _key_.decode("UTF-8")
-            if function_name in url_key:
-                redis_db.delete(url_key)
+            if function_name not in url_key:
+                continue
+            batch.append(_key_)
+            if len(batch) >= SCAN_BATCH_SIZE:
+                redis_db.unlink(*batch)
+                batch = []
+        if len(batch) > 0:
+            redis_db.unlink(*batch)
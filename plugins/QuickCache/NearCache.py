@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Any, Tuple, Dict, List
+from mio.util.Logs import LogHandler
+from mio.util.Helper import get_bool
+from .Shard import get_shard_urls
+
+INVALIDATE_CHANNEL: str = "{prefix}:Cache:__invalidate__"
+TRACKING_CHANNEL: str = "__redis__:invalidate"
+
+
+class NearCache(object):
+    """
+    进程内的L1缓存，LRU + TTL，只保存redis里的原始字节，避免调用方之间共享可变对象
+    """
+    max_size: int
+    ttl: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+    def __init__(self, max_size: int = 1024, ttl: int = 60):
+        self.max_size = max_size if max_size > 0 else 1024
+        self.ttl = ttl if ttl > 0 else 60
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._version = 0
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Optional[bytes]]:
+        now: float = time.monotonic()
+        with self._lock:
+            item: Optional[Tuple[float, bytes]] = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return False, None
+            expire_at, val = item
+            if expire_at <= now:
+                del self._items[key]
+                self.misses += 1
+                return False, None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return True, val
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def set(self, key: str, value: bytes, expiry: float = 0, version: Optional[int] = None):
+        """
+        写入L1
+
+        :param key: 完整的redis key
+        :param value: redis里的原始字节
+        :param expiry: redis里的过期时间(秒)，L1的存活时间不会超过它
+        :param version: 读取redis之前拿到的version，期间如果有失效通知则放弃写入，避免缓存旧值
+        """
+        ttl: float = self.ttl if expiry <= 0 else min(self.ttl, expiry)
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys: str):
+        with self._lock:
+            self._version += 1
+            for key in keys:
+                if self._items.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self.invalidations += len(self._items)
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class NearCacheInvalidator(object):
+    """
+    后台线程监听失效通知
+    pubsub：监听QuickCache自己发布的失效频道
+    tracking：使用redis 6+的CLIENT TRACKING BCAST，把通知重定向到订阅连接上
+    """
+    mode: str
+    channel: str
+    key_prefix: str
+
+    def __init__(self, client, near_cache: NearCache, key_prefix: str, mode: str = "pubsub"):
+        self._client = client
+        self._near_cache = near_cache
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.key_prefix = key_prefix
+        self.mode = "tracking" if mode == "tracking" else "pubsub"
+        self.channel = INVALIDATE_CHANNEL.format(prefix=key_prefix)
+        self.console_log = LogHandler(self.__class__.__name__)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.__run__, name=f"{self.__class__.__name__}-{os.getpid()}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def __run__(self):
+        while not self._stop.is_set():
+            try:
+                if self.mode == "tracking":
+                    self.__run_tracking__()
+                else:
+                    self.__run_pubsub__()
+            except Exception as e:
+                self.console_log.error(e)
+            # 连接断开期间可能错过通知，只能整体清空
+            self._near_cache.clear()
+            self._stop.wait(1)
+
+    def __run_pubsub__(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.channel)
+            while not self._stop.is_set():
+                msg: Optional[dict] = pubsub.get_message(timeout=1.0)
+                if msg is None:
+                    continue
+                self.__on_keys__(msg["data"])
+        finally:
+            pubsub.close()
+
+    def __run_tracking__(self):
+        pool = self._client.connection_pool
+        sub_conn = pool.connection_class(**pool.connection_kwargs)
+        track_conn = pool.connection_class(**pool.connection_kwargs)
+        try:
+            sub_conn.send_command("CLIENT", "ID")
+            client_id: int = sub_conn.read_response()
+            sub_conn.send_command("SUBSCRIBE", TRACKING_CHANNEL)
+            sub_conn.read_response()
+            track_conn.send_command(
+                "CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST", "PREFIX", f"{self.key_prefix}:")
+            track_conn.read_response()
+            while not self._stop.is_set():
+                if not sub_conn.can_read(timeout=1.0):
+                    continue
+                response: List[Any] = sub_conn.read_response()
+                if len(response) == 3 and response[0] == b"message":
+                    self.__on_keys__(response[2])
+        finally:
+            track_conn.disconnect()
+            sub_conn.disconnect()
+
+    def __on_keys__(self, data: Optional[Any]):
+        if data is None:
+            # FLUSHDB/FLUSHALL
+            self._near_cache.clear()
+            return
+        # pubsub模式下一条消息里的多个key用换行分隔
+        keys: List[Any] = data if isinstance(data, list) else data.split(b"\n")
+        self._near_cache.invalidate(*[
+            _k_.decode("utf-8") if isinstance(_k_, bytes) else str(_k_) for _k_ in keys
+        ])
+
+
+def get_near_cache_mode(config: dict) -> str:
+    """
+    tracking只能收到redis_db这一个实例上的失效通知，缓存分片到多个redis时改用pubsub
+    """
+    if len(get_shard_urls(config)) > 1:
+        return "pubsub"
+    return "tracking" if config.get("QUICK_CACHE_NEAR_MODE", "pubsub") == "tracking" else "pubsub"
+
+
+__near_cache__: Optional[NearCache] = None
+__near_cache_pid__: int = 0
+__near_cache_lock__ = threading.Lock()
+
+
+def get_near_cache(client, config: dict) -> Optional[NearCache]:
+    """
+    每个worker进程只有一个L1缓存和一个失效监听线程，fork之后会按pid重新创建
+    """
+    global __near_cache__, __near_cache_pid__
+    if not get_bool(config.get("QUICK_CACHE_NEAR_ENABLE", False)) or client is None:
+        return None
+    pid: int = os.getpid()
+    if __near_cache__ is not None and __near_cache_pid__ == pid:
+        return __near_cache__
+    with __near_cache_lock__:
+        if __near_cache__ is not None and __near_cache_pid__ == pid:
+            return __near_cache__
+        near_cache = NearCache(
+            max_size=int(config.get("QUICK_CACHE_NEAR_MAX_SIZE", 1024)),
+            ttl=int(config.get("QUICK_CACHE_NEAR_TTL", 60)))
+        invalidator = NearCacheInvalidator(
+            client, near_cache, config["REDIS_KEY_PREFIX"], get_near_cache_mode(config))
+        invalidator.start()
+        __near_cache__ = near_cache
+        __near_cache_pid__ = pid
+        return near_cache
+
+
+__fallback_cache__: Optional[NearCache] = None
+__fallback_cache_pid__: int = 0
+
+
+def get_fallback_cache(config: dict) -> Optional[NearCache]:
+    """
+    redis熔断时使用的进程内缓存，没有失效通知，只靠TTL过期
+    """
+    global __fallback_cache__, __fallback_cache_pid__
+    if not get_bool(config.get("QUICK_CACHE_BREAKER_FALLBACK", False)):
+        return None
+    pid: int = os.getpid()
+    with __near_cache_lock__:
+        if __fallback_cache__ is None or __fallback_cache_pid__ != pid:
+            __fallback_cache__ = NearCache(
+                max_size=int(config.get("QUICK_CACHE_NEAR_MAX_SIZE", 1024)),
+                ttl=int(config.get("QUICK_CACHE_NEAR_TTL", 60)))
+            __fallback_cache_pid__ = pid
+        return __fallback_cache__
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import os
+import queue
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Tuple, List, Dict, Callable
+from mio.sys import redis_db
+from mio.util.Logs import LogHandler, get_logger
+from .Codec import decode
+
+Message = Tuple[str, Any]
+
+
+class Subscription(object):
+    handler: Callable
+    is_batch: bool
+    is_async: bool
+
+    def __init__(self, handler: Callable, is_batch: bool = False):
+        self.handler = handler
+        self.is_batch = is_batch
+        self.is_async = inspect.iscoroutinefunction(handler)
+
+
+class PubSubDispatcher(object):
+    """
+    每个worker进程共用一个订阅连接和一个读取线程，按频道/模式分发给注册的处理函数
+    处理函数在线程池中执行，协程函数则投递到指定的事件循环上
+
+    用法：
+        dispatcher = get_dispatcher()
+
+        @dispatcher.on("news")
+        def on_news(channel, message): ...
+
+        @dispatcher.on("user:*", pattern=True, batch=True)
+        async def on_users(messages): ...
+
+        dispatcher.start()
+    """
+    VERSION = "0.1.0"
+    batch_size: int
+    max_workers: int
+
+    def __init__(self, batch_size: int = 100, max_workers: int = 4):
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._channels: Dict[str, List[Subscription]] = {}
+        self._patterns: Dict[str, List[Subscription]] = {}
+        self._pending: "queue.Queue[Tuple[bool, str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid: int = 0
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __get_logger__(self, name: str) -> LogHandler:
+        return get_logger(f"{self.__class__.__name__}.{name}")
+
+    def on(self, channel: str, pattern: bool = False, batch: bool = False):
+        """
+        注册处理函数的装饰器
+
+        :param channel: 频道名，pattern为True时为psubscribe的模式
+        :param batch: 为True时处理函数接收同一批次内的[(channel, message)]，否则逐条接收(channel, message)
+        """
+        def decorator(handler: Callable):
+            self.subscribe(channel, handler, pattern=pattern, batch=batch)
+            return handler
+        return decorator
+
+    def subscribe(self, channel: str, handler: Callable, pattern: bool = False, batch: bool = False):
+        registry: Dict[str, List[Subscription]] = self._patterns if pattern else self._channels
+        with self._lock:
+            is_new: bool = channel not in registry
+            registry.setdefault(channel, []).append(Subscription(handler, is_batch=batch))
+        if is_new:
+            # 由读取线程执行订阅，PubSub对象只在一个线程里使用
+            self._pending.put((pattern, channel))
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        启动读取线程，fork之后的子进程里再次调用会重新建立连接
+
+        :param loop: 协程处理函数运行的事件循环，不传时在线程池里用asyncio.run执行
+        """
+        pid: int = os.getpid()
+        if loop is not None:
+            self._loop = loop
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"{self.__class__.__name__}-{pid}")
+            # 已注册的频道在读取线程建立连接时统一订阅
+            self._pending = queue.Queue()
+            self._thread = threading.Thread(
+                target=self.__run__, name=f"{self.__class__.__name__}-{pid}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def __run__(self):
+        console_log = self.__get_logger__("run")
+        while not self._stop.is_set():
+            pubsub = redis_db.pubsub(ignore_subscribe_messages=True)
+            try:
+                with self._lock:
+                    channels: List[str] = list(self._channels.keys())
+                    patterns: List[str] = list(self._patterns.keys())
+                if len(channels) > 0:
+                    pubsub.subscribe(*channels)
+                if len(patterns) > 0:
+                    pubsub.psubscribe(*patterns)
+                while not self._stop.is_set():
+                    self.__apply_pending__(pubsub)
+                    messages: List[dict] = []
+                    msg: Optional[dict] = pubsub.get_message(timeout=1.0)
+                    while msg is not None:
+                        messages.append(msg)
+                        if len(messages) >= self.batch_size:
+                            break
+                        msg = pubsub.get_message(timeout=0)
+                    if len(messages) > 0:
+                        self.__dispatch__(messages)
+            except Exception as e:
+                console_log.error(e)
+                self._stop.wait(1)
+            finally:
+                pubsub.close()
+
+    def __apply_pending__(self, pubsub):
+        while True:
+            try:
+                pattern, channel = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if pattern:
+                pubsub.psubscribe(channel)
+            else:
+                pubsub.subscribe(channel)
+
+    def __dispatch__(self, messages: List[dict]):
+        console_log = self.__get_logger__("dispatch")
+        # 先整批解码，再按订阅分组，每个处理函数每批只提交一次任务
+        batches: Dict[int, Tuple[Subscription, List[Message]]] = {}
+        with self._lock:
+            for msg in messages:
+                channel: str = msg["channel"].decode("utf-8")
+                try:
+                    data: Any = decode(msg["data"])
+                except Exception as e:
+                    console_log.error(f"{channel}: {e}")
+                    continue
+                subs: List[Subscription] = self._channels.get(channel, []) if msg["type"] == "message" \
+                    else self._patterns.get(msg["pattern"].decode("utf-8"), [])
+                for sub in subs:
+                    batches.setdefault(id(sub), (sub, []))[1].append((channel, data))
+        for sub, items in batches.values():
+            if sub.is_async and self._loop is not None:
+                asyncio.run_coroutine_threadsafe(self.__run_async__(sub, items), self._loop)
+            else:
+                self._executor.submit(self.__run_sync__, sub, items)
+
+    def __run_sync__(self, sub: Subscription, items: List[Message]):
+        if sub.is_async:
+            asyncio.run(self.__run_async__(sub, items))
+            return
+        console_log = self.__get_logger__("handler")
+        try:
+            if sub.is_batch:
+                sub.handler(items)
+                return
+            for channel, data in items:
+                sub.handler(channel, data)
+        except Exception as e:
+            console_log.error(e, exc_info=True)
+
+    async def __run_async__(self, sub: Subscription, items: List[Message]):
+        console_log = self.__get_logger__("handler")
+        try:
+            if sub.is_batch:
+                await sub.handler(items)
+                return
+            for channel, data in items:
+                await sub.handler(channel, data)
+        except Exception as e:
+            console_log.error(e, exc_info=True)
+
+
+__dispatcher__: Optional[PubSubDispatcher] = None
+
+
+def get_dispatcher() -> PubSubDispatcher:
+    """
+    进程内唯一的分发器，处理函数可以在fork之前注册，在worker里调用start()
+    """
+    global __dispatcher__
+    if __dispatcher__ is None:
+        __dispatcher__ = PubSubDispatcher()
+    return __dispatcher__
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import math
+import inspect
+import functools
+from typing import Optional, Tuple, Callable
+
+
+def __default_key__() -> str:
+    from flask import request, current_app
+    from mio.util.Helper import get_bool, get_real_ip
+    client: str = request.remote_addr or "-"
+    if get_bool(current_app.config.get("QUICK_CACHE_RATE_LIMIT_TRUST_PROXY", False)):
+        # 只有部署在反向代理后面时才信任转发头，X-Forwarded-For取代理追加的最后一个地址
+        client = get_real_ip(idx=-1, show_all=True) or client
+    return f"{request.endpoint}:{client}"
+
+
+def __limited__(capacity: int, result: Optional[Tuple[bool, int, int]]):
+    from flask import make_response
+    if result is None:
+        # redis不可用时放行，限流不能成为新的故障点
+        return None
+    allowed, remaining, retry_after = result
+    if allowed:
+        return None
+    response = make_response("Too Many Requests", 429)
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after / 1000)))
+    response.headers["X-RateLimit-Limit"] = str(capacity)
+    response.headers["X-RateLimit-Remaining"] = str(remaining)
+    return response
+
+
+def rate_limit(
+        capacity: int, rate: float, key_func: Optional[Callable[[], str]] = None, cost: int = 1
+) -> Callable:
+    """
+    基于令牌桶的视图限流装饰器，每次检查为一次EVALSHA，超出时返回429
+
+        @main.route("/api/search")
+        @rate_limit(capacity=20, rate=5)
+        async def search(): ...
+
+    :param capacity: 桶容量，即允许的突发请求数
+    :param rate: 每秒补充的令牌数，即长期的平均速率
+    :param key_func: 生成限流key的函数，默认为 endpoint:客户端地址
+    :param cost: 每个请求消耗的令牌数
+    :raises ValueError: capacity或rate不大于0
+    """
+    from . import QuickCacheBase
+    QuickCacheBase.__check_bucket__(capacity, rate)
+
+    def decorator(f: Callable) -> Callable:
+        if inspect.iscoroutinefunction(f):
+            @functools.wraps(f)
+            async def async_wrapper(*args, **kwargs):
+                from . import QuickCache
+                key: str = key_func() if key_func is not None else __default_key__()
+                response = __limited__(capacity, QuickCache().take_token(key, capacity, rate, cost))
+                if response is not None:
+                    return response
+                return await f(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            from . import QuickCache
+            key: str = key_func() if key_func is not None else __default_key__()
+            response = __limited__(capacity, QuickCache().take_token(key, capacity, rate, cost))
+            if response is not None:
+                return response
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
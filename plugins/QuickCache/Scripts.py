@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import threading
+from weakref import WeakKeyDictionary
+from typing import Optional, Any, Dict
+
+# 比较token后删除，只释放自己持有的锁
+RELEASE_LOCK: str = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+# 把key加入标签集合，集合的过期时间取成员中最长的：已有更长或永久的过期时间时不缩短，成员不过期时集合也不过期
+# ARGV: 成员的过期秒数(<=0为不过期), 成员key...
+TAG_KEYS: str = """
+local existed = redis.call("EXISTS", KEYS[1])
+for i = 2, #ARGV, 1000 do
+    redis.call("SADD", KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+local expiry = math.ceil(tonumber(ARGV[1]))
+if expiry <= 0 then
+    redis.call("PERSIST", KEYS[1])
+    return 0
+end
+local ttl = redis.call("TTL", KEYS[1])
+if existed == 0 or (ttl >= 0 and ttl < expiry) then
+    redis.call("EXPIRE", KEYS[1], expiry)
+end
+return 1
+"""
+
+# 固定窗口计数：窗口内第一次计数时设置过期时间
+# ARGV: 窗口毫秒数, 增量；返回 {计数, 剩余毫秒}
+FIXED_WINDOW: str = """
+local count = redis.call("INCRBY", KEYS[1], ARGV[2])
+local ttl = redis.call("PTTL", KEYS[1])
+if ttl < 0 then
+    redis.call("PEXPIRE", KEYS[1], ARGV[1])
+    ttl = tonumber(ARGV[1])
+end
+return {count, ttl}
+"""
+
+# 滑动窗口计数：hash里只保存当前和上一个窗口的计数，按时间比例加权估算，内存占用固定
+# ARGV: 窗口毫秒数, 增量, 上限(0为不限制)；返回 {估算计数, 是否计入}
+SLIDING_WINDOW: str = """
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local amount = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local current = math.floor(now / window)
+local counts = redis.call("HMGET", KEYS[1], tostring(current - 1), tostring(current))
+local previous = tonumber(counts[1]) or 0
+local estimated = previous * (1 - (now % window) / window) + (tonumber(counts[2]) or 0)
+if limit > 0 and estimated + amount > limit then
+    return {math.floor(estimated), 0}
+end
+redis.call("HINCRBY", KEYS[1], tostring(current), amount)
+if redis.call("HLEN", KEYS[1]) > 2 then
+    for _, field in ipairs(redis.call("HKEYS", KEYS[1])) do
+        if tonumber(field) < current - 1 then
+            redis.call("HDEL", KEYS[1], field)
+        end
+    end
+end
+redis.call("PEXPIRE", KEYS[1], window * 2)
+return {math.floor(estimated + amount), 1}
+"""
+
+# 令牌桶：按上次取令牌到现在的时间补充令牌，时间取自redis，多个worker之间不受时钟偏差影响
+# ARGV: 桶容量, 每秒补充的令牌数, 本次取的令牌数；返回 {是否通过, 剩余令牌, 需要等待的毫秒数}
+TOKEN_BUCKET: str = """
+local t = redis.call("TIME")
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= requested then
+    tokens = tokens - requested
+    allowed = 1
+else
+    retry_after = math.ceil((requested - tokens) / rate * 1000)
+end
+redis.call("HSET", KEYS[1], "tokens", string.format("%.6f", tokens), "ts", string.format("%.6f", now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, math.floor(tokens), retry_after}
+"""
+
+
+class ScriptRegistry(object):
+    """
+    服务端脚本的登记表，按客户端缓存redis-py的Script对象
+    Script调用时走EVALSHA，服务端没有缓存(重启、SCRIPT FLUSH)时自动SCRIPT LOAD后重试
+    同步的redis_db和异步的Redis客户端都可以使用
+    """
+    _sources: Dict[str, str]
+
+    def __init__(self):
+        self._sources = {}
+        self._scripts: "WeakKeyDictionary[Any, Dict[str, Any]]" = WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, source: str):
+        with self._lock:
+            self._sources[name] = source
+            for scripts in self._scripts.values():
+                scripts.pop(name, None)
+
+    def get(self, name: str, client: Optional[Any] = None) -> Any:
+        """
+        :param name: 登记时的脚本名称
+        :param client: redis客户端，默认为redis_db
+        :return: 可直接调用的Script，如 script(keys=[...], args=[...])
+        """
+        if client is None:
+            from mio.sys import redis_db
+            client = redis_db
+        scripts: Optional[Dict[str, Any]] = self._scripts.get(client)
+        if scripts is not None and name in scripts:
+            return scripts[name]
+        with self._lock:
+            scripts = self._scripts.setdefault(client, {})
+            if name not in scripts:
+                scripts[name] = client.register_script(self._sources[name])
+            return scripts[name]
+
+    def load(self, client: Optional[Any] = None) -> Dict[str, str]:
+        """
+        预先把全部脚本SCRIPT LOAD到服务端(同步客户端)，返回 {名称: sha1}
+        """
+        if client is None:
+            from mio.sys import redis_db
+            client = redis_db
+        return {name: client.script_load(source) for name, source in list(self._sources.items())}
+
+
+scripts = ScriptRegistry()
+scripts.register("release_lock", RELEASE_LOCK)
+scripts.register("fixed_window", FIXED_WINDOW)
+scripts.register("sliding_window", SLIDING_WINDOW)
+scripts.register("token_bucket", TOKEN_BUCKET)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import bisect
+import hashlib
+import threading
+from typing import Optional, Any, List, Dict, Tuple, Callable
+from mio.util.Logs import LogHandler, get_logger
+
+# 每个节点在环上的虚拟节点数，越多分布越均匀
+VIRTUAL_NODES: int = 160
+
+
+def hash_tag(key: str) -> str:
+    """
+    与Redis Cluster相同的hash tag规则：key中第一对{}里的非空内容参与哈希，可以让相关的key落在同一个分片
+    """
+    start: int = key.find("{")
+    if start >= 0:
+        end: int = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def __point__(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing(object):
+    """
+    一致性哈希环，节点按名称(通常是URL)定位，增减节点时只有约1/N的key需要迁移
+    """
+    nodes: List[str]
+
+    def __init__(self, nodes: List[str], vnodes: int = VIRTUAL_NODES):
+        self.nodes = list(nodes)
+        ring: List[Tuple[int, int]] = sorted(
+            (__point__(f"{node}#{i}"), idx) for idx, node in enumerate(self.nodes) for i in range(vnodes))
+        self._points: List[int] = [point for point, _ in ring]
+        self._owners: List[int] = [idx for _, idx in ring]
+
+    def node_for(self, key: str) -> int:
+        """
+        :return: 节点在nodes中的下标
+        """
+        pos: int = bisect.bisect(self._points, __point__(hash_tag(key)))
+        return self._owners[pos % len(self._owners)]
+
+
+class PipelineGroup(object):
+    """
+    按客户端分组的pipeline，只有一个分片时就是一个普通的pipeline
+    """
+
+    def __init__(self, resolve: Callable[[str], Any], transaction: bool = False):
+        """
+        :param resolve: 由key得到所在分片客户端的函数
+        """
+        self._resolve = resolve
+        self._transaction = transaction
+        self._pipes: Dict[int, Any] = {}
+
+    def get(self, client: Any) -> Any:
+        pipe: Any = self._pipes.get(id(client))
+        if pipe is None:
+            pipe = client.pipeline(transaction=self._transaction)
+            self._pipes[id(client)] = pipe
+        return pipe
+
+    def __call__(self, key: str) -> Any:
+        return self.get(self._resolve(key))
+
+    def __len__(self) -> int:
+        return sum([len(pipe) for pipe in self._pipes.values()])
+
+    def execute(self) -> List[Any]:
+        results: List[Any] = []
+        for pipe in self._pipes.values():
+            if len(pipe) > 0:
+                results += pipe.execute()
+        return results
+
+    async def execute_async(self) -> List[Any]:
+        results: List[Any] = []
+        for pipe in self._pipes.values():
+            if len(pipe) > 0:
+                results += await pipe.execute()
+        return results
+
+
+class ShardRouter(object):
+    """
+    QuickCache的键值分片，按一致性哈希把key分配到QUICK_CACHE_REDIS_URLS中的各个redis
+    只负责缓存数据，发布订阅、L1失效通知、StreamQueue等仍然使用redis_db
+    """
+    urls: List[str]
+    clients: List[Any]
+    ring: HashRing
+
+    def __init__(self, urls: List[str], clients: List[Any]):
+        self.urls = list(urls)
+        self.clients = list(clients)
+        self.ring = HashRing(self.urls)
+
+    def __get_logger__(self, name: str) -> LogHandler:
+        return get_logger(f"{self.__class__.__name__}.{name}")
+
+    def client_for(self, key: str) -> Any:
+        return self.clients[self.ring.node_for(key)]
+
+    def group(self, keys: List[str]) -> List[Tuple[Any, List[str]]]:
+        """
+        按分片分组，组内保持传入的顺序
+        """
+        groups: Dict[int, List[str]] = {}
+        for key in keys:
+            groups.setdefault(self.ring.node_for(key), []).append(key)
+        return [(self.clients[idx], group) for idx, group in groups.items()]
+
+    def report(self, match: str = "*", new_urls: Optional[List[str]] = None, limit: int = 0) -> Dict[str, Any]:
+        """
+        再平衡报告：逐个分片SCAN，统计每个分片的key数量、不在当前环所属分片上的key，
+        以及换成new_urls后需要迁移的key
+
+        :param match: SCAN的匹配模式，如 PYMIO:Cache:*
+        :param new_urls: 计划调整后的URL列表，为空时不计算迁移量
+        :param limit: 每个分片最多扫描的key数量，0为不限制
+        """
+        console_log = self.__get_logger__("report")
+        new_ring: Optional[HashRing] = HashRing(new_urls) if new_urls else None
+        shards: List[Dict[str, Any]] = []
+        total: int = 0
+        for idx, client in enumerate(self.clients):
+            scanned: int = 0
+            misplaced: int = 0
+            moving: int = 0
+            try:
+                for key in client.scan_iter(match=match, count=500):
+                    key = key.decode("utf-8") if isinstance(key, bytes) else key
+                    scanned += 1
+                    if self.ring.node_for(key) != idx:
+                        misplaced += 1
+                    if new_ring is not None and new_ring.nodes[new_ring.node_for(key)] != self.urls[idx]:
+                        moving += 1
+                    if 0 < limit <= scanned:
+                        break
+            except Exception as e:
+                console_log.error(f"{self.urls[idx]}: {e}")
+            total += scanned
+            shards.append({"url": self.urls[idx], "keys": scanned, "misplaced": misplaced, "moving": moving})
+        for shard in shards:
+            shard["ratio"] = round(shard["keys"] / total, 4) if total > 0 else 0.0
+        return {"total": total, "shards": shards}
+
+
+__shard_router__: Optional[ShardRouter] = None
+__shard_lock__ = threading.Lock()
+
+
+def get_shard_urls(config: dict) -> List[str]:
+    urls: Any = config.get("QUICK_CACHE_REDIS_URLS") or []
+    if isinstance(urls, str):
+        urls = [url.strip() for url in urls.split(",")]
+    return [url for url in urls if len(url) > 0]
+
+
+def get_shard_router(config: dict) -> Optional[ShardRouter]:
+    """
+    配置了多个QUICK_CACHE_REDIS_URLS时返回分片路由，否则返回None，由QuickCache直接使用redis_db
+    连接池参数、熔断与redis_db相同，每个分片各自一个熔断器
+    """
+    global __shard_router__
+    urls: List[str] = get_shard_urls(config)
+    if len(urls) <= 1:
+        return None
+    if __shard_router__ is not None:
+        return __shard_router__
+    with __shard_lock__:
+        if __shard_router__ is None:
+            from mio.util.Helper import get_bool
+            from mio.sys.RedisPool import PooledRedis, get_pool_kwargs, get_redis_breaker
+            clients: List[Any] = []
+            for idx, url in enumerate(urls):
+                kwargs: Dict[str, Any] = get_pool_kwargs(dict(config, REDIS_URL=url))
+                if get_bool(config.get("REDIS_BREAKER_ENABLE", False)):
+                    kwargs["breaker"] = get_redis_breaker(config, f"redis-shard-{idx}")
+                clients.append(PooledRedis.from_url(url, **kwargs))
+            __shard_router__ = ShardRouter(urls, clients)
+    return __shard_router__
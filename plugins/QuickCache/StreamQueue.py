@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import threading
+from flask import Flask
+from typing import Optional, Any, Tuple, List, Callable
+from mio.sys import redis_db
+from mio.util.Metrics import instrument
+from . import QuickCacheBase
+from .Codec import decode
+
+StreamItem = Tuple[str, Any]
+
+
+@instrument
+class StreamQueue(QuickCacheBase):
+    """
+    基于Redis Streams的工作队列，消费组 + ACK，至少一次投递
+    消费者崩溃后未ACK的消息会留在PEL中，由reclaim或consume按空闲时间认领重新处理
+    """
+    VERSION = "0.1.0"
+    stream_key: str
+    group: str
+    consumer: str
+    maxlen: int
+    codec_spec: Optional[str]
+
+    def __init__(
+            self, name: str, group: str = "default", consumer: Optional[str] = None, maxlen: int = 100000,
+            codec: Optional[str] = None, current_app: Optional[Flask] = None
+    ):
+        """
+        :param name: 队列名称，实际key为 {REDIS_KEY_PREFIX}:Stream:{name}
+        :param group: 消费组名称
+        :param consumer: 消费者名称，默认为 主机名-pid
+        :param maxlen: 队列的近似最大长度，超出后由XADD按MAXLEN ~裁剪
+        :param codec: 消息编码，为空时按QuickCache的编码设置
+        """
+        if current_app is None:
+            from flask import current_app
+        super().__init__(current_app, use_near_cache=False)
+        self.stream_key = f"{self.redis_key}:Stream:{name}"
+        self.group = group
+        self.consumer = consumer if consumer else f"{socket.gethostname()}-{os.getpid()}"
+        self.maxlen = maxlen
+        self.codec_spec = codec
+        # XAUTOCLAIM的游标，每次从上次停下的位置继续扫描PEL，服务端返回0-0时回到开头
+        self._reclaim_cursor = "0-0"
+        self.ensure_group()
+
+    def ensure_group(self) -> bool:
+        console_log = self.__get_logger__("ensure_group")
+        try:
+            redis_db.xgroup_create(self.stream_key, self.group, id="0", mkstream=True)
+            return True
+        except Exception as e:
+            if "BUSYGROUP" in str(e):
+                return True
+            self.__log_error__(console_log, e)
+            return False
+
+    def __fields__(self, value: Any) -> dict:
+        return {"d": self.__encode__(self.stream_key, value, self.codec_spec)}
+
+    @staticmethod
+    def __items__(entries: Optional[List[Any]]) -> List[StreamItem]:
+        items: List[StreamItem] = []
+        for entry_id, fields in entries or []:
+            if fields is None:
+                # 已经被裁剪掉的消息
+                continue
+            entry_id = entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id
+            items.append((entry_id, decode(fields[b"d"])))
+        return items
+
+    def push(self, value: Any) -> Optional[str]:
+        console_log = self.__get_logger__("push")
+        try:
+            entry_id = redis_db.xadd(self.stream_key, self.__fields__(value), maxlen=self.maxlen, approximate=True)
+            return entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    def push_many(self, values: List[Any]) -> List[str]:
+        console_log = self.__get_logger__("push_many")
+        if values is None or len(values) <= 0:
+            return []
+        try:
+            pipe = redis_db.pipeline(transaction=False)
+            for value in values:
+                pipe.xadd(self.stream_key, self.__fields__(value), maxlen=self.maxlen, approximate=True)
+            return [
+                entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id for entry_id in pipe.execute()
+            ]
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return []
+
+    def read(self, count: int = 100, block: Optional[int] = 1000) -> List[StreamItem]:
+        """
+        读取一批新消息
+
+        :param count: 每批最多读取的数量
+        :param block: 没有消息时阻塞等待的毫秒数，None为不阻塞
+        """
+        console_log = self.__get_logger__("read")
+        try:
+            response = redis_db.xreadgroup(
+                self.group, self.consumer, {self.stream_key: ">"}, count=count, block=block)
+            if not response:
+                return []
+            return self.__items__(response[0][1])
+        except Exception as e:
+            if "NOGROUP" in str(e):
+                # 队列被删除后重建消费组
+                self.ensure_group()
+            self.__log_error__(console_log, e)
+            return []
+
+    def ack(self, *ids: str) -> int:
+        console_log = self.__get_logger__("ack")
+        if len(ids) <= 0:
+            return 0
+        try:
+            return redis_db.xack(self.stream_key, self.group, *ids)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return 0
+
+    def reclaim(self, min_idle_time: int = 60000, count: int = 100) -> List[StreamItem]:
+        """
+        认领空闲超过min_idle_time毫秒、仍未ACK的消息，通常是其他消费者崩溃前读到的
+        PEL较大时每次只扫描一段，多次调用后覆盖整个PEL
+        """
+        console_log = self.__get_logger__("reclaim")
+        try:
+            response = redis_db.xautoclaim(
+                self.stream_key, self.group, self.consumer, min_idle_time, start_id=self._reclaim_cursor, count=count)
+            cursor = response[0]
+            self._reclaim_cursor = cursor.decode("utf-8") if isinstance(cursor, bytes) else cursor
+            return self.__items__(response[1])
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return []
+
+    def pending(self) -> dict:
+        console_log = self.__get_logger__("pending")
+        try:
+            return redis_db.xpending(self.stream_key, self.group)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return {}
+
+    def length(self) -> int:
+        console_log = self.__get_logger__("length")
+        try:
+            return redis_db.xlen(self.stream_key)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return 0
+
+    def consume(
+            self, handler: Callable[[List[StreamItem]], Optional[List[str]]], batch_size: int = 100,
+            block: int = 1000, reclaim_idle_time: int = 60000, stop_event: Optional[threading.Event] = None,
+            max_batches: int = 0
+    ) -> int:
+        """
+        按批处理消息，直到stop_event被设置或处理了max_batches批
+        每批先认领超时未ACK的消息，再读取新消息
+
+        :param handler: 处理函数，参数为[(id, value)]，返回需要ACK的id列表，返回None则ACK整批；抛出异常则整批不ACK
+        :return: ACK的消息数量
+        """
+        console_log = self.__get_logger__("consume")
+        acked: int = 0
+        batches: int = 0
+        while stop_event is None or not stop_event.is_set():
+            items: List[StreamItem] = self.reclaim(reclaim_idle_time, batch_size) if reclaim_idle_time > 0 else []
+            if len(items) < batch_size:
+                items += self.read(batch_size - len(items), block=None if len(items) > 0 else block)
+            if len(items) > 0:
+                try:
+                    ids: Optional[List[str]] = handler(items)
+                    acked += self.ack(*([item[0] for item in items] if ids is None else ids))
+                except Exception as e:
+                    console_log.error(e, exc_info=True)
+            batches += 1
+            if 0 < max_batches <= batches:
+                break
+        return acked
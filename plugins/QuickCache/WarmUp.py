@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import time
+import uuid
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask
+from typing import Optional, Any, List, Dict, Callable, Iterable
+from mio.util.Logs import LogHandler, get_logger
+from .Codec import encode
+from .Scripts import scripts
+
+
+class WarmEntry(object):
+    """
+    一个可预热的key，key中可以带{参数}，由params返回每组参数
+    """
+    key: str
+    producer: Callable
+    params: Optional[Callable[[], Iterable[dict]]]
+    expiry: int
+    codec: Optional[str]
+    tags: Optional[List[str]]
+
+    def __init__(
+            self, key: str, producer: Callable, params: Optional[Callable[[], Iterable[dict]]] = None,
+            expiry: int = 0, codec: Optional[str] = None, tags: Optional[List[str]] = None
+    ):
+        self.key = key
+        self.producer = producer
+        self.params = params
+        self.expiry = expiry
+        self.codec = codec
+        self.tags = tags
+
+    def items(self) -> List[dict]:
+        return [{}] if self.params is None else list(self.params())
+
+
+__warm_entries__: Dict[str, WarmEntry] = {}
+
+
+def warmable(
+        key: str, params: Optional[Callable[[], Iterable[dict]]] = None, expiry: int = 0,
+        codec: Optional[str] = None, tags: Optional[List[str]] = None
+) -> Callable:
+    """
+    登记可预热的缓存，producer的返回值写入QuickCache.cache(key)
+
+        @warmable("Article:{id}", params=lambda: [{"id": a.id} for a in Article.objects.only("id")], expiry=3600)
+        def article(id): ...
+
+    :param key: 缓存key(不含前导)，可以带{参数}
+    :param params: 返回参数列表的函数，每组参数生成一个key并以关键字参数调用producer
+    """
+    def decorator(producer: Callable) -> Callable:
+        __warm_entries__[key] = WarmEntry(key, producer, params=params, expiry=expiry, codec=codec, tags=tags)
+        return producer
+    return decorator
+
+
+def get_warm_entries(only: Optional[str] = None) -> List[WarmEntry]:
+    return [entry for key, entry in __warm_entries__.items() if only is None or key.startswith(only)]
+
+
+class WarmUp(object):
+    """
+    按登记表并发重算缓存：线程池限制并发，按每秒个数限速，定时输出进度
+    dry_run时只对每个登记项抽样计算，按编码后的大小估算总量，不写入redis
+    """
+    app: Flask
+    concurrency: int
+    rate: float
+    dry_run: bool
+    sample: int
+    progress_interval: float
+
+    def __init__(
+            self, app: Flask, concurrency: int = 4, rate: float = 0, dry_run: bool = False, sample: int = 10,
+            progress_interval: float = 5
+    ):
+        """
+        :param concurrency: 同时计算的个数
+        :param rate: 每秒最多计算的个数，0为不限速
+        :param sample: dry_run时每个登记项抽样计算的个数
+        """
+        self.app = app
+        self.concurrency = concurrency if concurrency > 0 else 1
+        self.rate = rate
+        self.dry_run = dry_run
+        self.sample = sample if sample > 0 else 1
+        self.progress_interval = progress_interval
+        self._rate_lock = threading.Lock()
+        self._next_at: float = 0.0
+
+    def __get_logger__(self, name: str) -> LogHandler:
+        return get_logger(f"{self.__class__.__name__}.{name}")
+
+    def __throttle__(self):
+        if self.rate <= 0:
+            return
+        with self._rate_lock:
+            now: float = time.monotonic()
+            wait: float = self._next_at - now
+            self._next_at = max(now, self._next_at) + 1.0 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def __produce__(self, entry: WarmEntry, params: dict) -> Any:
+        self.__throttle__()
+        with self.app.app_context():
+            return entry.producer(**params)
+
+    def __warm__(self, cache, entry: WarmEntry, params: dict) -> int:
+        key: str = entry.key.format(**params)
+        value: Any = self.__produce__(entry, params)
+        if value is None:
+            return 0
+        is_ok, _ = cache.cache(key, value, expiry=entry.expiry, tags=entry.tags, codec=entry.codec)
+        if not is_ok:
+            raise RuntimeError(f"{key}: write failed")
+        return 1
+
+    def __estimate__(self, cache, entry: WarmEntry, params: dict) -> int:
+        key: str = entry.key.format(**params)
+        value: Any = self.__produce__(entry, params)
+        if value is None:
+            return 0
+        redis_key: str = f"{cache.redis_key}:Cache:{key}"
+        return len(encode(value, cache.__codec_for__(redis_key, entry.codec), cache.codec_threshold))
+
+    def run(self, only: Optional[str] = None) -> Dict[str, Any]:
+        """
+        :param only: 只预热以此开头的登记项
+        :return: 汇总信息，dry_run时包含每个登记项的估算大小
+        """
+        from . import QuickCache
+        console_log = self.__get_logger__("run")
+        cache = QuickCache(self.app, use_near_cache=False)
+        tasks: List[tuple] = []
+        totals: Dict[str, int] = {}
+        for entry in get_warm_entries(only):
+            try:
+                items: List[dict] = entry.items()
+            except Exception as e:
+                console_log.error(f"{entry.key}: {e}")
+                continue
+            totals[entry.key] = len(items)
+            tasks += [(entry, params) for params in (items[:self.sample] if self.dry_run else items)]
+        console_log.info(
+            f"{'Estimating' if self.dry_run else 'Warming'} {len(tasks)} of {sum(totals.values())} keys "
+            f"in {len(totals)} entries, concurrency: {self.concurrency}, rate: {self.rate or 'unlimited'}/s")
+        start: float = time.monotonic()
+        last_report: float = start
+        done: int = 0
+        written: int = 0
+        errors: int = 0
+        sizes: Dict[str, List[int]] = {}
+        worker: Callable = self.__estimate__ if self.dry_run else self.__warm__
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="WarmUp") as executor:
+            futures = {executor.submit(worker, cache, entry, params): entry for entry, params in tasks}
+            for future in as_completed(futures):
+                entry: WarmEntry = futures[future]
+                done += 1
+                try:
+                    result: int = future.result()
+                    if self.dry_run:
+                        sizes.setdefault(entry.key, []).append(result)
+                    else:
+                        written += result
+                except Exception as e:
+                    errors += 1
+                    console_log.error(f"{entry.key}: {e}")
+                now: float = time.monotonic()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    console_log.info(
+                        f"{done}/{len(tasks)} done, {errors} errors, {done / (now - start):.1f}/s")
+        summary: Dict[str, Any] = {
+            "total": len(tasks), "done": done, "written": written, "errors": errors,
+            "seconds": round(time.monotonic() - start, 3),
+        }
+        if self.dry_run:
+            estimates: Dict[str, dict] = {}
+            for key, count in totals.items():
+                samples: List[int] = sizes.get(key, [])
+                avg: float = sum(samples) / len(samples) if len(samples) > 0 else 0
+                estimates[key] = {"keys": count, "avg_bytes": int(avg), "estimated_bytes": int(avg * count)}
+                console_log.info(f"{key}: {count} keys, ~{int(avg)} bytes each, ~{int(avg * count)} bytes total")
+            summary["estimates"] = estimates
+        console_log.info(f"Warm-up finished: {summary}")
+        return summary
+
+
+def start_warmup(app: Flask, lock_timeout: int = 600) -> Optional[threading.Thread]:
+    """
+    启动时在后台线程预热，导入QUICK_CACHE_WARMUP_MODULES完成登记
+    多个进程/实例同时启动时用redis锁保证只有一个在预热，预热结束后释放
+    预加载模式下需要在fork之前join返回的线程
+    """
+    from mio.sys import redis_db
+    console_log: LogHandler = get_logger("WarmUp.start_warmup")
+    for module in app.config.get("QUICK_CACHE_WARMUP_MODULES", []):
+        importlib.import_module(module)
+    if len(__warm_entries__) <= 0:
+        return None
+    lock_key: str = f"{app.config['REDIS_KEY_PREFIX']}:WarmUp:__lock__"
+    token: str = uuid.uuid4().hex
+    try:
+        if not redis_db.set(lock_key, token, nx=True, ex=lock_timeout):
+            console_log.info("Warm-up is running in another process, skipped.")
+            return None
+    except Exception as e:
+        console_log.error(e)
+        return None
+
+    def run():
+        try:
+            WarmUp(
+                app, concurrency=int(app.config.get("QUICK_CACHE_WARMUP_CONCURRENCY", 4)),
+                rate=float(app.config.get("QUICK_CACHE_WARMUP_RATE", 0))).run()
+        except Exception as ex:
+            console_log.error(ex, exc_info=True)
+        finally:
+            try:
+                # 只删除自己持有的锁，预热超过lock_timeout时锁可能已经属于别人
+                scripts.get("release_lock", redis_db)(keys=[lock_key], args=[token])
+            except Exception as ex:
+                console_log.error(ex)
+
+    thread = threading.Thread(target=run, name="WarmUp", daemon=True)
+    thread.start()
+    return thread
@@ -1,191 +1,1093 @@
 # -*- coding: utf-8 -*-
-import os
+import gzip
+import math
+import time
+import uuid
 import pickle
-import inspect
+import hashlib
+import random
+import threading
 from flask import Flask
 from redis.client import PubSub
-from typing import Optional, Any, Tuple, List
+from typing import Optional, Any, Tuple, List, Dict
 from mio.sys import redis_db
-from mio.util.Logs import LogHandler
-from mio.util.Helper import get_root_path, read_txt_file
+from mio.util.Logs import LogHandler, get_logger
+from mio.util.Helper import get_bool
+from mio.util.Metrics import instrument
+from mio.util.CircuitBreaker import CircuitOpenError
+from .NearCache import NearCache, INVALIDATE_CHANNEL, get_near_cache, get_near_cache_mode, get_fallback_cache
+from .Codec import encode, decode
+from .Backend import CacheBackend, OVERFLOW_MARKER, get_backend
+from .Scripts import TAG_KEYS, scripts
+from .Shard import ShardRouter, PipelineGroup, get_shard_router
+from .Coalesce import WriteBuffer, get_write_buffer, take_write_buffer
 
+SCAN_BATCH_SIZE: int = 500
+# 进程内按key分段的锁，同一进程内只有一个线程去抢redis锁
+LOCAL_LOCKS: List[threading.Lock] = [threading.Lock() for _ in range(64)]
 
-class QuickCache(object):
-    VERSION = "0.2.1"
+
+class QuickCacheBase(object):
+    """
+    同步和异步QuickCache共用的key前导、编码和L1缓存设置
+    """
     redis_key: str
+    near_cache: Optional[NearCache]
+    near_cache_channel: Optional[str]
+    codec: str
+    codec_threshold: int
+    codec_rules: Dict[str, str]
+    backend: Optional[CacheBackend]
+    fallback_cache: Optional[NearCache]
+    shards: Optional[ShardRouter]
+    redis_url: str
+    coalesce: bool
 
     def __get_logger__(self, name: str) -> LogHandler:
-        name = f"{self.__class__.__name__}.{name}"
-        return LogHandler(name)
+        return get_logger(f"{self.__class__.__name__}.{name}")
 
-    def __init__(self, current_app: Optional[Flask] = None):
-        # 如果在cli下使用，则需要显式的传入app
+    def __init__(self, current_app: Optional[Flask] = None, use_near_cache: bool = True):
+        """
+        :param current_app: 如果在cli下使用，则需要显式的传入app
+        :param use_near_cache: 配置中开启了QUICK_CACHE_NEAR_ENABLE时，是否使用进程内的L1缓存
+        """
         if current_app is None:
             from flask import current_app
         self.redis_key = current_app.config["REDIS_KEY_PREFIX"]
+        self.codec = current_app.config.get("QUICK_CACHE_CODEC", "pickle")
+        self.codec_threshold = int(current_app.config.get("QUICK_CACHE_COMPRESS_THRESHOLD", 1024))
+        self.codec_rules = current_app.config.get("QUICK_CACHE_CODEC_RULES", {})
+        # 使用本机共享内存等后端时，L1缓存没有意义
+        self.backend = get_backend(current_app.config)
+        self.near_cache = get_near_cache(redis_db, current_app.config) \
+            if use_near_cache and self.backend is None else None
+        self.redis_url = current_app.config.get("REDIS_URL", "")
+        self.shards = get_shard_router(current_app.config)
+        self.near_cache_channel = None
+        if self.near_cache is not None and get_near_cache_mode(current_app.config) != "tracking":
+            # tracking模式下由redis负责推送失效通知
+            self.near_cache_channel = INVALIDATE_CHANNEL.format(prefix=self.redis_key)
+        self.fallback_cache = None
+        if self.backend is None and use_near_cache:
+            self.fallback_cache = self.near_cache if self.near_cache is not None and get_bool(
+                current_app.config.get("QUICK_CACHE_BREAKER_FALLBACK", False)) \
+                else get_fallback_cache(current_app.config)
+        self.coalesce = self.backend is None and get_bool(
+            current_app.config.get("QUICK_CACHE_REQUEST_COALESCE", False))
+
+    def __client__(self, redis_key: str):
+        """
+        key所在的redis，没有分片时就是redis_db
+        """
+        return redis_db if self.shards is None else self.shards.client_for(redis_key)
+
+    def __clients__(self) -> list:
+        return [redis_db] if self.shards is None else self.shards.clients
+
+    def __group__(self, redis_keys: List[str]) -> List[Tuple[Any, List[str]]]:
+        return [(redis_db, redis_keys)] if self.shards is None else self.shards.group(redis_keys)
+
+    def __pipelines__(self, transaction: bool = False) -> PipelineGroup:
+        return PipelineGroup(self.__client__, transaction=transaction)
+
+    def shard_report(self, match: Optional[str] = None, new_urls: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        各分片的key分布和再平衡需要迁移的数量，没有分片时只有redis_db一项
+        """
+        match = f"{self.redis_key}:*" if match is None else match
+        if self.shards is None:
+            return ShardRouter([self.redis_url], [redis_db]).report(match, new_urls)
+        return self.shards.report(match, new_urls)
+
+    @staticmethod
+    def __log_error__(console_log: LogHandler, e: Exception):
+        # 熔断打开期间每次调用都会失败，只记debug，避免故障时日志刷屏
+        if isinstance(e, CircuitOpenError):
+            console_log.debug(e)
+            return
+        console_log.error(e)
+
+    def __fallback_get__(self, redis_key: str, is_pickle: bool) -> Tuple[bool, Optional[Any]]:
+        if self.fallback_cache is None:
+            return False, None
+        is_hit, val = self.fallback_cache.get(redis_key)
+        if not is_hit or not val:
+            return False, None
+        return True, decode(val) if is_pickle else val.decode("utf-8")
+
+    def __fallback_set__(self, redis_key: str, val: Any, expiry: int) -> bool:
+        if self.fallback_cache is None:
+            return False
+        self.fallback_cache.set(redis_key, val if isinstance(val, bytes) else str(val).encode("utf-8"), expiry)
+        return True
+
+    def __codec_for__(self, redis_key: str, codec: Optional[str] = None) -> str:
+        """
+        优先使用调用时指定的编码，其次按QUICK_CACHE_CODEC_RULES中去掉前导后的key前缀匹配
+        """
+        if codec is not None:
+            return codec
+        sub_key: str = redis_key[len(self.redis_key) + 1:] if redis_key.startswith(f"{self.redis_key}:") \
+            else redis_key
+        for prefix, spec in self.codec_rules.items():
+            if sub_key.startswith(prefix):
+                return spec
+        return self.codec
+
+    def __encode__(self, redis_key: str, value: Any, codec: Optional[str] = None) -> bytes:
+        return encode(value, self.__codec_for__(redis_key, codec), self.codec_threshold)
+
+    def near_cache_stats(self) -> Optional[Dict[str, int]]:
+        if self.near_cache is None:
+            return None
+        return self.near_cache.stats()
+
+    def __near_set__(self, redis_key: str, val: Optional[bytes], pttl: int, version: Optional[int]):
+        """
+        写入L1，存活时间不超过key在redis中剩余的过期时间，pubsub模式下redis里的key过期时不会有失效通知
+
+        :param pttl: 与val在同一个pipeline中取得的PTTL(毫秒)，-1为不过期
+        """
+        if not val or self.near_cache is None or pttl == 0 or pttl == -2:
+            return
+        self.near_cache.set(redis_key, val, expiry=pttl / 1000 if pttl > 0 else 0, version=version)
+
+    def __tag_keys__(self, pipes: PipelineGroup, tags: Optional[List[str]], expiry: int, *redis_keys: str):
+        """
+        标签集合跟着成员一起过期，避免只写不删的集合一直增长
+        同步和异步的pipeline都要能排队，所以直接EVAL而不是走scripts登记表
+        """
+        if not tags or len(redis_keys) <= 0:
+            return
+        for tag in tags:
+            tag_key: str = f"{self.redis_key}:Tag:{tag}"
+            pipes(tag_key).eval(TAG_KEYS, 1, tag_key, expiry, *redis_keys)
+
+    @staticmethod
+    def __check_bucket__(capacity: int, rate: float):
+        # 令牌桶脚本按rate做除法，参数错误时直接抛出，不能当作redis故障放行
+        if capacity <= 0:
+            raise ValueError(f"capacity must be greater than 0, got {capacity}")
+        if rate <= 0:
+            raise ValueError(f"rate must be greater than 0, got {rate}")
+
+    def __backend_get__(self, redis_key: str) -> Tuple[bool, Optional[bytes]]:
+        """
+        :return: (是否不需要再读redis, 值)，值超过槽大小而保存在redis时返回(False, None)
+        """
+        val: Optional[bytes] = self.backend.get(redis_key)
+        if val == OVERFLOW_MARKER:
+            return False, None
+        return True, val
+
+    def __backend_write__(self, pipes: PipelineGroup, items: Dict[str, Any], expiry: int) -> List[str]:
+        """
+        写入本机后端，超过槽大小的值改为加入pipes写到redis，原来保存在redis中的值一并删除
+
+        :return: 写到redis的key，pipes执行后需要用__backend_overflow__留下标记
+        """
+        overflow: List[str] = []
+        for redis_key, val in items.items():
+            val = val if isinstance(val, bytes) else str(val).encode("utf-8")
+            in_redis: bool = self.backend.get(redis_key) == OVERFLOW_MARKER
+            if self.backend.set(redis_key, val, expiry):
+                if in_redis:
+                    pipes(redis_key).delete(redis_key)
+                continue
+            overflow.append(redis_key)
+            if expiry > 0:
+                pipes(redis_key).setex(redis_key, expiry, val)
+            else:
+                pipes(redis_key).set(redis_key, val)
+        return overflow
+
+    def __backend_overflow__(self, redis_keys: List[str], expiry: int) -> bool:
+        """
+        在本机后端留下值在redis中的标记，key本身超过槽大小时失败
+        """
+        return all([self.backend.set(redis_key, OVERFLOW_MARKER, expiry) for redis_key in redis_keys])
+
+    def __backend_delete__(self, redis_keys: List[str]) -> Tuple[int, List[str]]:
+        """
+        :return: 删除的数量，以及值保存在redis中、需要一并删除的key
+        """
+        in_redis: List[str] = [
+            redis_key for redis_key in redis_keys if self.backend.get(redis_key) == OVERFLOW_MARKER
+        ]
+        return self.backend.delete(*redis_keys), in_redis
+
+
+@instrument
+class QuickCache(QuickCacheBase):
+    VERSION = "0.2.1"
+
+    def __notify_changed__(self, *redis_keys: str):
+        if self.near_cache is None or len(redis_keys) == 0:
+            return
+        self.near_cache.invalidate(*redis_keys)
+        if self.near_cache_channel is not None:
+            redis_db.publish(self.near_cache_channel, "\n".join(redis_keys))
+
+    def __buffer__(self, create: bool = True) -> Optional[WriteBuffer]:
+        """
+        开启了QUICK_CACHE_REQUEST_COALESCE且在请求中时，返回当前请求的写缓冲
+        """
+        if not self.coalesce:
+            return None
+        return get_write_buffer(self, create=create)
+
+    def __pending__(self) -> Optional[WriteBuffer]:
+        """
+        当前请求中还没写入的缓冲，没有时返回None
+        写入成功后才从请求中取走，失败时留给之后的flush(最晚在请求结束时)重试
+        """
+        buffer: Optional[WriteBuffer] = self.__buffer__(create=False)
+        if buffer is None or len(buffer) <= 0:
+            return None
+        return buffer
+
+    def __apply_buffer__(self, pipes: PipelineGroup, buffer: WriteBuffer):
+        # 同一个key总是落在同一个分片的pipeline里，先后顺序不变
+        for op in buffer.ops:
+            if op[0] == "set":
+                _, redis_key, val, expiry, tags = op
+                if expiry > 0:
+                    pipes(redis_key).setex(redis_key, expiry, val)
+                else:
+                    pipes(redis_key).set(redis_key, val)
+                self.__tag_keys__(pipes, tags, expiry, redis_key)
+            else:
+                pipes(op[1]).delete(op[1])
+
+    def __flush_with__(self, buffer: WriteBuffer, redis_key: str, command: str, *args) -> Any:
+        """
+        缓冲的写入和这条命令在同一次往返中执行
+
+        :return: 这条命令的结果
+        """
+        pipes: PipelineGroup = self.__pipelines__()
+        # 第一个创建，结果排在最前面
+        pipe = pipes(redis_key)
+        self.__apply_buffer__(pipes, buffer)
+        getattr(pipe, command)(redis_key, *args)
+        index: int = len(pipe) - 1
+        result: Any = pipes.execute()[index]
+        take_write_buffer()
+        self.__notify_changed__(*set(buffer.keys() + [redis_key]))
+        return result
+
+    def flush(self) -> bool:
+        """
+        立即写入当前请求缓冲的写入和删除，请求结束时会自动调用
+        """
+        console_log = self.__get_logger__("flush")
+        buffer: Optional[WriteBuffer] = self.__pending__()
+        if buffer is None:
+            return True
+        try:
+            pipes: PipelineGroup = self.__pipelines__()
+            self.__apply_buffer__(pipes, buffer)
+            pipes.execute()
+            take_write_buffer()
+            self.__notify_changed__(*buffer.keys())
+            return True
+        except CircuitOpenError as e:
+            console_log.debug(e)
+            take_write_buffer()
+            for op in buffer.ops:
+                if op[0] == "set":
+                    self.__fallback_set__(op[1], op[2], op[3])
+            return False
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
 
     def get_keys(self, key: str, is_full_key: bool = False) -> List[str]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("get_keys")
         try:
             redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
-            keys: Optional[List[bytes]] = redis_db.keys(redis_key)
-            return [str(key, encoding="utf-8") for key in keys]
+            # 用SCAN增量遍历，避免KEYS阻塞整个redis
+            keys: List[str] = [
+                str(key, encoding="utf-8") for client in self.__clients__()
+                for key in client.scan_iter(match=redis_key, count=SCAN_BATCH_SIZE)
+            ]
+            if self.backend is not None:
+                # 值超过槽大小的key两边都有
+                keys = list(dict.fromkeys(keys + self.backend.keys(redis_key)))
+            return keys
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return []
 
-    def lpush(self, key: str, value: Optional[Any] = None, expiry: int = 0, is_full_key: bool = False) -> bool:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+    def __unlink_keys__(self, keys: List[str], client=None) -> int:
+        """
+        :param client: SCAN得到的key传入所在的redis，在原处删除；为空时按分片分组
+        """
+        count: int = 0
+        for shard, shard_keys in ([(client, keys)] if client is not None else self.__group__(keys)):
+            for i in range(0, len(shard_keys), SCAN_BATCH_SIZE):
+                batch: List[str] = shard_keys[i:i + SCAN_BATCH_SIZE]
+                count += shard.unlink(*batch)
+                if self.backend is not None:
+                    count += self.backend.delete(*batch)
+                self.__notify_changed__(*batch)
+        return count
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        删除打了指定标签的所有缓存，标签集合本身也一起删除
+        标签集合跟随其中最长的过期时间，里面已经过期的key会在这里一并清理
+
+        :return: 删除的缓存数量
+        """
+        console_log = self.__get_logger__("invalidate_tags")
+        tags = tuple(tag for tag in tags if tag is not None and len(tag) > 0)
+        if len(tags) <= 0:
+            return 0
+        tag_keys: List[str] = [f"{self.redis_key}:Tag:{tag}" for tag in tags]
+        # 缓冲中的写入还没有登记到标签集合
+        self.flush()
+        try:
+            pipes: PipelineGroup = self.__pipelines__()
+            for client, shard_tag_keys in self.__group__(tag_keys):
+                for tag_key in shard_tag_keys:
+                    pipes.get(client).smembers(tag_key)
+            keys: set = set()
+            for members in pipes.execute():
+                keys.update([str(member, encoding="utf-8") for member in members])
+            count: int = self.__unlink_keys__(list(keys))
+            for client, shard_tag_keys in self.__group__(tag_keys):
+                client.unlink(*shard_tag_keys)
+            return count
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return 0
+
+    def namespace_key(self, namespace: str, key: str) -> str:
+        """
+        生成带版本号的完整key，配合is_full_key=True使用
+        调用bump_namespace后旧版本的key不会再被读到，由各自的过期时间回收，所以写入时应当带上expiry
+        """
+        console_log = self.__get_logger__("namespace_key")
+        version: int = 0
+        try:
+            gen_key: str = f"{self.redis_key}:Gen:{namespace}"
+            val: Optional[bytes] = self.__client__(gen_key).get(gen_key)
+            version = 0 if val is None else int(val)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+        return f"{self.redis_key}:Cache:{namespace}:v{version}:{key}"
+
+    def bump_namespace(self, namespace: str) -> Optional[int]:
+        """
+        整个命名空间失效，只需要一次INCR
+        """
+        console_log = self.__get_logger__("bump_namespace")
+        if namespace is None or len(namespace) <= 0:
+            return None
+        try:
+            gen_key: str = f"{self.redis_key}:Gen:{namespace}"
+            return self.__client__(gen_key).incr(gen_key)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    def lpush(
+            self, key: str, value: Optional[Any] = None, expiry: int = 0, is_full_key: bool = False,
+            codec: Optional[str] = None
+    ) -> bool:
+        console_log = self.__get_logger__("lpush")
         if key is None or len(key) <= 0:
             return False
         redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
         try:
-            redis_db.lpush(redis_key, pickle.dumps(value))
+            pipe = self.__client__(redis_key).pipeline(transaction=False)
+            pipe.lpush(redis_key, self.__encode__(redis_key, value, codec))
+            if expiry > 0:
+                pipe.expire(name=redis_key, time=expiry)
+            pipe.execute()
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    def lpush_many(
+            self, key: str, values: List[Any], expiry: int = 0, is_full_key: bool = False,
+            codec: Optional[str] = None
+    ) -> bool:
+        """
+        一次往队列里推入多个值，和过期时间一起在一个往返内完成
+        """
+        console_log = self.__get_logger__("lpush_many")
+        if key is None or len(key) <= 0 or values is None or len(values) <= 0:
+            return False
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        try:
+            pipe = self.__client__(redis_key).pipeline(transaction=False)
+            pipe.lpush(redis_key, *[self.__encode__(redis_key, value, codec) for value in values])
             if expiry > 0:
-                redis_db.expire(name=redis_key, time=expiry)
+                pipe.expire(name=redis_key, time=expiry)
+            pipe.execute()
+            return True
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return False
 
     def llen(self, key: str, is_full_key: bool = False) -> int:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("llen")
         if key is None or len(key) <= 0:
             return 0
         redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
         try:
-            return redis_db.llen(redis_key)
+            return self.__client__(redis_key).llen(redis_key)
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return 0
 
     def inc_num(self, key: str, num: int = 1, is_full_key: bool = False) -> Optional[int]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("inc_num")
         if key is None or len(key) <= 0:
             return None
         redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
         try:
-            item = redis_db.incr(redis_key, num)
+            buffer: Optional[WriteBuffer] = self.__pending__()
+            if buffer is not None:
+                return self.__flush_with__(buffer, redis_key, "incr", num)
+            item = self.__client__(redis_key).incr(redis_key, num)
+            self.__notify_changed__(redis_key)
             return item
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return None
 
     def dec_num(self, key: str, num: int = 1, is_full_key: bool = False) -> Optional[int]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("dec_num")
         if key is None or len(key) <= 0:
             return None
         redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
         try:
-            item = redis_db.decr(redis_key, num)
+            buffer: Optional[WriteBuffer] = self.__pending__()
+            if buffer is not None:
+                return self.__flush_with__(buffer, redis_key, "decr", num)
+            item = self.__client__(redis_key).decr(redis_key, num)
+            self.__notify_changed__(redis_key)
             return item
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return None
 
+    def inc_window(self, key: str, window: int, num: int = 1, is_full_key: bool = False) -> Optional[int]:
+        """
+        固定窗口计数，INCRBY和设置过期时间在同一个脚本里完成
+
+        :param window: 窗口秒数
+        :return: 当前窗口内的计数
+        """
+        console_log = self.__get_logger__("inc_window")
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:Counter:{key}" if not is_full_key else key
+        try:
+            script = scripts.get("fixed_window", self.__client__(redis_key))
+            count, _ = script(keys=[redis_key], args=[window * 1000, num])
+            return count
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    def inc_sliding(
+            self, key: str, window: int, num: int = 1, limit: int = 0, is_full_key: bool = False
+    ) -> Optional[Tuple[bool, int]]:
+        """
+        滑动窗口计数，按上一个窗口的计数加权估算，limit大于0时超出上限的请求不计入
+
+        :param window: 窗口秒数
+        :return: (是否计入, 估算的窗口内计数)
+        """
+        console_log = self.__get_logger__("inc_sliding")
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:Counter:{key}" if not is_full_key else key
+        try:
+            script = scripts.get("sliding_window", self.__client__(redis_key))
+            count, allowed = script(keys=[redis_key], args=[window * 1000, num, limit])
+            return allowed == 1, count
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    def take_token(
+            self, key: str, capacity: int, rate: float, num: int = 1, is_full_key: bool = False
+    ) -> Optional[Tuple[bool, int, int]]:
+        """
+        令牌桶限流
+
+        :param capacity: 桶容量，即允许的突发请求数
+        :param rate: 每秒补充的令牌数
+        :return: (是否通过, 剩余令牌数, 需要等待的毫秒数)
+        :raises ValueError: capacity或rate不大于0
+        """
+        console_log = self.__get_logger__("take_token")
+        self.__check_bucket__(capacity, rate)
+        if key is None or len(key) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:RateLimit:{key}" if not is_full_key else key
+        try:
+            allowed, remaining, retry_after = scripts.get("token_bucket", self.__client__(redis_key))(
+                keys=[redis_key], args=[capacity, rate, num])
+            return allowed == 1, remaining, retry_after
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    def pf_add(self, key: str, *values: Any, expiry: int = 0, is_full_key: bool = False) -> Optional[bool]:
+        """
+        HyperLogLog计数，每个key固定约12KB，误差约0.81%，适合统计独立访客等不需要保存原值的场景
+
+        :return: 估算值是否发生变化
+        """
+        console_log = self.__get_logger__("pf_add")
+        if key is None or len(key) <= 0 or len(values) <= 0:
+            return None
+        redis_key: str = f"{self.redis_key}:HLL:{key}" if not is_full_key else key
+        try:
+            pipe = self.__client__(redis_key).pipeline(transaction=False)
+            pipe.pfadd(redis_key, *values)
+            if expiry > 0:
+                pipe.expire(redis_key, expiry)
+            return pipe.execute()[0] == 1
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return None
+
+    def __pf_gather__(self, redis_keys: List[str], target: str) -> Tuple[Any, List[str], List[str]]:
+        """
+        多个HLL不在同一个分片时，把其他分片上的原始值复制为target所在分片的临时key
+
+        :return: (target所在的redis, 在该redis上可用的key, 需要删除的临时key)
+        """
+        client = self.__client__(target)
+        local_keys: List[str] = []
+        temp_keys: List[str] = []
+        for shard, shard_keys in self.__group__(redis_keys):
+            if shard is client:
+                local_keys += shard_keys
+                continue
+            for redis_key, raw in zip(shard_keys, shard.mget(shard_keys)):
+                if raw is None:
+                    continue
+                temp_key: str = f"{target}:__pf__:{uuid.uuid4().hex}"
+                client.set(temp_key, raw, px=60000)
+                local_keys.append(temp_key)
+                temp_keys.append(temp_key)
+        return client, local_keys, temp_keys
+
+    def pf_count(self, *keys: str, is_full_key: bool = False) -> int:
+        """
+        多个key时返回并集的估算值
+        """
+        console_log = self.__get_logger__("pf_count")
+        keys = tuple(key for key in keys if key is not None and len(key) > 0)
+        if len(keys) <= 0:
+            return 0
+        redis_keys: List[str] = [f"{self.redis_key}:HLL:{key}" if not is_full_key else key for key in keys]
+        try:
+            client, local_keys, temp_keys = self.__pf_gather__(redis_keys, redis_keys[0])
+            try:
+                return client.pfcount(*local_keys) if len(local_keys) > 0 else 0
+            finally:
+                if len(temp_keys) > 0:
+                    client.unlink(*temp_keys)
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return 0
+
+    def pf_merge(self, dest: str, *sources: str, expiry: int = 0, is_full_key: bool = False) -> bool:
+        """
+        把多个HLL合并到dest，dest原有的计数也会保留
+        """
+        console_log = self.__get_logger__("pf_merge")
+        sources = tuple(key for key in sources if key is not None and len(key) > 0)
+        if dest is None or len(dest) <= 0 or len(sources) <= 0:
+            return False
+        dest_key: str = f"{self.redis_key}:HLL:{dest}" if not is_full_key else dest
+        redis_keys: List[str] = [f"{self.redis_key}:HLL:{key}" if not is_full_key else key for key in sources]
+        try:
+            client, local_keys, temp_keys = self.__pf_gather__(redis_keys, dest_key)
+            pipe = client.pipeline(transaction=False)
+            pipe.pfmerge(dest_key, *local_keys)
+            if expiry > 0:
+                pipe.expire(dest_key, expiry)
+            if len(temp_keys) > 0:
+                pipe.unlink(*temp_keys)
+            pipe.execute()
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
     def rpop(self, key: str, is_full_key: bool = False) -> Optional[Any]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("rpop")
         if key is None or len(key) <= 0:
             return None
         redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
         try:
-            return pickle.loads(redis_db.rpop(redis_key))
+            return decode(self.__client__(redis_key).rpop(redis_key))
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return None
 
     def cache(
             self, key: str, value: Optional[Any] = None, expiry: int = 0, is_full_key: bool = False,
-            is_pickle: bool = True
+            is_pickle: bool = True, tags: Optional[List[str]] = None, codec: Optional[str] = None
     ) -> Tuple[bool, Optional[Any]]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        """
+        读写缓存，value为None时读取
+
+        :param is_pickle: 为False时按utf-8字符串原样读写，不经过编码层
+        :param tags: 写入时给key打上标签，可用invalidate_tags批量失效
+        :param codec: 写入时的编码，格式为 序列化[+压缩]，如orjson+zstd，读取时按编码头自动识别
+        """
+        console_log = self.__get_logger__("cache")
         if key is None or len(key) <= 0:
             return False, None
         redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
         try:
             if value is None:
                 # 读取
-                val: Optional[bytes] = redis_db.get(redis_key)
+                buffer: Optional[WriteBuffer] = self.__buffer__(create=False)
+                val: Optional[bytes] = None
+                is_hit: bool = False
+                if buffer is not None:
+                    is_hit, val = buffer.get(redis_key)
+                if is_hit:
+                    pass
+                elif self.backend is not None:
+                    is_hit, val = self.__backend_get__(redis_key)
+                elif self.near_cache is not None:
+                    is_hit, val = self.near_cache.get(redis_key)
+                if not is_hit:
+                    if self.near_cache is None:
+                        val = self.__client__(redis_key).get(redis_key)
+                    else:
+                        version: int = self.near_cache.version
+                        pipe = self.__client__(redis_key).pipeline(transaction=False)
+                        pipe.get(redis_key)
+                        pipe.pttl(redis_key)
+                        val, pttl = pipe.execute()
+                        self.__near_set__(redis_key, val, pttl, version)
                 if val:
                     data: Any
                     if is_pickle:
-                        data = pickle.loads(val)
+                        data = decode(val)
                     else:
                         data = val.decode("utf-8")
                     return True, data
                 return True, None
             else:
                 # 写入
-                val = value if not is_pickle else pickle.dumps(value)
-                if expiry > 0:
-                    redis_db.setex(redis_key, expiry, val)
+                val = value if not is_pickle else self.__encode__(redis_key, value, codec)
+                buffer: Optional[WriteBuffer] = self.__buffer__()
+                if buffer is not None:
+                    buffer.set(redis_key, val if isinstance(val, bytes) else str(val).encode("utf-8"), expiry, tags)
+                    return True, value
+                pipes: PipelineGroup = self.__pipelines__()
+                overflow: List[str] = []
+                if self.backend is not None:
+                    overflow = self.__backend_write__(pipes, {redis_key: val}, expiry)
+                elif expiry > 0:
+                    pipes(redis_key).setex(redis_key, expiry, val)
                 else:
-                    redis_db.set(redis_key, val)
+                    pipes(redis_key).set(redis_key, val)
+                self.__tag_keys__(pipes, tags, expiry, redis_key)
+                if len(pipes) > 0:
+                    pipes.execute()
+                if len(overflow) > 0 and not self.__backend_overflow__(overflow, expiry):
+                    return False, None
+                self.__notify_changed__(redis_key)
+                return True, value
+        except CircuitOpenError as e:
+            console_log.debug(e)
+            if value is None:
+                return self.__fallback_get__(redis_key, is_pickle)
+            if self.__fallback_set__(redis_key, val, expiry):
                 return True, value
+            return False, None
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return False, None
 
+    def __acquire_lock__(self, lock_key: str, lock_timeout: int) -> Optional[str]:
+        token: str = uuid.uuid4().hex
+        if self.__client__(lock_key).set(lock_key, token, nx=True, px=lock_timeout * 1000):
+            return token
+        return None
+
+    def __release_lock__(self, lock_key: str, token: str):
+        console_log = self.__get_logger__("__release_lock__")
+        try:
+            scripts.get("release_lock", self.__client__(lock_key))(keys=[lock_key], args=[token])
+        except Exception as e:
+            self.__log_error__(console_log, e)
+
+    def __compute__(self, redis_key: str, fn, ttl: int, stale_ttl: int, codec: Optional[str]) -> Any:
+        start: float = time.time()
+        value: Any = fn()
+        delta: float = time.time() - start
+        envelope: dict = {"v": value, "d": delta, "e": time.time() + ttl}
+        self.cache(redis_key, envelope, expiry=ttl + stale_ttl, is_full_key=True, codec=codec)
+        # 计算结果要在释放锁之前写入，等待中的worker才能读到
+        self.flush()
+        return value
+
+    def get_or_compute(
+            self, key: str, fn, ttl: int, stale_ttl: Optional[int] = None, beta: float = 1.0,
+            lock_timeout: int = 10, is_full_key: bool = False, codec: Optional[str] = None
+    ) -> Any:
+        """
+        读取缓存，不存在或需要刷新时调用fn重新计算，防止缓存击穿
+        1. 进程内分段锁 + redis SET NX，同一时间只有一个worker在计算
+        2. XFetch提前概率刷新：越接近过期、计算越慢的key越早被刷新
+        3. 过期后的stale_ttl时间内，没抢到锁的worker继续返回旧值
+
+        :param fn: 无参数的计算函数
+        :param ttl: 新鲜时间(秒)
+        :param stale_ttl: 过期后还可以返回旧值的时间(秒)，默认与ttl相同
+        :param beta: XFetch参数，越大越倾向于提前刷新，0为关闭
+        :param lock_timeout: 计算锁的超时时间(秒)，也是没有旧值时等待其他worker的最长时间
+        """
+        console_log = self.__get_logger__("get_or_compute")
+        redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        lock_key: str = f"{redis_key}:__lock__"
+        stale_ttl = ttl if stale_ttl is None else stale_ttl
+        local_lock: threading.Lock = LOCAL_LOCKS[hash(redis_key) % len(LOCAL_LOCKS)]
+        deadline: float = time.time() + lock_timeout
+        while True:
+            _, envelope = self.cache(redis_key, is_full_key=True)
+            if not isinstance(envelope, dict) or "v" not in envelope:
+                envelope = None
+            if envelope is not None:
+                now: float = time.time()
+                if now - envelope["d"] * beta * math.log(1.0 - random.random()) < envelope["e"]:
+                    return envelope["v"]
+            # 有旧值时不等待，抢不到锁直接返回旧值
+            if not local_lock.acquire(blocking=envelope is None, timeout=-1 if envelope is not None else 0.05):
+                if envelope is not None:
+                    return envelope["v"]
+                if time.time() < deadline:
+                    continue
+                break
+            try:
+                token: Optional[str] = None
+                try:
+                    token = self.__acquire_lock__(lock_key, lock_timeout)
+                except Exception as e:
+                    self.__log_error__(console_log, e)
+                    break
+                if token is None:
+                    if envelope is not None:
+                        return envelope["v"]
+                else:
+                    try:
+                        return self.__compute__(redis_key, fn, ttl, stale_ttl, codec)
+                    finally:
+                        self.__release_lock__(lock_key, token)
+            finally:
+                local_lock.release()
+            if time.time() >= deadline:
+                break
+            time.sleep(0.05)
+        # 等不到其他worker的结果或者redis不可用，只能自己计算
+        return self.__compute__(redis_key, fn, ttl, stale_ttl, codec)
+
+    def cache_many(
+            self, keys: List[str], is_full_key: bool = False, is_pickle: bool = True
+    ) -> Tuple[bool, Dict[str, Optional[Any]]]:
+        """
+        批量读取，未命中L1的key用一次MGET取回
+
+        :return: 是否成功，以及以传入的key为键的结果，不存在的key值为None
+        """
+        console_log = self.__get_logger__("cache_many")
+        keys = [key for key in keys if key is not None and len(key) > 0] if keys else []
+        if len(keys) <= 0:
+            return False, {}
+        redis_keys: List[str] = [f"{self.redis_key}:Cache:{key}" if not is_full_key else key for key in keys]
+        try:
+            buffer: Optional[WriteBuffer] = self.__buffer__(create=False)
+            values: Dict[str, Optional[bytes]] = {}
+            missing: List[str] = []
+            for redis_key in redis_keys:
+                is_hit: bool = False
+                if buffer is not None:
+                    is_hit, values[redis_key] = buffer.get(redis_key)
+                if is_hit:
+                    continue
+                if self.backend is not None:
+                    is_hit, values[redis_key] = self.__backend_get__(redis_key)
+                elif self.near_cache is not None:
+                    is_hit, values[redis_key] = self.near_cache.get(redis_key)
+                if not is_hit:
+                    missing.append(redis_key)
+            if len(missing) > 0:
+                version: Optional[int] = None if self.near_cache is None else self.near_cache.version
+                for client, shard_keys in self.__group__(missing):
+                    if self.near_cache is None:
+                        values.update(zip(shard_keys, client.mget(shard_keys)))
+                        continue
+                    pipe = client.pipeline(transaction=False)
+                    pipe.mget(shard_keys)
+                    for redis_key in shard_keys:
+                        pipe.pttl(redis_key)
+                    shard_values, *pttls = pipe.execute()
+                    for redis_key, val, pttl in zip(shard_keys, shard_values, pttls):
+                        values[redis_key] = val
+                        self.__near_set__(redis_key, val, pttl, version)
+            result: Dict[str, Optional[Any]] = {}
+            for key, redis_key in zip(keys, redis_keys):
+                val: Optional[bytes] = values.get(redis_key)
+                if not val:
+                    result[key] = None
+                    continue
+                result[key] = decode(val) if is_pickle else val.decode("utf-8")
+            return True, result
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False, {}
+
+    def set_many(
+            self, mapping: Dict[str, Any], expiry: int = 0, is_full_key: bool = False, is_pickle: bool = True,
+            tags: Optional[List[str]] = None, codec: Optional[str] = None
+    ) -> bool:
+        """
+        批量写入，没有过期时间时使用MSET，否则在一个pipeline里逐个SETEX
+        """
+        console_log = self.__get_logger__("set_many")
+        if mapping is None or len(mapping) <= 0:
+            return False
+        items: Dict[str, Any] = {}
+        for key, value in mapping.items():
+            if key is None or len(key) <= 0 or value is None:
+                continue
+            redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+            items[redis_key] = value if not is_pickle else self.__encode__(redis_key, value, codec)
+        if len(items) <= 0:
+            return False
+        buffer: Optional[WriteBuffer] = self.__buffer__()
+        if buffer is not None:
+            for redis_key, val in items.items():
+                buffer.set(redis_key, val if isinstance(val, bytes) else str(val).encode("utf-8"), expiry, tags)
+            return True
+        try:
+            pipes: PipelineGroup = self.__pipelines__()
+            overflow: List[str] = []
+            if self.backend is not None:
+                overflow = self.__backend_write__(pipes, items, expiry)
+            elif expiry > 0:
+                for redis_key, val in items.items():
+                    pipes(redis_key).setex(redis_key, expiry, val)
+            else:
+                for client, shard_keys in self.__group__(list(items.keys())):
+                    pipes.get(client).mset({redis_key: items[redis_key] for redis_key in shard_keys})
+            self.__tag_keys__(pipes, tags, expiry, *items.keys())
+            if len(pipes) > 0:
+                pipes.execute()
+            if len(overflow) > 0 and not self.__backend_overflow__(overflow, expiry):
+                return False
+            self.__notify_changed__(*items.keys())
+            return True
+        except Exception as e:
+            self.__log_error__(console_log, e)
+            return False
+
+    def remove_many(self, keys: List[str], is_full_key: bool = False) -> int:
+        """
+        一次删除多个key
+
+        :return: 实际删除的数量，合并写入时为缓冲的数量
+        """
+        console_log = self.__get_logger__("remove_many")
+        keys = [key for key in keys if key is not None and len(key) > 0] if keys else []
+        if len(keys) <= 0:
+            return 0
+        redis_keys: List[str] = [f"{self.redis_key}:Cache:{key}" if not is_full_key else key for key in keys]
+        buffer: Optional[WriteBuffer] = self.__buffer__()
+        if buffer is not None:
+            buffer.delete(*redis_keys)
+            return len(redis_keys)
+        try:
+            count: int
+            if self.backend is not None:
+                count, in_redis = self.__backend_delete__(redis_keys)
+                if len(in_redis) > 0:
+                    for client, shard_keys in self.__group__(in_redis):
+                        client.delete(*shard_keys)
+            else:
+                count = sum([client.delete(*shard_keys) for client, shard_keys in self.__group__(redis_keys)])
+            self.__notify_changed__(*redis_keys)
+            return count
+        except Exception as e:
+            console_log.debug(e)
+            return 0
+
     def remove_cache(self, key: str, is_full_key: bool = False):
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("remove_cache")
         if key is None or len(key) <= 0:
             return
         redis_key: str = f"{self.redis_key}:Cache:{key}" if not is_full_key else key
+        buffer: Optional[WriteBuffer] = self.__buffer__()
+        if buffer is not None:
+            buffer.delete(redis_key)
+            return
         try:
-            redis_db.delete(redis_key)
+            in_redis: List[str] = [redis_key]
+            if self.backend is not None:
+                _, in_redis = self.__backend_delete__(in_redis)
+            if len(in_redis) > 0:
+                self.__client__(redis_key).delete(redis_key)
+            self.__notify_changed__(redis_key)
         except Exception as e:
             console_log.debug(e)
 
     def bulk_remove_cache(self, key: str, is_full_key: bool = False):
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("bulk_remove_cache")
         if key is None or len(key) <= 0:
             return
         redis_key: str = f"{self.redis_key}:Cache:{key}:*" if not is_full_key else key
+        self.flush()
         try:
-            keys: List[str] = self.get_keys(redis_key, is_full_key=True)
-            for _k in keys:
-                redis_db.delete(_k)
+            for client in self.__clients__():
+                batch: List[str] = []
+                for _k in client.scan_iter(match=redis_key, count=SCAN_BATCH_SIZE):
+                    batch.append(str(_k, encoding="utf-8"))
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        self.__unlink_keys__(batch, client)
+                        batch = []
+                if len(batch) > 0:
+                    self.__unlink_keys__(batch, client)
+            if self.backend is not None:
+                self.backend.delete_pattern(redis_key)
         except Exception as e:
             console_log.debug(e)
 
     def cache_page(
             self, key: str, template_filename: str, expiry: int = 3600, is_full_key: bool = False, **kwargs
     ) -> Optional[str]:
-        from flask import render_template_string
+        """
+        渲染模板并缓存，使用jinja环境中已编译的模板
+        页面以hash保存：原文、gzip/br预压缩版本和ETag，读取时按Accept-Encoding直接返回对应版本
+        """
+        from flask import render_template
+        from jinja2 import TemplateNotFound
+        console_log = self.__get_logger__("cache_page")
         redis_key: str = f"{self.redis_key}:Page:Cache:{key}" if not is_full_key else key
-        root_path: str = os.path.join(get_root_path(), "web", "template")
-        template_filename = root_path + os.path.sep + template_filename
-        if not os.path.isfile(template_filename):
-            return None
-        # 开始渲染
-        text: str = read_txt_file(template_filename)
-        text = render_template_string(text, **kwargs)
-        self.cache(redis_key, text, expiry)
+        try:
+            text: str = render_template(template_filename, **kwargs)
+        except TemplateNotFound:
+            return None
+        body: bytes = text.encode("utf-8")
+        page: Dict[str, bytes] = {
+            "body": body,
+            "etag": f'W/"{hashlib.md5(body).hexdigest()}"'.encode("utf-8"),
+            "gzip": gzip.compress(body, compresslevel=9),
+        }
+        try:
+            import brotli
+            page["br"] = brotli.compress(body, quality=9)
+        except ImportError:
+            pass
+        try:
+            # 旧版本的页面缓存是字符串类型，在事务里先删除再写入hash
+            pipe = self.__client__(redis_key).pipeline(transaction=True)
+            pipe.unlink(redis_key)
+            pipe.hset(redis_key, mapping=page)
+            if expiry > 0:
+                pipe.expire(redis_key, expiry)
+            pipe.execute()
+        except Exception as e:
+            self.__log_error__(console_log, e)
         return text
 
+    @staticmethod
+    def __refresh_expiry__(pipe, redis_key: str, expiry: int):
+        if expiry > 0:
+            pipe.expire(redis_key, expiry)
+        else:
+            pipe.persist(redis_key)
+
     def read_page(self, key: str, expiry: int = 3600, is_full_key: bool = False) -> Optional[str]:
+        """
+        读取页面原文，并用EXPIRE刷新过期时间
+        """
+        console_log = self.__get_logger__("read_page")
+        redis_key: str = f"{self.redis_key}:Page:Cache:{key}" if not is_full_key else key
+        try:
+            pipe = self.__client__(redis_key).pipeline(transaction=False)
+            pipe.hget(redis_key, "body")
+            self.__refresh_expiry__(pipe, redis_key, expiry)
+            body, _ = pipe.execute()
+            return None if body is None else body.decode("utf-8")
+        except Exception as e:
+            console_log.debug(e)
+            return None
+
+    def page_response(self, key: str, expiry: int = 3600, is_full_key: bool = False):
+        """
+        把缓存的页面直接作为响应返回，支持If-None-Match(304)和预压缩版本
+
+        :return: flask.Response，没有缓存时返回None
+        """
+        from flask import request, make_response
+        console_log = self.__get_logger__("page_response")
         redis_key: str = f"{self.redis_key}:Page:Cache:{key}" if not is_full_key else key
-        is_ok, text = self.cache(redis_key)
-        if not is_ok or text is None:
+        # 按Accept-Encoding的q值选择，q=0表示明确拒绝；相同时优先br
+        br_quality: float = request.accept_encodings["br"]
+        gzip_quality: float = request.accept_encodings["gzip"]
+        encoding: Optional[str] = None
+        if br_quality > 0 and br_quality >= gzip_quality:
+            encoding = "br"
+        elif gzip_quality > 0:
+            encoding = "gzip"
+        try:
+            pipe = self.__client__(redis_key).pipeline(transaction=False)
+            pipe.hmget(redis_key, ["etag", encoding or "body", "body"])
+            self.__refresh_expiry__(pipe, redis_key, expiry)
+            (etag, content, body), _ = pipe.execute()
+        except Exception as e:
+            console_log.debug(e)
             return None
-        # 刷新缓存
-        self.cache(redis_key, text, expiry)
-        return text
+        if etag is None:
+            return None
+        page_etag: str = etag.decode("utf-8")
+        if page_etag in [_e_.strip() for _e_ in request.headers.get("If-None-Match", "").split(",")]:
+            response = make_response("", 304)
+        else:
+            if content is None:
+                # 没有对应的压缩版本，例如没有安装brotli
+                content, encoding = body, None
+            response = make_response(content)
+            response.content_type = "text/html; charset=utf-8"
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = page_etag
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
 
     def pub(self, channel: str, message: Any) -> bool:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("pub")
         try:
             redis_db.publish(channel, pickle.dumps(message))
             return True
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return False
 
     def sub(self, channel: str) -> Optional[PubSub]:
-        console_log = self.__get_logger__(inspect.stack()[0].function)
+        console_log = self.__get_logger__("sub")
         try:
             pubsub = redis_db.pubsub()
             pubsub.subscribe(channel)
             return pubsub
         except Exception as e:
-            console_log.error(e)
+            self.__log_error__(console_log, e)
             return None
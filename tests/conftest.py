@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def app() -> Flask:
+    app = Flask(__name__)
+    app.config.update({"REDIS_KEY_PREFIX": "TEST", "TESTING": True})
+    return app
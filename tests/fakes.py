@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+from typing import Optional, Any, Dict, List, Tuple, Callable
+from plugins.QuickCache.Scripts import TAG_KEYS
+
+
+class FakeRedis(object):
+    """
+    测试用的进程内redis，只实现QuickCache用到的命令，值按redis的习惯保存为bytes
+    """
+
+    def __init__(self):
+        self.data: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+        self.commands: List[Tuple[str, tuple]] = []
+        # EVAL时按脚本源码找对应的python实现，没有实现的脚本只记录调用
+        self.scripts: Dict[str, Callable[["FakeRedis", tuple, tuple], Any]] = {TAG_KEYS: tag_keys}
+
+    @staticmethod
+    def __to_bytes__(value: Any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode("utf-8")
+
+    def __alive__(self, key: str) -> bool:
+        expire_at: Optional[float] = self.expires.get(key)
+        if expire_at is not None and expire_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def __log__(self, name: str, *args):
+        self.commands.append((name, args))
+
+    def get(self, key: str) -> Optional[bytes]:
+        self.__log__("get", key)
+        return self.data.get(key) if self.__alive__(key) else None
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        self.__log__("mget", *keys)
+        return [self.data.get(key) if self.__alive__(key) else None for key in keys]
+
+    def set(self, key: str, value: Any, ex: Optional[int] = None, px: Optional[int] = None, nx: bool = False):
+        self.__log__("set", key, value)
+        if nx and self.__alive__(key):
+            return None
+        self.data[key] = self.__to_bytes__(value)
+        self.expires.pop(key, None)
+        if ex:
+            self.expires[key] = time.time() + ex
+        if px:
+            self.expires[key] = time.time() + px / 1000
+        return True
+
+    def setex(self, key: str, expiry: int, value: Any):
+        return self.set(key, value, ex=expiry)
+
+    def mset(self, mapping: Dict[str, Any]):
+        for key, value in mapping.items():
+            self.set(key, value)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        self.__log__("delete", *keys)
+        count: int = 0
+        for key in [_k_.decode("utf-8") if isinstance(_k_, bytes) else _k_ for _k_ in keys]:
+            if self.__alive__(key):
+                count += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return count
+
+    def unlink(self, *keys: str) -> int:
+        return self.delete(*keys)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        self.__log__("incr", key, amount)
+        value: int = int(self.data.get(key, b"0") if self.__alive__(key) else 0) + amount
+        self.data[key] = str(value).encode("utf-8")
+        return value
+
+    def decr(self, key: str, amount: int = 1) -> int:
+        return self.incr(key, -amount)
+
+    def sadd(self, key: str, *members: Any) -> int:
+        self.__log__("sadd", key, *members)
+        if not self.__alive__(key):
+            self.data[key] = set()
+        items: set = self.data[key]
+        before: int = len(items)
+        items.update([self.__to_bytes__(member) for member in members])
+        return len(items) - before
+
+    def srem(self, key: str, *members: Any) -> int:
+        self.__log__("srem", key, *members)
+        if not self.__alive__(key):
+            return 0
+        items: set = self.data[key]
+        before: int = len(items)
+        items.difference_update([self.__to_bytes__(member) for member in members])
+        if len(items) <= 0:
+            self.delete(key)
+        return before - len(items)
+
+    def smembers(self, key: str) -> set:
+        return set(self.data.get(key, set())) if self.__alive__(key) else set()
+
+    def hmget(self, key: str, fields: List[str]) -> List[Optional[bytes]]:
+        self.__log__("hmget", key, *fields)
+        items: dict = self.data.get(key, {}) if self.__alive__(key) else {}
+        return [items.get(self.__to_bytes__(field)) for field in fields]
+
+    def exists(self, *keys: str) -> int:
+        return sum(1 for key in keys if self.__alive__(key))
+
+    def persist(self, key: str) -> bool:
+        return self.expires.pop(key, None) is not None
+
+    def ttl(self, key: str) -> int:
+        pttl: int = self.pttl(key)
+        return pttl if pttl < 0 else math.ceil(pttl / 1000)
+
+    def expire(self, key: str, seconds: int) -> bool:
+        self.__log__("expire", key, seconds)
+        if not self.__alive__(key):
+            return False
+        self.expires[key] = time.time() + seconds
+        return True
+
+    def pttl(self, key: str) -> int:
+        self.__log__("pttl", key)
+        if not self.__alive__(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return int((self.expires[key] - time.time()) * 1000)
+
+    def eval(self, script: str, numkeys: int, *keys_and_args: Any):
+        self.__log__("eval", numkeys, *keys_and_args)
+        handler = self.scripts.get(script)
+        if handler is None:
+            return None
+        return handler(self, keys_and_args[:numkeys], keys_and_args[numkeys:])
+
+    def publish(self, channel: str, message: Any) -> int:
+        self.__log__("publish", channel, message)
+        return 0
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+def tag_keys(client: FakeRedis, keys: tuple, args: tuple) -> int:
+    """
+    Scripts.TAG_KEYS
+    """
+    existed: int = client.exists(keys[0])
+    client.sadd(keys[0], *args[1:])
+    expiry: int = math.ceil(float(args[0]))
+    if expiry <= 0:
+        client.persist(keys[0])
+        return 0
+    ttl: int = client.ttl(keys[0])
+    if existed == 0 or 0 <= ttl < expiry:
+        client.expire(keys[0], expiry)
+    return 1
+
+
+class FakePipeline(object):
+    """
+    按顺序记录命令，execute时依次执行
+    """
+
+    def __init__(self, client: FakeRedis):
+        self._client = client
+        self._queue: List[Tuple[str, tuple, dict]] = []
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self._queue.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self, raise_on_error: bool = True) -> List[Any]:
+        queue, self._queue = self._queue, []
+        return [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in queue]
+
+
+class FakeAsyncRedis(object):
+    """
+    redis.asyncio风格的包装，命令都是协程
+    """
+
+    def __init__(self, client: Optional[FakeRedis] = None):
+        self.sync = client or FakeRedis()
+
+    def __getattr__(self, name: str):
+        command = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return command(*args, **kwargs)
+        return call
+
+    def pipeline(self, transaction: bool = True) -> "FakeAsyncPipeline":
+        return FakeAsyncPipeline(self.sync)
+
+
+class FakeAsyncPipeline(FakePipeline):
+
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        return FakePipeline.execute(self, raise_on_error)
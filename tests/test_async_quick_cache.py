@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import pytest
+from plugins.QuickCache import AsyncQuickCache as module
+from plugins.QuickCache.AsyncQuickCache import AsyncQuickCache
+from tests.fakes import FakeAsyncRedis
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeAsyncRedis:
+    client = FakeAsyncRedis()
+    monkeypatch.setattr(module, "get_async_redis", lambda config, shard=None: client)
+    return client
+
+
+def test_cache_write_and_read(app, client):
+    cache = AsyncQuickCache(app)
+
+    async def run():
+        assert await cache.cache("article:1", {"title": "hello"}, expiry=60, tags=["article"]) == \
+            (True, {"title": "hello"})
+        return await cache.cache("article:1")
+
+    assert asyncio.run(run()) == (True, {"title": "hello"})
+    assert b"TEST:Cache:article:1" in client.sync.smembers("TEST:Tag:article")
+    assert 59 <= client.sync.ttl("TEST:Tag:article") <= 60
+
+
+def test_set_many_with_tags(app, client):
+    cache = AsyncQuickCache(app)
+
+    async def run():
+        assert await cache.set_many({"a": 1, "b": 2}, expiry=60, tags=["letters"])
+        return await cache.cache_many(["a", "b", "c"])
+
+    assert asyncio.run(run()) == (True, {"a": 1, "b": 2, "c": None})
+    assert client.sync.smembers("TEST:Tag:letters") == {b"TEST:Cache:a", b"TEST:Cache:b"}
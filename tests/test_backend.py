@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import time
+import pytest
+import plugins.QuickCache as quick_cache
+import plugins.QuickCache.Backend as module
+from plugins.QuickCache import QuickCache
+from plugins.QuickCache.Backend import ShmBackend, OVERFLOW_MARKER
+from tests.fakes import FakeRedis
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def backend(tmp_path) -> ShmBackend:
+    # 只有一个桶、两个槽，方便验证淘汰顺序
+    return ShmBackend(str(tmp_path / "cache.shm"), buckets=1, ways=2, slot_size=256, stripes=1)
+
+
+def test_set_and_get(backend):
+    assert backend.get("a") is None
+    assert backend.set("a", b"1")
+    assert backend.get("a") == b"1"
+    assert backend.set("a", b"22")
+    assert backend.get("a") == b"22"
+    assert backend.delete("a", "missing") == 1
+    assert backend.get("a") is None
+
+
+def test_expiry(backend, clock):
+    assert backend.set("a", b"1", expiry=10)
+    clock.now += 9
+    assert backend.get("a") == b"1"
+    clock.now += 2
+    assert backend.get("a") is None
+
+
+def test_eviction_prefers_earliest_expiry(backend):
+    assert backend.set("short", b"1", expiry=10)
+    assert backend.set("forever", b"2")
+    assert backend.set("long", b"3", expiry=100)
+    assert backend.get("short") is None
+    assert backend.get("forever") == b"2"
+    assert backend.set("longer", b"4", expiry=1000)
+    assert backend.get("long") is None
+    assert backend.get("forever") == b"2"
+
+
+def test_value_too_large_drops_old_value(backend):
+    assert backend.set("a", b"1")
+    assert not backend.set("a", b"x" * 256)
+    assert backend.get("a") is None
+
+
+def test_keys_and_delete_pattern(backend):
+    backend.set("TEST:Cache:a", b"1")
+    backend.set("TEST:Other:b", b"2")
+    assert backend.keys("TEST:Cache:*") == ["TEST:Cache:a"]
+    assert backend.delete_pattern("TEST:*") == 2
+    assert backend.keys("*") == []
+
+
+def test_layout_comes_from_existing_file(tmp_path):
+    path: str = str(tmp_path / "cache.shm")
+    ShmBackend(path, buckets=2, ways=2, slot_size=128).set("a", b"1")
+    reopened = ShmBackend(path, buckets=64, ways=8, slot_size=4096)
+    assert (reopened.buckets, reopened.ways, reopened.slot_size) == (2, 2, 128)
+    assert reopened.get("a") == b"1"
+
+
+def test_overflow_goes_to_redis(app, backend, monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(quick_cache, "redis_db", client)
+    monkeypatch.setattr(module, "__backend__", backend)
+    app.config["QUICK_CACHE_BACKEND"] = "shm"
+    cache = QuickCache(app)
+    large: str = "x" * 1024
+    assert cache.cache("big", large, expiry=60) == (True, large)
+    assert backend.get("TEST:Cache:big") == OVERFLOW_MARKER
+    assert client.get("TEST:Cache:big") is not None
+    assert cache.cache("big") == (True, large)
+    # 变小之后回到本机，redis里的旧值一并删除
+    assert cache.cache("big", "small", expiry=60) == (True, "small")
+    assert client.get("TEST:Cache:big") is None
+    assert cache.cache("big") == (True, "small")
+    cache.cache("big", large, expiry=60)
+    cache.remove_cache("big")
+    assert client.get("TEST:Cache:big") is None
+    assert backend.get("TEST:Cache:big") is None
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import math
+import pytest
+from types import SimpleNamespace
+from plugins.QuickCache.BloomFilter import BloomFilter, bloom_size, MAX_BITS
+
+
+@pytest.mark.parametrize("capacity, error_rate, bits, hashes", [
+    (1000000, 0.01, 9585059, 7),
+    (1000, 0.001, 14378, 10),
+    (100, 0.5, 145, 1),
+])
+def test_bloom_size(capacity, error_rate, bits, hashes):
+    assert bloom_size(capacity, error_rate) == (bits, hashes)
+
+
+def test_bloom_size_bounds():
+    assert bloom_size(1, 0.9)[0] == 8
+    assert bloom_size(10 ** 10, 0.0001)[0] == MAX_BITS
+    assert bloom_size(1, 0.9)[1] >= 1
+
+
+def test_bits_per_item_matches_formula():
+    bits, _ = bloom_size(10000, 0.01)
+    # 约 1.44 * log2(1/p) 位每个元素
+    assert bits / 10000 == pytest.approx(1.44 * math.log2(100), rel=0.01)
+
+
+def test_false_positive_rate():
+    capacity, error_rate = 10000, 0.01
+    bits, hashes = bloom_size(capacity, error_rate)
+    bloom = SimpleNamespace(bits=bits, hashes=hashes)
+    bitmap = bytearray(bits // 8 + 1)
+    for i in range(capacity):
+        for pos in BloomFilter.__positions__(bloom, f"member:{i}"):
+            bitmap[pos >> 3] |= 0x80 >> (pos & 7)
+
+    def contains(item: str) -> bool:
+        return all(bitmap[pos >> 3] & (0x80 >> (pos & 7)) for pos in BloomFilter.__positions__(bloom, item))
+    assert all(contains(f"member:{i}") for i in range(capacity))
+    false_positives: int = sum(1 for i in range(20000) if contains(f"other:{i}"))
+    assert false_positives / 20000 < error_rate * 2
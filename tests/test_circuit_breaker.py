@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+import pytest
+import mio.util.CircuitBreaker as module
+from mio.util.CircuitBreaker import (
+    CircuitBreaker, CircuitOpenError, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN, get_breaker
+)
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = time.monotonic()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(module, "time", clock)
+    return clock
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.min_calls):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_closed_open_half_open_closed(clock):
+    breaker = CircuitBreaker("test", min_calls=4, error_rate=0.5, open_seconds=5, half_open_calls=2)
+    assert breaker.state == STATE_CLOSED
+    open_breaker(breaker)
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 1)
+    clock.now += 5
+    assert breaker.call(lambda: 1) == 1
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.call(lambda: 2) == 2
+    assert breaker.state == STATE_CLOSED
+    assert breaker.stats()["opened_count"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker("test", min_calls=2, open_seconds=5, half_open_calls=2)
+    open_breaker(breaker)
+    clock.now += 5
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == STATE_OPEN
+    assert breaker.opened_count == 2
+
+
+def test_half_open_limits_probes(clock):
+    breaker = CircuitBreaker("test", min_calls=2, open_seconds=5, half_open_calls=1)
+    open_breaker(breaker)
+    clock.now += 5
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_min_calls_and_window(clock):
+    breaker = CircuitBreaker("test", window=10, min_calls=3, error_rate=0.5)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == STATE_CLOSED
+    # 新窗口重新计数
+    clock.now += 10
+    breaker.call(lambda: 1)
+    breaker.call(lambda: 1)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == STATE_CLOSED
+
+
+def test_slow_calls_open(clock):
+    breaker = CircuitBreaker("test", min_calls=2, slow_ms=100, slow_rate=0.5)
+    breaker.record(150)
+    breaker.record(150)
+    assert breaker.state == STATE_OPEN
+
+
+def test_other_exceptions_count_as_success(clock):
+    breaker = CircuitBreaker("test", min_calls=2, error_types=(ConnectionError,))
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            breaker.call(lambda: {}["missing"])
+    assert breaker.state == STATE_CLOSED
+
+
+def test_call_async(clock):
+    breaker = CircuitBreaker("test", min_calls=1)
+
+    async def failing():
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(breaker.call_async(failing))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(breaker.call_async(failing))
+
+
+def test_get_breaker_reads_config(monkeypatch):
+    monkeypatch.setattr(module, "__breakers__", {})
+    breaker = get_breaker("cache", {"CACHE_BREAKER_MIN_CALLS": "7", "CACHE_BREAKER_ERROR_RATE": "0.25"})
+    assert (breaker.min_calls, breaker.error_rate) == (7, 0.25)
+    assert get_breaker("cache") is breaker
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import pytest
+import plugins.QuickCache as module
+from plugins.QuickCache import QuickCache
+from plugins.QuickCache.Coalesce import WriteBuffer, get_write_buffer
+from tests.fakes import FakeRedis
+
+
+def test_buffer_keeps_order():
+    buffer = WriteBuffer(owner=None)
+    buffer.set("a", b"1", 60, ["t"])
+    buffer.delete("a", "b")
+    buffer.set("b", b"2")
+    assert buffer.ops == [
+        ("set", "a", b"1", 60, ["t"]), ("delete", "a"), ("delete", "b"), ("set", "b", b"2", 0, None)]
+    assert buffer.get("a") == (True, None)
+    assert buffer.get("b") == (True, b"2")
+    assert buffer.get("c") == (False, None)
+
+
+def test_no_buffer_outside_request():
+    assert get_write_buffer(owner=None) is None
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeRedis:
+    client = FakeRedis()
+    monkeypatch.setattr(module, "redis_db", client)
+    return client
+
+
+@pytest.fixture
+def cache(app, client) -> QuickCache:
+    app.config["QUICK_CACHE_REQUEST_COALESCE"] = True
+    return QuickCache(app)
+
+
+def test_request_writes_are_flushed_in_order(app, cache, client):
+    client.set("TEST:Cache:old", b"stale")
+    sent: int = len(client.commands)
+    with app.test_request_context():
+        assert cache.cache("a", 1, expiry=60) == (True, 1)
+        assert cache.cache("a", 2, expiry=60) == (True, 2)
+        cache.remove_cache("old")
+        assert len(client.commands) == sent
+        # 缓冲中的值在同一请求内可以直接读到，删除过的key读到的是未命中
+        assert cache.cache("a") == (True, 2)
+        assert cache.cache("old") == (True, None)
+        assert cache.flush()
+    writes = [(name, args[0]) for name, args in client.commands if name in ("set", "delete")]
+    assert writes[1:] == [("set", "TEST:Cache:a"), ("set", "TEST:Cache:a"), ("delete", "TEST:Cache:old")]
+    assert client.get("TEST:Cache:old") is None
+    assert cache.cache("a") == (True, 2)
+
+
+def test_buffer_flushed_at_teardown(app, cache, client):
+    with app.test_request_context():
+        cache.cache("a", 1)
+        assert client.get("TEST:Cache:a") is None
+        app.do_teardown_request()
+    assert cache.cache("a") == (True, 1)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import pickle
+import pytest
+from plugins.QuickCache.Codec import (
+    encode, decode, parse_codec, HEADER_PICKLE, CODEC_ORJSON, CODEC_MSGPACK, COMPRESS_ZSTD, COMPRESS_LZ4
+)
+
+VALUE = {"id": 1, "name": "mio", "tags": ["a", "b"]}
+
+
+def test_pickle_has_no_extra_header():
+    data: bytes = encode(VALUE)
+    assert data[0] == HEADER_PICKLE
+    assert data == pickle.dumps(VALUE)
+    assert decode(data) == VALUE
+
+
+@pytest.mark.parametrize("protocol", [2, 4, pickle.HIGHEST_PROTOCOL])
+def test_decode_legacy_pickle(protocol):
+    assert decode(pickle.dumps(VALUE, protocol=protocol)) == VALUE
+
+
+@pytest.mark.parametrize("spec, module, header", [
+    ("orjson", "orjson", CODEC_ORJSON),
+    ("msgpack", "msgpack", CODEC_MSGPACK),
+])
+def test_round_trip_with_header(spec, module, header):
+    pytest.importorskip(module)
+    data: bytes = encode(VALUE, spec)
+    assert data[0] == header
+    assert decode(data) == VALUE
+
+
+@pytest.mark.parametrize("spec, module, header", [
+    ("pickle+zstd", "zstandard", COMPRESS_ZSTD),
+    ("pickle+lz4", "lz4", COMPRESS_LZ4),
+])
+def test_compress_only_above_threshold(spec, module, header):
+    pytest.importorskip(module)
+    large: dict = {"body": "x" * 4096}
+    data: bytes = encode(large, spec, threshold=1024)
+    assert data[0] & header
+    assert len(data) < 4096
+    assert decode(data) == large
+    assert encode(VALUE, spec, threshold=1024)[0] == HEADER_PICKLE
+
+
+def test_parse_codec():
+    assert parse_codec(None) == parse_codec("pickle")
+    assert parse_codec(" ORJSON+ZSTD ") == (CODEC_ORJSON, COMPRESS_ZSTD)
+    with pytest.raises(ValueError):
+        parse_codec("yaml")
+    with pytest.raises(ValueError):
+        parse_codec("pickle+bz2")
+
+
+def test_decode_unknown_header():
+    with pytest.raises(ValueError):
+        decode(bytes([0x0F]) + b"payload")
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import pytest
+import plugins.QuickCache.FlaskCachingHelper as module
+from plugins.QuickCache.FlaskCachingHelper import FlaskCachingHelper
+from tests.fakes import FakeRedis
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeRedis:
+    client = FakeRedis()
+    monkeypatch.setattr(module, "redis_db", client)
+    return client
+
+
+def test_index_key_ignores_view_arg_types():
+    helper = FlaskCachingHelper()
+    assert helper.__index_key__("main.item", {"id": 1}) == helper.__index_key__("main.item", {"id": "1"})
+    assert helper.__index_key__("main.item", {"id": 1}) != helper.__index_key__("main.item", {"id": 2})
+    assert helper.__index_key__("main.item") == "flask_cache___index__:main.item"
+
+
+def test_invalidate_endpoint(client):
+    helper = FlaskCachingHelper()
+    index_key: str = helper.__index_key__("main.item", {"id": 1})
+    client.set("flask_cache_/item/1", b"page")
+    client.sadd(index_key, "flask_cache_/item/1")
+    assert helper.invalidate_endpoint("main.item", id="1") == 1
+    assert client.get("flask_cache_/item/1") is None
+    assert client.smembers(index_key) == set()
+    assert helper.invalidate_endpoint("main.item", id="1") == 0
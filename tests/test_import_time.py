@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from mio.util.ImportTime import parse_import_time, import_time_report
+
+OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:        45 |        165 | io
+import time:      1500 |       2400 |     flask.json
+import time:     10000 |      12000 | flask
+some other warning
+import time: bad | line | ignored
+"""
+
+
+def test_parse_import_time():
+    rows = parse_import_time(OUTPUT)
+    assert [row["name"] for row in rows] == ["_io", "io", "flask.json", "flask"]
+    assert rows[0] == {"name": "_io", "self_ms": 0.12, "cumulative_ms": 0.12, "depth": 1}
+    assert rows[1]["depth"] == 0
+    assert rows[2]["depth"] == 2
+    assert rows[3]["cumulative_ms"] == 12.0
+
+
+def test_parse_import_time_empty():
+    assert parse_import_time("") == []
+
+
+def test_import_time_report():
+    report = import_time_report("json", top=3)
+    assert report["returncode"] == 0
+    assert report["modules"] > 0
+    assert len(report["top_self"]) == len(report["packages"]) == 3
+    assert report["total_ms"] > 0
+    assert "json" in import_time_report("json", top=report["modules"])["packages"]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import signal
+import pytest
+from mongoengine import connection
+import mio.sys.Prefork as module
+import mio.sys.flask_mongoengine.connection as mongo_connection
+from mio.sys.Prefork import PreforkMaster, WorkerInfo, WorkerSlots, reconnect_mongodb
+
+
+class FakeMongoClient(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeMongoEngine(object):
+    config = {"MONGODB_SETTINGS": {"alias": "prefork-test"}}
+
+
+def test_reconnect_mongodb_does_not_close_inherited_client(app, monkeypatch):
+    inherited = FakeMongoClient()
+    fresh = FakeMongoClient()
+    monkeypatch.setitem(connection._connections, "prefork-test", inherited)
+    monkeypatch.setitem(connection._connection_settings, "prefork-test", {"host": "mongodb://localhost"})
+
+    def create_connections(config: dict) -> dict:
+        connection._connections["prefork-test"] = fresh
+        return {"prefork-test": fresh}
+    monkeypatch.setattr(mongo_connection, "create_connections", create_connections)
+    instance = FakeMongoEngine()
+    app.extensions["mongoengine"] = {instance: {"conn": {"prefork-test": inherited}}}
+    reconnect_mongodb(app)
+    assert not inherited.closed
+    assert app.extensions["mongoengine"][instance]["conn"] == {"prefork-test": fresh}
+    assert connection._connections.pop("prefork-test") is fresh
+    assert "prefork-test" not in connection._connection_settings
+
+
+@pytest.fixture
+def master(app, monkeypatch) -> PreforkMaster:
+    master = PreforkMaster(app, 2, target=lambda: None, max_requests=100, jitter=0.1, graceful_timeout=30)
+    pids = iter(range(1000, 2000))
+    master.killed = []
+    monkeypatch.setattr(module.os, "fork", lambda: next(pids))
+    monkeypatch.setattr(master, "__kill__", lambda pid, sig: master.killed.append((pid, sig)))
+    return master
+
+
+def test_worker_slots():
+    slots = WorkerSlots(2)
+    slots.beat(1)
+    slots.add_request(1)
+    slots.add_request(1)
+    heartbeat, requests = slots.read(1)
+    assert heartbeat > 0 and requests == 2
+    assert slots.read(0) == (0.0, 0)
+    slots.reset(1)
+    assert slots.read(1) == (0.0, 0)
+
+
+def test_free_slot(master):
+    assert master.slots.count == 4
+    for pid, slot in [(1, 0), (2, 1), (3, 3)]:
+        master.children[pid] = WorkerInfo(pid, slot, 0, 0)
+    assert master.__free_slot__() == 2
+    master.children[4] = WorkerInfo(4, 2, 0, 0)
+    assert master.__free_slot__() is None
+    assert master.spawn() is None
+
+
+def test_spawn_uses_free_slot_and_jitter(master):
+    assert master.spawn() == 1000
+    assert master.spawn() == 1001
+    assert sorted(info.slot for info in master.children.values()) == [0, 1]
+    assert all(100 <= info.max_requests <= 110 for info in master.children.values())
+
+
+def test_retire_postponed_without_free_slot(master):
+    for pid, slot in enumerate(range(master.slots.count)):
+        master.children[pid] = WorkerInfo(pid, slot, 100, 0)
+    info: WorkerInfo = master.children[0]
+    assert not master.retire(info, "test")
+    assert info.deadline is None
+    assert master.killed == []
+
+
+def test_retire_replaces_then_drains(master):
+    master.spawn()
+    info: WorkerInfo = master.children[1000]
+    assert master.retire(info, "test")
+    assert 1001 in master.children
+    assert info.deadline is not None
+    assert master.killed == [(1000, signal.SIGTERM)]
+
+
+def test_check_recycles_busy_worker(master):
+    master.spawn()
+    master.spawn()
+    info: WorkerInfo = master.children[1000]
+    for _ in range(info.max_requests):
+        master.slots.add_request(info.slot)
+    master.__check__()
+    assert master.killed == [(1000, signal.SIGTERM)]
+    assert len([child for child in master.children.values() if child.deadline is None]) == 2
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import time
+import pickle
+import pytest
+import plugins.QuickCache as module
+from plugins.QuickCache import QuickCache
+from plugins.QuickCache.NearCache import NearCache
+from tests.fakes import FakeRedis
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeRedis:
+    client = FakeRedis()
+    monkeypatch.setattr(module, "redis_db", client)
+    return client
+
+
+@pytest.fixture
+def cache(app, client) -> QuickCache:
+    cache = QuickCache(app)
+    cache.near_cache = NearCache(ttl=60)
+    return cache
+
+
+def near_ttl(cache: QuickCache, redis_key: str) -> float:
+    return cache.near_cache._items[redis_key][0] - time.monotonic()
+
+
+def test_near_cache_never_outlives_redis_expiry(cache, client):
+    client.set("TEST:Cache:short", pickle.dumps("v"), px=300)
+    client.set("TEST:Cache:forever", pickle.dumps("w"))
+    assert cache.cache("short") == (True, "v")
+    assert cache.cache("forever") == (True, "w")
+    assert 0 < near_ttl(cache, "TEST:Cache:short") <= 0.3
+    assert near_ttl(cache, "TEST:Cache:forever") > 59
+
+
+def test_near_cache_many_uses_pttl(cache, client):
+    client.set("TEST:Cache:a", pickle.dumps(1), px=500)
+    client.set("TEST:Cache:b", pickle.dumps(2))
+    assert cache.cache_many(["a", "b", "c"]) == (True, {"a": 1, "b": 2, "c": None})
+    assert 0 < near_ttl(cache, "TEST:Cache:a") <= 0.5
+    assert near_ttl(cache, "TEST:Cache:b") > 59
+    assert "TEST:Cache:c" not in cache.near_cache._items
+
+
+def test_tag_set_expires_with_longest_member(cache, client):
+    assert cache.cache("a", 1, expiry=60, tags=["t"]) == (True, 1)
+    assert 59 <= client.ttl("TEST:Tag:t") <= 60
+    assert cache.set_many({"b": 2}, expiry=10, tags=["t"])
+    assert 59 <= client.ttl("TEST:Tag:t") <= 60
+    assert cache.cache("c", 3, expiry=120, tags=["t"]) == (True, 3)
+    assert 119 <= client.ttl("TEST:Tag:t") <= 120
+    assert client.smembers("TEST:Tag:t") == {b"TEST:Cache:a", b"TEST:Cache:b", b"TEST:Cache:c"}
+
+
+def test_tag_set_without_expiry_is_kept(cache, client):
+    assert cache.cache("a", 1, expiry=60, tags=["t"]) == (True, 1)
+    assert cache.cache("b", 2, tags=["t"]) == (True, 2)
+    assert client.ttl("TEST:Tag:t") == -1
+    assert cache.cache("c", 3, expiry=10, tags=["t"]) == (True, 3)
+    assert client.ttl("TEST:Tag:t") == -1
+
+
+@pytest.mark.parametrize("accept_encoding, encoding", [
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("gzip;q=0, *", "br"),
+    ("br;q=0, gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_page_response_negotiates_encoding(app, cache, client, accept_encoding, encoding):
+    client.data["TEST:Page:Cache:home"] = {
+        b"etag": b'W/"1"', b"body": b"<p>", b"gzip": b"gzip-body", b"br": b"br-body"}
+    with app.test_request_context(headers={"Accept-Encoding": accept_encoding}):
+        response = cache.page_response("home", expiry=0)
+    assert response.headers.get("Content-Encoding") == encoding
+    assert response.get_data() == {"br": b"br-body", "gzip": b"gzip-body", None: b"<p>"}[encoding]
+    assert response.headers["Vary"] == "Accept-Encoding"
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import pytest
+import plugins.QuickCache as module
+from plugins.QuickCache import QuickCache
+from plugins.QuickCache.AsyncQuickCache import AsyncQuickCache
+from plugins.QuickCache.RateLimit import rate_limit
+from tests.fakes import FakeRedis
+
+
+@pytest.mark.parametrize("capacity, rate", [(0, 1), (-1, 1), (10, 0), (10, -0.5)])
+def test_rate_limit_rejects_invalid_bucket(capacity, rate):
+    with pytest.raises(ValueError):
+        rate_limit(capacity=capacity, rate=rate)
+
+
+@pytest.mark.parametrize("capacity, rate", [(0, 1), (10, 0)])
+def test_take_token_rejects_invalid_bucket(app, monkeypatch, capacity, rate):
+    monkeypatch.setattr(module, "redis_db", FakeRedis())
+    with pytest.raises(ValueError):
+        QuickCache(app).take_token("api", capacity, rate)
+    with pytest.raises(ValueError):
+        asyncio.run(AsyncQuickCache(app).take_token("api", capacity, rate))
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import pytest
+from plugins.QuickCache.Shard import HashRing, ShardRouter, hash_tag
+
+NODES = ["redis://a:6379/0", "redis://b:6379/0", "redis://c:6379/0"]
+
+
+@pytest.mark.parametrize("key, tag", [
+    ("user:{42}:profile", "42"),
+    ("{user:42}:a", "user:42"),
+    ("a{b}c{d}", "b"),
+    ("no-tag", "no-tag"),
+    ("empty:{}:tag", "empty:{}:tag"),
+    ("open:{only", "open:{only"),
+    ("}{x}", "x"),
+])
+def test_hash_tag(key, tag):
+    assert hash_tag(key) == tag
+
+
+def test_ring_is_deterministic():
+    first, second = HashRing(NODES), HashRing(NODES)
+    assert all(first.node_for(f"key:{i}") == second.node_for(f"key:{i}") for i in range(1000))
+
+
+def test_ring_spreads_keys():
+    ring = HashRing(NODES)
+    counts = [0] * len(NODES)
+    for i in range(6000):
+        counts[ring.node_for(f"key:{i}")] += 1
+    assert min(counts) > 6000 / len(NODES) * 0.7
+
+
+def test_adding_node_moves_about_one_nth():
+    keys = [f"key:{i}" for i in range(6000)]
+    old = HashRing(NODES)
+    new = HashRing(NODES + ["redis://d:6379/0"])
+    moved = [key for key in keys if old.nodes[old.node_for(key)] != new.nodes[new.node_for(key)]]
+    assert len(moved) < len(keys) * 0.4
+    # 迁移的key都去了新节点
+    assert all(new.node_for(key) == 3 for key in moved)
+
+
+def test_hash_tag_keeps_keys_together():
+    ring = HashRing(NODES)
+    assert len({ring.node_for(f"order:{{user:7}}:{i}") for i in range(100)}) == 1
+
+
+def test_router_group_keeps_order():
+    clients = [object(), object(), object()]
+    router = ShardRouter(NODES, clients)
+    keys = [f"key:{i}" for i in range(50)]
+    groups = router.group(keys)
+    assert sorted(key for _, group in groups for key in group) == sorted(keys)
+    for client, group in groups:
+        assert all(router.client_for(key) is client for key in group)
+        assert group == [key for key in keys if key in group]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pickle
+import pytest
+import plugins.QuickCache.StreamQueue as module
+from plugins.QuickCache.StreamQueue import StreamQueue
+
+
+class FakeStreamRedis(object):
+    """
+    按顺序返回预设的XAUTOCLAIM结果，并记录每次的start_id
+    """
+
+    def __init__(self, responses: list):
+        self.responses = responses
+        self.start_ids: list = []
+
+    def xgroup_create(self, *args, **kwargs):
+        return True
+
+    def xautoclaim(self, name, group, consumer, min_idle_time, start_id="0-0", count=None):
+        self.start_ids.append(start_id)
+        return self.responses.pop(0)
+
+
+def entry(entry_id: bytes, value) -> tuple:
+    return entry_id, {b"d": pickle.dumps(value)}
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeStreamRedis:
+    client = FakeStreamRedis([
+        [b"5-0", [entry(b"1-0", "a")], []],
+        [b"0-0", [entry(b"7-0", "b")], []],
+        [b"0-0", [], []],
+    ])
+    monkeypatch.setattr(module, "redis_db", client)
+    return client
+
+
+def test_reclaim_resumes_from_cursor(app, client):
+    queue = StreamQueue("jobs", consumer="worker", current_app=app)
+    assert queue.reclaim(count=1) == [("1-0", "a")]
+    assert queue.reclaim(count=1) == [("7-0", "b")]
+    assert queue.reclaim(count=1) == []
+    assert client.start_ids == ["0-0", "5-0", "0-0"]
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import pytest
+from typing import List, Tuple, Callable, Any
+from werkzeug.exceptions import RequestEntityTooLarge, ClientDisconnected
+from mio.sys.WsgiBridge import WsgiBridge, BodyReader, match_prefix, get_content_length
+
+
+def scope_for(path: str, chunks: List[bytes], content_length: bool = True) -> dict:
+    headers: list = [(b"content-length", str(sum(map(len, chunks))).encode())] if content_length else []
+    return {
+        "type": "http", "method": "POST", "path": path, "query_string": b"", "http_version": "1.1",
+        "headers": headers, "client": ("127.0.0.1", 5000), "server": ("localhost", 80),
+    }
+
+
+def receiver(chunks: List[bytes], disconnect: bool = False) -> Callable:
+    chunks = chunks or [b""]
+    messages: List[dict] = [
+        {"type": "http.request", "body": chunk, "more_body": disconnect or i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    if disconnect:
+        messages.append({"type": "http.disconnect"})
+
+    async def receive() -> dict:
+        return messages.pop(0)
+    return receive
+
+
+async def request(
+        bridge: WsgiBridge, path: str, chunks: List[bytes], content_length: bool = True
+) -> Tuple[int, dict, bytes]:
+    sent: List[dict] = []
+
+    async def send(message: dict):
+        sent.append(message)
+    await bridge(scope_for(path, chunks, content_length), receiver(chunks), send)
+    headers: dict = {name: value for name, value in sent[0]["headers"]}
+    return sent[0]["status"], headers, b"".join(message.get("body", b"") for message in sent[1:])
+
+
+def echo(environ: dict, start_response) -> List[bytes]:
+    body: Any = environ["wsgi.input"]
+    start_response("200 OK", [("X-Input", type(body).__name__)])
+    return [body.read()]
+
+
+@pytest.mark.parametrize("path, prefix, matched", [
+    ("/export", "/export", True),
+    ("/export/1", "/export", True),
+    ("/export/1", "/export/", True),
+    ("/exports", "/export", False),
+    ("/exp", "/export", False),
+    ("/anything", "/", True),
+])
+def test_match_prefix(path, prefix, matched):
+    assert match_prefix(path, prefix) is matched
+
+
+def test_route_limit_matches_by_segment():
+    bridge = WsgiBridge(echo, threads=1, route_limits={"/export": 1, "/export/big": 1})
+    bridge.__prepare__()
+    assert bridge.__route_slot__("/export/big/1") is bridge._route_slots["/export/big"]
+    assert bridge.__route_slot__("/export/1") is bridge._route_slots["/export"]
+    assert bridge.__route_slot__("/exports") is None
+
+
+def test_get_content_length():
+    assert get_content_length(scope_for("/", [b"abc"])) == 3
+    assert get_content_length(scope_for("/", [b"abc"], content_length=False)) == 0
+
+
+def test_small_body_stays_in_memory():
+    bridge = WsgiBridge(echo, threads=1, spool_threshold=8)
+    assert asyncio.run(request(bridge, "/", [b"abc", b"def"])) == (200, {b"x-input": b"BytesIO"}, b"abcdef")
+
+
+def test_large_body_is_spooled():
+    bridge = WsgiBridge(echo, threads=1, spool_threshold=8)
+    status, headers, body = asyncio.run(request(bridge, "/", [b"a" * 6, b"b" * 6, b"c" * 6]))
+    assert status == 200
+    assert headers[b"x-input"] != b"BytesIO"
+    assert body == b"a" * 6 + b"b" * 6 + b"c" * 6
+
+
+def test_413_by_content_length():
+    called: List[bool] = []
+
+    def app(environ, start_response):
+        called.append(True)
+        return echo(environ, start_response)
+    bridge = WsgiBridge(app, threads=1, max_body_size=10)
+    status, _, _ = asyncio.run(request(bridge, "/", [b"a" * 11]))
+    assert status == 413
+    assert called == []
+
+
+def test_413_without_content_length():
+    bridge = WsgiBridge(echo, threads=1, max_body_size=10)
+    status, _, _ = asyncio.run(request(bridge, "/", [b"a" * 6, b"a" * 6], content_length=False))
+    assert status == 413
+
+
+def test_503_with_retry_after_when_queue_times_out():
+    release = threading.Event()
+
+    def slow(environ, start_response):
+        release.wait(5)
+        start_response("200 OK", [])
+        return [b"done"]
+    bridge = WsgiBridge(slow, threads=1, queue_timeout=0.05, retry_after=7)
+
+    async def run():
+        first = asyncio.ensure_future(request(bridge, "/", []))
+        await asyncio.sleep(0.05)
+        rejected = await request(bridge, "/", [])
+        release.set()
+        return await first, rejected
+
+    (status, _, body), (rejected_status, rejected_headers, _) = asyncio.run(run())
+    assert (status, body) == (200, b"done")
+    assert rejected_status == 503
+    assert rejected_headers[b"retry-after"] == b"7"
+    assert bridge.shed == 1
+
+
+def test_503_when_queue_is_full():
+    release = threading.Event()
+
+    def slow(environ, start_response):
+        release.wait(5)
+        start_response("200 OK", [])
+        return [b"done"]
+    bridge = WsgiBridge(slow, threads=1, queue_size=1)
+
+    async def run():
+        running = asyncio.ensure_future(request(bridge, "/", []))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(request(bridge, "/", []))
+        await asyncio.sleep(0.05)
+        rejected = await request(bridge, "/", [])
+        release.set()
+        return [await running, await waiting, rejected]
+
+    assert [result[0] for result in asyncio.run(run())] == [200, 200, 503]
+
+
+def read_in_thread(reader_args: Tuple[List[bytes], int, bool], read: Callable[[BodyReader], Any]) -> Any:
+    chunks, max_body_size, disconnect = reader_args
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        reader = BodyReader(receiver(chunks, disconnect), loop, max_body_size)
+        return await loop.run_in_executor(None, read, reader)
+    return asyncio.run(run())
+
+
+def test_body_reader_readline():
+    def read(reader: BodyReader) -> list:
+        return [reader.readline(), reader.readline(3), reader.readline(), reader.readline(), reader.readline()]
+    assert read_in_thread(([b"line1\nli", b"ne2\n", b"tail"], 0, False), read) == \
+        [b"line1\n", b"lin", b"e2\n", b"tail", b""]
+
+
+def test_body_reader_read_and_iter():
+    assert read_in_thread(([b"ab", b"cd", b"ef"], 0, False), lambda reader: (reader.read(3), reader.read())) == \
+        (b"abc", b"def")
+    assert read_in_thread(([b"a\nb", b"\nc"], 0, False), lambda reader: list(reader)) == [b"a\n", b"b\n", b"c"]
+    assert read_in_thread(([b"ab", b"", b"cd"], 0, False), lambda reader: list(reader.iter_chunks())) == \
+        [b"ab", b"cd"]
+
+
+def test_body_reader_limit():
+    with pytest.raises(RequestEntityTooLarge):
+        read_in_thread(([b"a" * 6, b"a" * 6], 10, False), lambda reader: reader.read())
+    assert read_in_thread(([b"a" * 5, b"a" * 5], 10, False), lambda reader: reader.read()) == b"a" * 10
+
+
+def test_body_reader_disconnect():
+    with pytest.raises(ClientDisconnected):
+        read_in_thread(([b"abc"], 0, True), lambda reader: reader.read())
+
+
+def test_streamed_route_gets_body_reader():
+    def app(environ, start_response):
+        body: Any = environ["wsgi.input"]
+        start_response("200 OK", [])
+        return [type(body).__name__.encode(), b":", b"|".join(body.iter_chunks())]
+    bridge = WsgiBridge(app, threads=1, stream_prefixes=["/upload"])
+    assert asyncio.run(request(bridge, "/upload/1", [b"ab", b"cd"]))[2] == b"BodyReader:ab|cd"